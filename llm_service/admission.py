@@ -0,0 +1,123 @@
+"""
+Admission control in front of Ollama.
+
+At most OLLAMA_MAX_CONCURRENT generations run at once. Further requests wait in a priority queue
+where interactive requests always go ahead of background (precompute) ones. Requests are turned
+away rather than left to pile up:
+  - 429 when the queue is full. Background requests may only use half of OLLAMA_MAX_QUEUE, so
+    there is always room for interactive ones.
+  - 503 when a request has waited longer than its priority's queue budget.
+Both carry a Retry-After estimated from the queue depth and the recent generation time.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+from fastapi import HTTPException
+
+from .config import settings
+from .logger import logger
+
+PRIORITIES = {"interactive": 0, "background": 1}
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeouts: Dict[str, float]):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeouts = queue_timeouts
+        self._active = 0
+        self._waiters: list = []  # heap of (priority rank, arrival, future)
+        self._arrivals = itertools.count()
+        self.avg_generation_seconds: float | None = None
+        self.stats = {"admitted": 0, "rejected": 0, "timed_out": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def queued(self, priority: str | None = None) -> int:
+        rank = PRIORITIES.get(priority)
+        return sum(1 for r, _, future in self._waiters if not future.done() and (rank is None or r == rank))
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free, from the queue depth and recent generation time."""
+        per_generation = self.avg_generation_seconds or 30.0
+        return max(1, math.ceil(per_generation * (self.queued() + 1) / self.max_concurrent))
+
+    def _reject(self, status_code: int, detail: str) -> HTTPException:
+        return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after())})
+
+    def check(self, priority: str = "interactive") -> None:
+        """Raise 429 right away if a request of `priority` would not fit in the queue."""
+        if self._active < self.max_concurrent and not self.queued():
+            return
+        limit = self.max_queue if priority == "interactive" else self.max_queue // 2
+        if self.queued() >= limit:
+            self.stats["rejected"] += 1
+            raise self._reject(429, f"Prediction queue is full ({self.queued()} waiting), retry later.")
+
+    def _release(self) -> None:
+        # The slot passes straight to the first live waiter, so no newcomer can jump the queue
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    async def _acquire(self, priority: str) -> None:
+        if self._active < self.max_concurrent and not self.queued():
+            self._active += 1
+            return
+        self.check(priority)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES[priority], next(self._arrivals), future))
+        try:
+            await asyncio.wait_for(future, self.queue_timeouts[priority])
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise self._reject(503, f"Prediction waited more than {self.queue_timeouts[priority]}s for a free slot, retry later.")
+        except asyncio.CancelledError:
+            # Cancelled just after being handed the slot: pass it on
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive") -> AsyncIterator[float]:
+        """Hold one generation slot for the duration of the block. Yields the seconds spent queued."""
+        queued_at = time.monotonic()
+        await self._acquire(priority)
+        started = time.monotonic()
+        wait = started - queued_at
+        self.stats["admitted"] += 1
+        self.stats["wait_seconds"] += wait
+        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], wait)
+        if wait > 1:
+            logger.info(f"{priority} prediction admitted after {wait:.1f}s in queue")
+        try:
+            yield wait
+        finally:
+            held = time.monotonic() - started
+            previous = self.avg_generation_seconds
+            self.avg_generation_seconds = held if previous is None else 0.8 * previous + 0.2 * held
+            self._release()
+
+    def summary(self) -> dict:
+        admitted = self.stats["admitted"]
+        return {
+            **self.stats,
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self._active,
+            "queued": {priority: self.queued(priority) for priority in PRIORITIES},
+            "avg_wait_seconds": self.stats["wait_seconds"] / admitted if admitted else 0.0,
+            "avg_generation_seconds": self.avg_generation_seconds,
+        }
+
+
+admission = AdmissionController(
+    settings.OLLAMA_MAX_CONCURRENT,
+    settings.OLLAMA_MAX_QUEUE,
+    {"interactive": settings.OLLAMA_QUEUE_TIMEOUT_SECONDS, "background": settings.OLLAMA_BACKGROUND_QUEUE_TIMEOUT_SECONDS},
+)
@@ -18,6 +18,35 @@ class Settings(BaseSettings):
     OLLAMA_API_URL: str = "http://eass_ollama:11434/api/generate"
     OLLAMA_MODEL: str = "llama3"
     OLLAMA_TIMEOUT: int | None = 6000
+    # Constrain /predict generations to the PredictionResponse JSON schema (Ollama `format`)
+    OLLAMA_STRUCTURED_OUTPUT: bool = os.getenv("OLLAMA_STRUCTURED_OUTPUT", "true").lower() == "true"
+    # How long Ollama keeps the model (and its cached prompt prefix) loaded after a request
+    OLLAMA_KEEP_ALIVE: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    # Warm-up on start, keep-alive pinning and /ready (ready once a first token takes at most this long)
+    OLLAMA_WARMUP_ENABLED: bool = os.getenv("OLLAMA_WARMUP_ENABLED", "true").lower() == "true"
+    OLLAMA_READY_FIRST_TOKEN_SECONDS: float = float(os.getenv("OLLAMA_READY_FIRST_TOKEN_SECONDS", "10"))
+    OLLAMA_WARMUP_RETRY_SECONDS: float = float(os.getenv("OLLAMA_WARMUP_RETRY_SECONDS", "15"))
+    OLLAMA_KEEPALIVE_INTERVAL_SECONDS: float = float(os.getenv("OLLAMA_KEEPALIVE_INTERVAL_SECONDS", "240"))
+    # Admission control: concurrent generations, queue size and how long each priority may wait
+    OLLAMA_MAX_CONCURRENT: int = int(os.getenv("OLLAMA_MAX_CONCURRENT", "2"))
+    OLLAMA_MAX_QUEUE: int = int(os.getenv("OLLAMA_MAX_QUEUE", "16"))
+    OLLAMA_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("OLLAMA_QUEUE_TIMEOUT_SECONDS", "120"))
+    OLLAMA_BACKGROUND_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("OLLAMA_BACKGROUND_QUEUE_TIMEOUT_SECONDS", "900"))
+    
+    # Stock data service (features for predictions without them)
+    STOCK_DATA_URL: str = os.getenv("STOCK_DATA_URL", "http://eass_stock_data:8000")
+    STOCK_DATA_TIMEOUT: float = float(os.getenv("STOCK_DATA_TIMEOUT", "30"))
+    
+    # Prediction cache (quantized feature hash -> prediction)
+    PREDICTION_CACHE_PRECISION: int = int(os.getenv("PREDICTION_CACHE_PRECISION", "3"))
+    PREDICTION_CACHE_TTL_SECONDS: int = int(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "900"))
+    PREDICTION_CACHE_PATH: str = os.getenv("PREDICTION_CACHE_PATH", "")
+    
+    # Outbound HTTP connection pools (shared by all requests)
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
     
     # Auth/JWT settings (added to match .env)
     JWT_SECRET: str = os.getenv("JWT_SECRET", "")
@@ -0,0 +1,118 @@
+"""
+Long-lived pooled httpx clients for outbound calls (Ollama and the stock data service).
+
+Clients are opened in the app lifespan and reused by every request, so keep-alive connections
+are shared instead of being set up per prediction. `get_client` also creates a client lazily
+when the lifespan hasn't run (e.g. tests driving the app directly).
+
+HTTP/2 is offered when the `h2` package is installed. httpx only negotiates it over TLS (ALPN),
+so plain-http peers keep using pooled HTTP/1.1 keep-alive connections.
+
+httpcore's trace extension tells each request whether it opened a new connection and how long it
+waited for one from the pool; the totals are exposed through /metrics.
+"""
+import time
+from typing import Dict
+
+import httpx
+
+from .config import settings
+from .logger import logger
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class PooledClient:
+    def __init__(self, name: str, timeout: float | None):
+        self.name = name
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+        self.stats = {"requests": 0, "new_connections": 0, "pool_wait_seconds": 0.0, "max_pool_wait_seconds": 0.0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+                ),
+                http2=settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+            )
+        return self._client
+
+    def _tracer(self, started: float):
+        waited = False
+
+        async def trace(event: str, info: dict) -> None:
+            nonlocal waited
+            if event == "connection.connect_tcp.started":
+                self.stats["new_connections"] += 1
+            # The first event after the pool hands out a connection: a new connect or the request headers
+            if not waited and (event == "connection.connect_tcp.started" or event.endswith("send_request_headers.started")):
+                waited = True
+                wait = time.perf_counter() - started
+                self.stats["pool_wait_seconds"] += wait
+                self.stats["max_pool_wait_seconds"] = max(self.stats["max_pool_wait_seconds"], wait)
+
+        return trace
+
+    def _extensions(self, kwargs: dict) -> dict:
+        self.stats["requests"] += 1
+        return {**kwargs.pop("extensions", {}), "trace": self._tracer(time.perf_counter())}
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.client.get(url, extensions=self._extensions(kwargs), **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.client.post(url, extensions=self._extensions(kwargs), **kwargs)
+
+    def stream(self, method: str, url: str, **kwargs):
+        """client.stream(...) with the same connection metrics, for streamed responses."""
+        return self.client.stream(method, url, extensions=self._extensions(kwargs), **kwargs)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def summary(self) -> dict:
+        requests = self.stats["requests"]
+        return {
+            **self.stats,
+            "reused_connections": max(requests - self.stats["new_connections"], 0),
+            "reuse_ratio": max(1 - self.stats["new_connections"] / requests, 0.0) if requests else 0.0,
+            "avg_pool_wait_seconds": self.stats["pool_wait_seconds"] / requests if requests else 0.0,
+            "http2": settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+        }
+
+
+clients: Dict[str, PooledClient] = {
+    "ollama": PooledClient("ollama", settings.OLLAMA_TIMEOUT),
+    "stock_data": PooledClient("stock_data", settings.STOCK_DATA_TIMEOUT),
+}
+
+
+def get_client(name: str) -> PooledClient:
+    return clients[name]
+
+
+def open_clients() -> None:
+    for pooled in clients.values():
+        pooled.client
+    logger.info(f"HTTP client pools ready (http2={'on' if settings.HTTP2_ENABLED and HTTP2_AVAILABLE else 'off'})")
+
+
+async def close_clients() -> None:
+    for pooled in clients.values():
+        await pooled.aclose()
+
+
+def client_metrics() -> dict:
+    return {name: pooled.summary() for name, pooled in clients.items()}
@@ -1,7 +1,10 @@
 from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, field_validator
-from typing import Dict, Any, Literal
+from typing import AsyncIterator, Dict, Any, Literal
+import asyncio
 import httpx
 import uvicorn
 from datetime import datetime
@@ -10,11 +13,29 @@ import re
 
 from .config import settings
 from .logger import logger
+from .admission import admission
+from .http_clients import client_metrics, close_clients, get_client, open_clients
+from .prediction_cache import cache_key, prediction_cache
+from .streaming import ResponseStreamParser
+from .structured_output import generation_stats, prediction_schema
+from .warmup import model_warmer
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One keep-alive pool per upstream for the life of the process
+    open_clients()
+    # Load the model before traffic arrives and keep it loaded (see warmup)
+    warmer = asyncio.create_task(model_warmer.run()) if settings.OLLAMA_WARMUP_ENABLED else None
+    yield
+    if warmer:
+        warmer.cancel()
+    await close_clients()
 
 app = FastAPI(
     title="Stock Prediction LLM Service",
     description="Service for generating stock predictions using LLaMA 3 via Ollama",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -62,10 +83,38 @@ class StockFeatures(BaseModel):
             raise ValueError('Volume cannot be negative')
         return v
 
+# The /fetch sections the prompt actually uses. Everything else (advanced news, extended
+# fundamentals/indicators, RSI) costs extra Alpha Vantage calls the prediction never reads.
+STOCK_DATA_FIELDS = [
+    *(f"technical_indicators.{name}" for name in (
+        "latest_close", "sma_5", "ema_5", "macd", "macd_signal", "macd_hist",
+        "bb_upper", "bb_middle", "bb_lower", "open", "high", "low", "volume",
+    )),
+    "volume_features",
+    "fundamentals",
+    "news_sentiment",
+]
+
 class PredictionRequest(BaseModel):
     symbol: str
     features: StockFeatures | None = None
     time_frame: str | None = Field(None, description="The desired time frame for the prediction (e.g., 'next 5 trading days').")
+    priority: Literal["interactive", "background"] = Field("interactive", description="Queue priority; background (precompute) requests wait behind interactive ones.")
+
+class PredictionBatchRequest(BaseModel):
+    symbols: list[str]
+    time_frame: str | None = Field(None, description="The desired time frame for every prediction.")
+    priority: Literal["interactive", "background"] = "interactive"
+
+    @field_validator('symbols')
+    @classmethod
+    def validate_symbols(cls, v: list[str]) -> list[str]:
+        symbols = list(dict.fromkeys(s.strip().upper() for s in v if s.strip()))
+        if not symbols:
+            raise ValueError('symbols must not be empty')
+        if len(symbols) > 50:
+            raise ValueError('At most 50 symbols per request')
+        return symbols
 
 class PredictionResponse(BaseModel):
     symbol: str
@@ -83,30 +132,12 @@ class PredictionResponse(BaseModel):
             raise ValueError('Confidence must be between 0 and 1')
         return v
 
-def format_prompt(symbol: str, features: StockFeatures, time_frame: str | None = None, news_sentiment: dict = None) -> str:
-    """Format all features into a prompt for the LLM, including news sentiment and a desired time frame."""
-    def show(val):
-        return "N/A" if val is None else val
-
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    time_frame_instruction = "Your analysis should determine the most appropriate time frame for the prediction (e.g., next few days, 1 week, 1 month)."
-    if time_frame:
-        time_frame_instruction = f"Your analysis should be for the following time frame: {time_frame}."
-
-    prompt = f"""Current Date: {current_date}
-Stock Symbol: {symbol}\n\n[TECHNICAL INDICATORS]\nLatest Close: {show(features.latest_close)}\nSMA 5: {show(features.sma_5)}\nEMA 5: {show(features.ema_5)}\nMACD: {show(features.macd)}\nMACD Signal: {show(features.macd_signal)}\nMACD Histogram: {show(features.macd_hist)}\nBollinger Bands - Upper: {show(features.bb_upper)}, Middle: {show(features.bb_middle)}, Lower: {show(features.bb_lower)}\nOpen: {show(features.open)}\nHigh: {show(features.high)}\nLow: {show(features.low)}\nVolume: {show(features.volume)}\n\n[VOLUME FEATURES]\nLatest Volume: {show(features.latest_volume)}\nAverage Volume: {show(features.volume_avg)}\nVolume Spike: {show(features.volume_spike)}\nOn-Balance Volume (OBV): {show(features.obv)}\nVolume SMA: {show(features.volume_sma)}\nVolume Ratio: {show(features.volume_ratio)}\nVolume Trend: {show(features.volume_trend)}\n\n[FUNDAMENTALS]\nMarket Cap: {show(features.market_cap)}\nP/E Ratio: {show(features.pe_ratio)}\nDividend Yield: {show(features.dividend_yield)}\nBeta: {show(features.beta)}\n"""
-    if news_sentiment:
-        prompt += "\\n[NEWS SENTIMENT]\\n"
-        prompt += f"Sentiment Score: {news_sentiment.get('sentiment_score', 'N/A')}\\n"
-        prompt += f"Sentiment Counts: {news_sentiment.get('sentiment_counts', {})}\\n"
-        for h in news_sentiment.get('headlines', []):
-            prompt += f"- {h.get('title', '')} (Sentiment: {h.get('sentiment', '')})\\n"
-    
-    prompt += f""" 
+# Static instructions, sent as Ollama's `system` so every request shares the same evaluated prefix
+SYSTEM_PROMPT = """You are a stock analyst. Each request gives the current date, one stock's technical indicators,
+volume features, fundamentals and (when available) news sentiment, followed by the time frame to use.
 
 Instructions:
-Analyze the stock using all the above features, including news sentiment.
-{time_frame_instruction}
+Analyze the stock using all of the given features, including news sentiment.
 Your entire response MUST be plain text. Do NOT use JSON or any other structured format.
 Return your response strictly in the following KEY: VALUE format, with each item on a new line:
 RECOMMENDATION: [BUY, SELL, or HOLD]
@@ -136,103 +167,186 @@ Important:
 - Do not include any other text, explanations, or conversational filler before the first keyword or after the reasoning.
 - The REASONING can be multi-line. All lines after "REASONING: " are part of the reasoning.
 """
+
+# System prompt for schema-constrained generations (see structured_output)
+STRUCTURED_SYSTEM_PROMPT = """You are a stock analyst. Each request gives the current date, one stock's technical indicators,
+volume features, fundamentals and (when available) news sentiment, followed by the time frame to use.
+
+Instructions:
+Analyze the stock using all of the given features, including news sentiment.
+Respond with a single JSON object with these keys:
+- "recommendation": "BUY", "SELL" or "HOLD"
+- "confidence": a number between 0.0 and 1.0
+- "time_frame": the time frame for your prediction, e.g. "Next 5 trading days"
+- "price_predictions": an object mapping each day ('YYYY-MM-DD', starting after the current date) to the predicted price
+- "reasoning": your detailed analysis
+"""
+
+def format_prompt(symbol: str, features: StockFeatures, time_frame: str | None = None, news_sentiment: dict = None) -> str:
+    """
+    Format all features into a prompt for the LLM, including news sentiment and a desired time frame.
+    Only per-request data goes here; the instructions are in SYSTEM_PROMPT / STRUCTURED_SYSTEM_PROMPT.
+    """
+    def show(val):
+        return "N/A" if val is None else val
+
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    time_frame_instruction = "Your analysis should determine the most appropriate time frame for the prediction (e.g., next few days, 1 week, 1 month)."
+    if time_frame:
+        time_frame_instruction = f"Your analysis should be for the following time frame: {time_frame}."
+
+    prompt = f"""Current Date: {current_date}
+Stock Symbol: {symbol}\n\n[TECHNICAL INDICATORS]\nLatest Close: {show(features.latest_close)}\nSMA 5: {show(features.sma_5)}\nEMA 5: {show(features.ema_5)}\nMACD: {show(features.macd)}\nMACD Signal: {show(features.macd_signal)}\nMACD Histogram: {show(features.macd_hist)}\nBollinger Bands - Upper: {show(features.bb_upper)}, Middle: {show(features.bb_middle)}, Lower: {show(features.bb_lower)}\nOpen: {show(features.open)}\nHigh: {show(features.high)}\nLow: {show(features.low)}\nVolume: {show(features.volume)}\n\n[VOLUME FEATURES]\nLatest Volume: {show(features.latest_volume)}\nAverage Volume: {show(features.volume_avg)}\nVolume Spike: {show(features.volume_spike)}\nOn-Balance Volume (OBV): {show(features.obv)}\nVolume SMA: {show(features.volume_sma)}\nVolume Ratio: {show(features.volume_ratio)}\nVolume Trend: {show(features.volume_trend)}\n\n[FUNDAMENTALS]\nMarket Cap: {show(features.market_cap)}\nP/E Ratio: {show(features.pe_ratio)}\nDividend Yield: {show(features.dividend_yield)}\nBeta: {show(features.beta)}\n"""
+    if news_sentiment:
+        prompt += "\\n[NEWS SENTIMENT]\\n"
+        prompt += f"Sentiment Score: {news_sentiment.get('sentiment_score', 'N/A')}\\n"
+        prompt += f"Sentiment Counts: {news_sentiment.get('sentiment_counts', {})}\\n"
+        for h in news_sentiment.get('headlines', []):
+            prompt += f"- {h.get('title', '')} (Sentiment: {h.get('sentiment', '')})\\n"
+    prompt += f"\n{time_frame_instruction}\n"
     return prompt
 
 async def call_ollama(prompt: str) -> Dict[str, Any]:
     """Call the Ollama API to get a prediction."""
-    async with httpx.AsyncClient(timeout=settings.OLLAMA_TIMEOUT) as client:
+    client = get_client("ollama")
+    try:
+        response = await client.post(
+            settings.OLLAMA_API_URL,
+            json={
+                "model": settings.OLLAMA_MODEL,
+                "system": STRUCTURED_SYSTEM_PROMPT if settings.OLLAMA_STRUCTURED_OUTPUT else SYSTEM_PROMPT,
+                "prompt": prompt,
+                "stream": False,
+                "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+                **({"format": prediction_schema(PredictionResponse)} if settings.OLLAMA_STRUCTURED_OUTPUT else {})
+            }
+        )
+        response.raise_for_status()
         try:
-            response = await client.post(
-                settings.OLLAMA_API_URL,
-                json={
-                    "model": settings.OLLAMA_MODEL,
-                    "prompt": prompt,
-                    "stream": False
-                }
-            )
-            response.raise_for_status()
-            try:
-                return response.json() # Primary attempt
-            except json.JSONDecodeError as e_json_parse: # More specific exception for when response.json() fails
-                logger.warn(f"response.json() failed ({e_json_parse}). Attempting to parse response.text as a stream of JSON objects. Raw response text (first 1000 chars):\n{response.text[:1000]}...")
-
-                accumulated_response_str = ""
-                # Default values for the wrapper object
-                model_name = settings.OLLAMA_MODEL
-                created_time = datetime.utcnow().isoformat() + "Z"
+            return response.json() # Primary attempt
+        except json.JSONDecodeError as e_json_parse: # More specific exception for when response.json() fails
+            logger.warn(f"response.json() failed ({e_json_parse}). Attempting to parse response.text as a stream of JSON objects. Raw response text (first 1000 chars):\n{response.text[:1000]}...")
+
+            accumulated_response_str = ""
+            # Default values for the wrapper object
+            model_name = settings.OLLAMA_MODEL
+            created_time = datetime.utcnow().isoformat() + "Z"
+            
+            lines = response.text.strip().split('\n')
+
+            if not response.text.strip():
+                logger.error(f"Fallback stream parsing: response.text is empty or only whitespace. Original httpx error: {e_json_parse}")
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Ollama API request failed ({e_json_parse}) and response body was empty."
+                )
+
+            any_chunk_processed_successfully = False
+            for i, line_str in enumerate(lines):
+                line_content = line_str.strip()
+                if not line_content:
+                    continue
                 
-                lines = response.text.strip().split('\n')
-
-                if not response.text.strip():
-                    logger.error(f"Fallback stream parsing: response.text is empty or only whitespace. Original httpx error: {e_json_parse}")
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"Ollama API request failed ({e_json_parse}) and response body was empty."
-                    )
-
-                any_chunk_processed_successfully = False
-                for i, line_str in enumerate(lines):
-                    line_content = line_str.strip()
-                    if not line_content:
-                        continue
+                try:
+                    line_json = json.loads(line_content)
+                    any_chunk_processed_successfully = True
+                    accumulated_response_str += line_json.get("response", "")
                     
-                    try:
-                        line_json = json.loads(line_content)
-                        any_chunk_processed_successfully = True
-                        accumulated_response_str += line_json.get("response", "")
-                        
-                        # Update model_name and created_time from the chunk if available
-                        if "model" in line_json: model_name = line_json["model"]
-                        if "created_at" in line_json: created_time = line_json["created_at"]
-                        
-                    except json.JSONDecodeError:
-                        logger.warn(f"Fallback stream parsing: Skipping non-JSON line: '{line_content[:200]}...'")
-                        # If this is the only line and nothing has been accumulated,
-                        # it might be a plain text response from Ollama (e.g., an error message).
-                        if len(lines) == 1 and not accumulated_response_str:
-                            accumulated_response_str = line_content
-                            logger.info(f"Fallback stream parsing: Treating single non-JSON line as response content: '{accumulated_response_str[:200]}...'")
-                            any_chunk_processed_successfully = True # Mark as processed to avoid later error
-                            break # No more lines to process in this case
-                
-                if not any_chunk_processed_successfully and not accumulated_response_str:
-                    logger.error(f"Fallback stream parsing: Failed to extract any usable content from response.text. Original httpx error: {e_json_parse}. Response text (first 1000 chars): {response.text[:1000]}...")
-                    raise HTTPException(status_code=500, detail=f"Ollama API request failed: ({e_json_parse}) and could not parse response from Ollama stream.")
-
-                # Construct the dictionary that parse_llm_response expects
-                final_structured_response = {
-                    "model": model_name,
-                    "created_at": created_time,
-                    "response": accumulated_response_str,
-                    "done": True # We assume it's done after processing all available text
-                }
-                
-                logger.info(f"Fallback stream parsing: Reconstructed Ollama response. Content (first 100 chars of 'response' field): '{accumulated_response_str[:100]}...'")
-                return final_structured_response
-        except httpx.ConnectError as e_connect:
-            logger.error(f"Cannot connect to Ollama service: {e_connect}")
-            raise HTTPException(
-                status_code=503,
-                detail=f"Ollama service is not reachable at {settings.OLLAMA_API_URL}. Ensure it's running."
-            )
-        except httpx.ReadTimeout as e_read_timeout:
-            logger.error(f"Ollama API request timed out after {settings.OLLAMA_TIMEOUT}s: {e_read_timeout}")
-            raise HTTPException(
-                status_code=504,
-                detail=f"Ollama service timed out responding to the request after {settings.OLLAMA_TIMEOUT}s."
-            )
-        except httpx.HTTPStatusError as e_http_status:
-            logger.error(f"Ollama API request failed with status {e_http_status.response.status_code}: {e_http_status.response.text}")
-            raise HTTPException(
-                status_code=e_http_status.response.status_code,
-                detail=f"Error calling Ollama API: Status {e_http_status.response.status_code}. Response: {e_http_status.response.text[:500]}"
-            )
-        except httpx.HTTPError as e_http: # Catch other httpx errors
-            logger.error(f"An HTTP error occurred while calling Ollama API: {str(e_http)}")
-            raise HTTPException(
-                status_code=500, # Generic server error for other HTTP issues
-                detail=f"Error calling Ollama API: {str(e_http)}"
-            )
+                    # Update model_name and created_time from the chunk if available
+                    if "model" in line_json: model_name = line_json["model"]
+                    if "created_at" in line_json: created_time = line_json["created_at"]
+                    
+                except json.JSONDecodeError:
+                    logger.warn(f"Fallback stream parsing: Skipping non-JSON line: '{line_content[:200]}...'")
+                    # If this is the only line and nothing has been accumulated,
+                    # it might be a plain text response from Ollama (e.g., an error message).
+                    if len(lines) == 1 and not accumulated_response_str:
+                        accumulated_response_str = line_content
+                        logger.info(f"Fallback stream parsing: Treating single non-JSON line as response content: '{accumulated_response_str[:200]}...'")
+                        any_chunk_processed_successfully = True # Mark as processed to avoid later error
+                        break # No more lines to process in this case
+            
+            if not any_chunk_processed_successfully and not accumulated_response_str:
+                logger.error(f"Fallback stream parsing: Failed to extract any usable content from response.text. Original httpx error: {e_json_parse}. Response text (first 1000 chars): {response.text[:1000]}...")
+                raise HTTPException(status_code=500, detail=f"Ollama API request failed: ({e_json_parse}) and could not parse response from Ollama stream.")
+
+            # Construct the dictionary that parse_llm_response expects
+            final_structured_response = {
+                "model": model_name,
+                "created_at": created_time,
+                "response": accumulated_response_str,
+                "done": True # We assume it's done after processing all available text
+            }
+            
+            logger.info(f"Fallback stream parsing: Reconstructed Ollama response. Content (first 100 chars of 'response' field): '{accumulated_response_str[:100]}...'")
+            return final_structured_response
+    except httpx.ConnectError as e_connect:
+        logger.error(f"Cannot connect to Ollama service: {e_connect}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Ollama service is not reachable at {settings.OLLAMA_API_URL}. Ensure it's running."
+        )
+    except httpx.ReadTimeout as e_read_timeout:
+        logger.error(f"Ollama API request timed out after {settings.OLLAMA_TIMEOUT}s: {e_read_timeout}")
+        raise HTTPException(
+            status_code=504,
+            detail=f"Ollama service timed out responding to the request after {settings.OLLAMA_TIMEOUT}s."
+        )
+    except httpx.HTTPStatusError as e_http_status:
+        logger.error(f"Ollama API request failed with status {e_http_status.response.status_code}: {e_http_status.response.text}")
+        raise HTTPException(
+            status_code=e_http_status.response.status_code,
+            detail=f"Error calling Ollama API: Status {e_http_status.response.status_code}. Response: {e_http_status.response.text[:500]}"
+        )
+    except httpx.HTTPError as e_http: # Catch other httpx errors
+        logger.error(f"An HTTP error occurred while calling Ollama API: {str(e_http)}")
+        raise HTTPException(
+            status_code=500, # Generic server error for other HTTP issues
+            detail=f"Error calling Ollama API: {str(e_http)}"
+        )
+
+async def stream_ollama(prompt: str, final: dict | None = None) -> AsyncIterator[str]:
+    """
+    Call the Ollama API with streaming on and yield response tokens as they are generated.
+    The closing chunk (durations and eval counts) is copied into `final`.
+    """
+    try:
+        async with get_client("ollama").stream(
+            "POST",
+            settings.OLLAMA_API_URL,
+            json={
+                "model": settings.OLLAMA_MODEL,
+                "system": SYSTEM_PROMPT,
+                "prompt": prompt,
+                "stream": True,
+                "keep_alive": settings.OLLAMA_KEEP_ALIVE
+            }
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise HTTPException(status_code=500, detail=f"Ollama error: {chunk['error']}")
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    if final is not None:
+                        final.update(chunk)
+                    break
+    except httpx.ConnectError as e_connect:
+        logger.error(f"Cannot connect to Ollama service: {e_connect}")
+        raise HTTPException(status_code=503, detail=f"Ollama service is not reachable at {settings.OLLAMA_API_URL}. Ensure it's running.")
+    except httpx.ReadTimeout as e_read_timeout:
+        logger.error(f"Ollama stream timed out after {settings.OLLAMA_TIMEOUT}s: {e_read_timeout}")
+        raise HTTPException(status_code=504, detail=f"Ollama service timed out after {settings.OLLAMA_TIMEOUT}s.")
+    except httpx.HTTPStatusError as e_http_status:
+        logger.error(f"Ollama stream request failed with status {e_http_status.response.status_code}")
+        raise HTTPException(status_code=e_http_status.response.status_code, detail=f"Error calling Ollama API: Status {e_http_status.response.status_code}.")
+    except httpx.HTTPError as e_http:
+        logger.error(f"An HTTP error occurred while streaming from Ollama API: {str(e_http)}")
+        raise HTTPException(status_code=500, detail=f"Error calling Ollama API: {str(e_http)}")
 
 def parse_llm_response(response_data: Dict[str, Any]) -> Dict[str, Any]:
     """Parse and validate the LLM response from a line-delimited format."""
@@ -332,96 +446,119 @@ def parse_llm_response(response_data: Dict[str, Any]) -> Dict[str, Any]:
         "reasoning": reasoning
     }
 
-@app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "service": settings.SERVICE_NAME}
-
-@app.post("/predict", response_model=PredictionResponse)
-async def predict_stock(request: PredictionRequest):
-    """
-    Generate a stock prediction using LLaMA 3 via Ollama. If features are not provided, fetch them from the stock data service.
-    """
-    try:
-        logger.info(f"Generating prediction for {request.symbol}")
-        features = request.features
-        data = {}  # Initialize data to an empty dict
-        news_sentiment = None
-        if features is None:
-            # Fetch features from stock data service
-            stock_data_url = "http://eass_stock_data:8000/fetch"
-            async with httpx.AsyncClient(timeout=30) as client:
-                fetch_resp = await client.post(stock_data_url, json={"symbol": request.symbol})
-                fetch_resp.raise_for_status()
-                data = fetch_resp.json()
-                # Combine all features into a single dict
-                combined = {}
-                combined.update(data.get("technical_indicators", {}))
-                combined.update(data.get("volume_features", {}))
-                combined.update(data.get("fundamentals", {}))
-                news_sentiment = data.get("news_sentiment", {})
-                # Add new features
-                combined["advanced_news_sentiment"] = data.get("advanced_news_sentiment", {})
-                combined["extended_fundamentals"] = data.get("extended_fundamentals", {})
-                combined["technical_indicators_ext"] = data.get("technical_indicators_ext", {})
-                combined["volume_features_ext"] = data.get("volume_features_ext", {})
-                # Map to StockFeatures
-                features = StockFeatures(
-                    latest_close=combined.get("latest_close", 0.0),
-                    sma_5=combined.get("sma_5", 0.0),
-                    ema_5=combined.get("ema_5", 0.0),
-                    macd=combined.get("macd", 0.0),
-                    macd_signal=combined.get("macd_signal", 0.0),
-                    macd_hist=combined.get("macd_hist", 0.0),
-                    bb_upper=combined.get("bb_upper", 0.0),
-                    bb_middle=combined.get("bb_middle", 0.0),
-                    bb_lower=combined.get("bb_lower", 0.0),
-                    open=combined.get("open", 0.0),
-                    high=combined.get("high", 0.0),
-                    low=combined.get("low", 0.0),
-                    volume=int(combined.get("volume", 0)),
-                    latest_volume=int(combined.get("latest_volume", 0)),
-                    volume_avg=combined.get("volume_avg", 0.0),
-                    volume_spike=int(combined.get("volume_spike", 0)),
-                    obv=int(combined.get("obv", 0)),
-                    volume_sma=combined.get("volume_sma", 0.0),
-                    volume_ratio=combined.get("volume_ratio", 0.0),
-                    volume_trend=combined.get("volume_trend", ""),
-                    market_cap=int(combined.get("market_cap", 0)),
-                    pe_ratio=combined.get("pe_ratio", 0.0),
-                    dividend_yield=combined.get("dividend_yield", 0.0),
-                    beta=combined.get("beta", 0.0)
-                )
-        # Log all features including new ones
-        all_features = {
-            **features.model_dump(),
-            "advanced_news_sentiment": data.get("advanced_news_sentiment", {}),
-            "extended_fundamentals": data.get("extended_fundamentals", {}),
-            "technical_indicators_ext": data.get("technical_indicators_ext", {}),
-            "volume_features_ext": data.get("volume_features_ext", {})
-        }
-        logger.info(f"Features for {request.symbol}: {json.dumps(all_features, indent=2)}")
-        
+def features_from_stock_data(data: dict) -> tuple[StockFeatures, dict]:
+    """StockFeatures and news sentiment from a stock data service /fetch payload."""
+    # Combine all features into a single dict
+    combined = {}
+    combined.update(data.get("technical_indicators") or {})
+    combined.update(data.get("volume_features") or {})
+    combined.update(data.get("fundamentals") or {})
+    news_sentiment = data.get("news_sentiment", {})
+    # Map to StockFeatures
+    features = StockFeatures(
+        latest_close=combined.get("latest_close", 0.0),
+        sma_5=combined.get("sma_5", 0.0),
+        ema_5=combined.get("ema_5", 0.0),
+        macd=combined.get("macd", 0.0),
+        macd_signal=combined.get("macd_signal", 0.0),
+        macd_hist=combined.get("macd_hist", 0.0),
+        bb_upper=combined.get("bb_upper", 0.0),
+        bb_middle=combined.get("bb_middle", 0.0),
+        bb_lower=combined.get("bb_lower", 0.0),
+        open=combined.get("open", 0.0),
+        high=combined.get("high", 0.0),
+        low=combined.get("low", 0.0),
+        volume=int(combined.get("volume", 0)),
+        latest_volume=int(combined.get("latest_volume", 0)),
+        volume_avg=combined.get("volume_avg", 0.0),
+        volume_spike=int(combined.get("volume_spike", 0)),
+        obv=int(combined.get("obv", 0)),
+        volume_sma=combined.get("volume_sma", 0.0),
+        volume_ratio=combined.get("volume_ratio", 0.0),
+        volume_trend=combined.get("volume_trend", ""),
+        market_cap=int(combined.get("market_cap", 0)),
+        pe_ratio=combined.get("pe_ratio", 0.0),
+        dividend_yield=combined.get("dividend_yield", 0.0),
+        beta=combined.get("beta", 0.0)
+    )
+    return features, news_sentiment
+
+async def resolve_features(request: PredictionRequest) -> tuple[StockFeatures, dict | None]:
+    """The request's features, or features and news sentiment fetched from the stock data service."""
+    if request.features is not None:
+        return request.features, None
+    # Fetch features from stock data service
+    fetch_resp = await get_client("stock_data").post(f"{settings.STOCK_DATA_URL}/fetch", json={"symbol": request.symbol, "fields": STOCK_DATA_FIELDS})
+    fetch_resp.raise_for_status()
+    return features_from_stock_data(fetch_resp.json())
+
+async def generate_prediction(symbol: str, features: StockFeatures, news_sentiment: dict | None, time_frame: str | None, priority: str = "interactive") -> PredictionResponse:
+    """A prediction for the features: from the cache, or generated by Ollama once a slot is free."""
+    async def generate() -> dict:
         # Format the prompt
-        prompt = format_prompt(request.symbol, features, request.time_frame, news_sentiment)
+        prompt = format_prompt(symbol, features, time_frame, news_sentiment)
         logger.info("Prompt formatted successfully")
-        # Call Ollama
-        llm_response = await call_ollama(prompt)
+        # Call Ollama once a generation slot is free
+        async with admission.slot(priority):
+            llm_response = await call_ollama(prompt)
         logger.info("Received response from Ollama")
-        # Parse and validate the response
-        parsed_response = parse_llm_response(llm_response)
+        # Parse and validate the response (structured JSON, falling back to the KEY: VALUE format)
+        parsed_response = generation_stats.parse(llm_response, PredictionResponse, parse_llm_response)
         logger.info(f"Parsed LLM response: {parsed_response}")
         # Create the response
         response = PredictionResponse(
-            symbol=request.symbol,
+            symbol=symbol,
             recommendation=parsed_response["recommendation"],
             confidence=parsed_response["confidence"],
             reasoning=parsed_response["reasoning"],
             time_frame=parsed_response["time_frame"],
             price_predictions=parsed_response["price_predictions"]
         )
-        logger.info(f"Successfully generated prediction for {request.symbol}")
-        return response
+        return json.loads(response.model_dump_json())
+
+    key = cache_key(symbol, time_frame, features.model_dump(), news_sentiment)
+    prediction, source = await prediction_cache.get_or_compute(key, generate)
+    logger.info(f"Prediction for {symbol} ({source})")
+    return PredictionResponse(**prediction)
+
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return {"status": "healthy", "service": settings.SERVICE_NAME}
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    503 until OLLAMA_MODEL is loaded and answers its first token within OLLAMA_READY_FIRST_TOKEN_SECONDS,
+    then 200. The body has the loaded-model state and warm-up latency either way.
+    """
+    if not settings.OLLAMA_WARMUP_ENABLED:
+        return {"status": "ready", "model": settings.OLLAMA_MODEL, "warmup": "disabled"}
+    state = model_warmer.summary()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+@app.get("/metrics")
+async def metrics():
+    """Outbound connection pool metrics (connection reuse, pool wait time), prediction parse outcomes, cache hit rate and queue state."""
+    return {
+        "http_clients": client_metrics(),
+        "generations": generation_stats.summary(),
+        "prediction_cache": prediction_cache.summary(),
+        "admission": admission.summary(),
+    }
+
+@app.post("/predict", response_model=PredictionResponse)
+async def predict_stock(request: PredictionRequest):
+    """
+    Generate a stock prediction using LLaMA 3 via Ollama. If features are not provided, fetch them from the stock data service.
+    """
+    try:
+        logger.info(f"Generating prediction for {request.symbol}")
+        features, news_sentiment = await resolve_features(request)
+        logger.info(f"Features for {request.symbol}: {json.dumps(features.model_dump(), indent=2)}")
+        return await generate_prediction(request.symbol, features, news_sentiment, request.time_frame, request.priority)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating prediction for {request.symbol}: {str(e)}")
         logger.exception("Full traceback:")
@@ -429,6 +566,127 @@ async def predict_stock(request: PredictionRequest):
             raise HTTPException(status_code=503, detail="Ollama service is not reachable. Please ensure it's running on localhost:11434")
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def retry_after(e: HTTPException) -> int | None:
+    """Seconds to wait from a rejected request's Retry-After header (429/503 from admission), if any."""
+    return int(e.headers["Retry-After"]) if e.headers and "Retry-After" in e.headers else None
+
+@app.post("/predict/stream")
+async def predict_stock_stream(request: PredictionRequest):
+    """
+    Streaming /predict as Server-Sent Events. Every generated token is sent as a `token` event. Parsed
+    fields follow as soon as they are complete: `field` (recommendation, confidence, time_frame),
+    `price_prediction` and `reasoning`. The stream ends with `result` (the same body /predict returns)
+    or `error`. A cached prediction, or one another request is already generating, is answered with
+    its `result` event alone.
+    """
+    try:
+        features, news_sentiment = await resolve_features(request)
+    except Exception as e:
+        logger.error(f"Error fetching features for {request.symbol}: {str(e)}")
+        raise HTTPException(status_code=503 if isinstance(e, httpx.ConnectError) else 500, detail=str(e))
+    key = cache_key(request.symbol, request.time_frame, features.model_dump(), news_sentiment)
+    prompt = format_prompt(request.symbol, features, request.time_frame, news_sentiment)
+    if prediction_cache.get(key) is None and not prediction_cache.in_flight(key):
+        # A full queue is answered with 429 before the stream starts
+        admission.check(request.priority)
+
+    async def events():
+        tokens: asyncio.Queue = asyncio.Queue()
+
+        async def generate() -> dict:
+            # Runs in a task owned by the cache, so it is finished and cached even if this client goes
+            # away, and /predict or other streams for the same key wait for it instead of generating
+            final, text = {}, []
+            async with admission.slot(request.priority):
+                async for token in stream_ollama(prompt, final):
+                    text.append(token)
+                    tokens.put_nowait(token)
+            parsed = generation_stats.parse({**final, "response": "".join(text)}, PredictionResponse, parse_llm_response)
+            return json.loads(PredictionResponse(symbol=request.symbol, **parsed).model_dump_json())
+
+        outcome = asyncio.create_task(prediction_cache.get_or_compute(key, generate))
+        outcome.add_done_callback(lambda _: tokens.put_nowait(None))
+        parser = ResponseStreamParser()
+        try:
+            while (token := await tokens.get()) is not None:
+                yield sse("token", {"text": token})
+                for event in parser.feed(token):
+                    yield sse(event.pop("event"), event)
+            result, source = await outcome
+            if source == "miss":
+                for event in parser.finish():
+                    yield sse(event.pop("event"), event)
+            yield sse("result", result)
+        except HTTPException as e:
+            error = {"status_code": e.status_code, "detail": e.detail}
+            if retry_after(e) is not None:
+                error["retry_after"] = retry_after(e)
+            yield sse("error", error)
+        except Exception as e:
+            logger.exception(f"Error streaming prediction for {request.symbol}")
+            yield sse("error", {"status_code": 500, "detail": str(e)})
+        finally:
+            # Only stops waiting; the generation itself keeps running for the cache
+            outcome.cancel()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+@app.post("/predict/batch")
+async def predict_stock_batch(request: PredictionBatchRequest):
+    """
+    Predictions for many symbols, streamed as NDJSON in completion order: one line per symbol with
+    either `prediction` (the /predict body) or `error` and `status_code`, plus `retry_after` (seconds)
+    when the admission queue turned it away. Features for all symbols come
+    from one /fetch/batch call, and at most OLLAMA_MAX_CONCURRENT generations are started at a time,
+    so a batch never floods the admission queue.
+    """
+    try:
+        fetch_resp = await get_client("stock_data").post(
+            f"{settings.STOCK_DATA_URL}/fetch/batch",
+            json={"symbols": request.symbols, "fields": STOCK_DATA_FIELDS},
+        )
+        fetch_resp.raise_for_status()
+        batch = fetch_resp.json()
+    except httpx.HTTPError as e:
+        logger.error(f"Error fetching batch features: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Stock data service unavailable: {str(e)}")
+
+    slots = asyncio.Semaphore(admission.max_concurrent)
+
+    async def predict_one(symbol: str) -> dict:
+        try:
+            if symbol not in batch["results"]:
+                return {"symbol": symbol, "error": batch["errors"].get(symbol, "no data"), "status_code": 404}
+            features, news_sentiment = features_from_stock_data(batch["results"][symbol])
+            async with slots:
+                prediction = await generate_prediction(symbol, features, news_sentiment, request.time_frame, request.priority)
+            return {"symbol": symbol, "prediction": json.loads(prediction.model_dump_json())}
+        except HTTPException as e:
+            line = {"symbol": symbol, "error": e.detail, "status_code": e.status_code}
+            if retry_after(e) is not None:
+                line["retry_after"] = retry_after(e)
+            return line
+        except Exception as e:
+            logger.error(f"Batch prediction failed for {symbol}: {str(e)}")
+            return {"symbol": symbol, "error": str(e), "status_code": 500}
+
+    async def lines():
+        tasks = [asyncio.create_task(predict_one(symbol)) for symbol in request.symbols]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            # Client went away: stop waiting. Symbols still queued for a slot are never generated; a
+            # generation already running finishes in the prediction cache's task and is cached
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -0,0 +1,181 @@
+"""
+Prediction cache keyed by symbol, time frame and a hash of the quantized features.
+
+Feature values are rounded to PREDICTION_CACHE_PRECISION significant digits before hashing, so
+feature sets that differ only in noise share one generation. Entries live for
+PREDICTION_CACHE_TTL_SECONDS while the US market is open. Outside market hours the daily features
+can't change, so entries last until the next open. Concurrent requests for a key that is already
+being generated wait for that generation instead of starting their own. The generation runs in a
+task owned by the cache, so the request that started it can go away (a client disconnecting
+cancels it) without failing the others waiting on the same key.
+
+With PREDICTION_CACHE_PATH set, entries are written to that JSON file and loaded again on start.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from .config import settings
+from .logger import logger
+
+try:
+    from zoneinfo import ZoneInfo
+    MARKET_TZ = ZoneInfo("America/New_York")
+except Exception:  # no tz database in the image
+    MARKET_TZ = timezone(timedelta(hours=-5))
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+
+
+def quantize(value: Any, precision: int) -> Any:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return float(f"{value:.{precision}g}")
+
+
+def cache_key(symbol: str, time_frame: str | None, features: Dict[str, Any], news_sentiment: dict | None = None, precision: int | None = None) -> str:
+    """symbol|time frame|sha256 of the quantized features (and news sentiment score, which is also in the prompt)."""
+    precision = precision or settings.PREDICTION_CACHE_PRECISION
+    values = {name: quantize(value, precision) for name, value in features.items()}
+    if news_sentiment:
+        values["news_sentiment_score"] = quantize(news_sentiment.get("sentiment_score"), precision)
+    digest = hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()[:32]
+    return f"{symbol.upper()}|{(time_frame or '').strip().lower()}|{digest}"
+
+
+def next_market_open(now: datetime) -> datetime:
+    local = now.astimezone(MARKET_TZ)
+    candidate = local.replace(hour=MARKET_OPEN[0], minute=MARKET_OPEN[1], second=0, microsecond=0)
+    if candidate <= local:
+        candidate += timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+def expiry(now: datetime | None = None) -> float:
+    """Unix time a prediction made at `now` stays valid until."""
+    now = now or datetime.now(timezone.utc)
+    local = now.astimezone(MARKET_TZ)
+    opens = local.replace(hour=MARKET_OPEN[0], minute=MARKET_OPEN[1], second=0, microsecond=0)
+    closes = local.replace(hour=MARKET_CLOSE[0], minute=MARKET_CLOSE[1], second=0, microsecond=0)
+    if local.weekday() < 5 and opens <= local < closes:
+        return now.timestamp() + settings.PREDICTION_CACHE_TTL_SECONDS
+    return next_market_open(now).timestamp()
+
+
+class PredictionCache:
+    def __init__(self, path: str = ""):
+        self.path = path
+        self._entries: Dict[str, Tuple[float, dict]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._loaded = False
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def _load(self) -> None:
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load prediction cache from {self.path}: {str(e)}")
+            return
+        now = time.time()
+        self._entries.update({key: (expires, value) for key, (expires, value) in stored.items() if expires > now})
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist prediction cache to {self.path}: {str(e)}")
+
+    def get(self, key: str) -> dict | None:
+        if not self._loaded:
+            self._load()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    def lookup(self, key: str) -> dict | None:
+        """get() that counts towards the hit rate."""
+        value = self.get(key)
+        self.stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def in_flight(self, key: str) -> bool:
+        """Whether a computation for `key` is running that get_or_compute would wait for."""
+        return key in self._inflight
+
+    def put(self, key: str, value: dict) -> None:
+        if not self._loaded:
+            self._load()
+        now = time.time()
+        self._entries = {k: entry for k, entry in self._entries.items() if entry[0] > now}
+        self._entries[key] = (expiry(), value)
+        self._save()
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[dict]]) -> Tuple[dict, str]:
+        """
+        The cached value for `key`, or the result of `compute()` (stored on success).
+        Returns (value, "hit" | "coalesced" | "miss"). Errors are not cached and reach every waiter.
+        Cancelling a caller only stops it waiting; the computation finishes for the other callers.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached, "hit"
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight[key]), "coalesced"
+
+        self.stats["misses"] += 1
+        task = asyncio.create_task(self._compute(key, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task), "miss"
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+        value = await compute()
+        self.put(key, value)
+        return value
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here, so failures nobody waited for aren't logged
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+        self._loaded = True
+        self.stats = {name: 0 for name in self.stats}
+
+    def summary(self) -> dict:
+        requests = sum(self.stats.values())
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            # Coalesced requests didn't start a generation either
+            "hit_ratio": (self.stats["hits"] + self.stats["coalesced"]) / requests if requests else 0.0,
+        }
+
+
+prediction_cache = PredictionCache(settings.PREDICTION_CACHE_PATH)
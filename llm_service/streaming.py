@@ -0,0 +1,75 @@
+"""
+Incremental parsing of the KEY: VALUE prediction format while Ollama is still generating.
+
+Tokens are fed in as they arrive. Each field becomes an event as soon as it is complete:
+RECOMMENDATION as soon as BUY/SELL/HOLD has been generated, CONFIDENCE and TIME_FRAME at the end of
+their line, each PRICE_PREDICTIONS line on its own, and REASONING line by line. The final result is
+still validated by parse_llm_response on the full text, so it is identical to what /predict returns.
+"""
+import re
+from typing import Dict, List, Optional
+
+KEY_VALUE = re.compile(r'^([A-Z_]+):\s*(.*)')
+RECOMMENDATION_VALUE = re.compile(r'^RECOMMENDATION:\s*(BUY|SELL|HOLD)', re.IGNORECASE)
+PREDICTION_LINE = re.compile(r'^(Day\s+\d+|\d{4}-\d{2}-\d{2}|\d{4}/\d{2}/\d{2})\s*:\s*([\d.]+)')
+
+
+class ResponseStreamParser:
+    def __init__(self):
+        self.text = ""
+        self._line = ""
+        self._state: Optional[str] = None  # "predictions" or "reasoning"
+        self._emitted = set()
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Consume a chunk of generated text and return the events it completed."""
+        self.text += chunk
+        self._line += chunk
+        events = []
+        while "\n" in self._line:
+            line, self._line = self._line.split("\n", 1)
+            events.extend(self._complete_line(line.strip()))
+        # The recommendation is unambiguous before its line ends
+        match = RECOMMENDATION_VALUE.match(self._line.strip())
+        if match and "recommendation" not in self._emitted:
+            events.append(self._field("recommendation", match.group(1).upper()))
+        return events
+
+    def finish(self) -> List[Dict]:
+        """Flush the last, unterminated line."""
+        line, self._line = self._line.strip(), ""
+        return self._complete_line(line) if line else []
+
+    def _field(self, name: str, value) -> Dict:
+        self._emitted.add(name)
+        return {"event": "field", "name": name, "value": value}
+
+    def _complete_line(self, line: str) -> List[Dict]:
+        if not line:
+            return []
+        match = KEY_VALUE.match(line)
+        if match:
+            key, value = match.group(1), match.group(2).strip()
+            self._state = None
+            if key == "RECOMMENDATION" and "recommendation" not in self._emitted:
+                return [self._field("recommendation", value.upper())]
+            if key == "CONFIDENCE":
+                try:
+                    return [self._field("confidence", float(value))]
+                except ValueError:
+                    return []
+            if key == "TIME_FRAME":
+                return [self._field("time_frame", value)]
+            if key == "PRICE_PREDICTIONS":
+                self._state = "predictions"
+            elif key == "REASONING":
+                self._state = "reasoning"
+                return [{"event": "reasoning", "text": value}] if value else []
+            return []
+        if self._state == "predictions":
+            prediction = PREDICTION_LINE.match(line)
+            if prediction:
+                return [{"event": "price_prediction", "key": prediction.group(1), "price": float(prediction.group(2))}]
+        elif self._state == "reasoning":
+            return [{"event": "reasoning", "text": line}]
+        return []
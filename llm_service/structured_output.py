@@ -0,0 +1,109 @@
+"""
+Schema-constrained prediction output.
+
+Ollama's `format` option accepts a JSON schema and constrains generation to it, so the model can't
+drift from the expected shape. The schema is derived from PredictionResponse (minus the fields the
+service fills in itself). Replies are checked with one JSON decode plus model validation. Anything
+else falls back to parse_llm_response's KEY: VALUE parser.
+
+GenerationStats counts how each generation was parsed and how much model time was spent on
+generations that couldn't be used. It also totals Ollama's prompt evaluation figures: tokens of a
+prefix Ollama still has cached are not evaluated again, so prompt_eval_count and prompt_eval_duration
+per generation show how much of each prompt the shared system prompt saves.
+"""
+import json
+from functools import lru_cache
+from typing import Any, Callable, Dict
+
+from pydantic import BaseModel, ValidationError
+
+# Filled in by the service, not generated
+SERVICE_FIELDS = ("symbol", "timestamp")
+
+
+@lru_cache()
+def prediction_schema(model: type[BaseModel]) -> dict:
+    """JSON schema for the generated part of `model` (every remaining field required)."""
+    schema = model.model_json_schema()
+    properties = {name: spec for name, spec in schema["properties"].items() if name not in SERVICE_FIELDS}
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+def parse_structured_response(response_text: str, model: type[BaseModel]) -> Dict[str, Any]:
+    """Decode and validate a schema-constrained reply. Raises ValueError when it doesn't conform."""
+    data = json.loads(response_text)
+    if not isinstance(data, dict):
+        raise ValueError("Structured reply is not a JSON object")
+    fields = {name: data.get(name) for name in prediction_schema(model)["required"]}
+    try:
+        validated = model(symbol="-", **fields)
+    except ValidationError as e:
+        raise ValueError(str(e))
+    return {name: getattr(validated, name) for name in fields}
+
+
+class GenerationStats:
+    def __init__(self):
+        self.counts = {"generations": 0, "structured": 0, "fallback": 0, "parse_failures": 0}
+        self.generation_seconds = 0.0
+        self.wasted_seconds = 0.0
+        self.evals = {"generations": 0, "prompt_tokens": 0, "prompt_eval_seconds": 0.0, "eval_tokens": 0, "eval_seconds": 0.0}
+
+    def record_eval(self, response_data: Dict[str, Any]) -> None:
+        """Add the prompt/eval counts and durations (nanoseconds) of a finished Ollama generation."""
+        if "prompt_eval_duration" not in response_data and "eval_duration" not in response_data:
+            return
+        self.evals["generations"] += 1
+        self.evals["prompt_tokens"] += response_data.get("prompt_eval_count") or 0
+        self.evals["prompt_eval_seconds"] += (response_data.get("prompt_eval_duration") or 0) / 1e9
+        self.evals["eval_tokens"] += response_data.get("eval_count") or 0
+        self.evals["eval_seconds"] += (response_data.get("eval_duration") or 0) / 1e9
+
+    def parse(self, response_data: Dict[str, Any], model: type[BaseModel], fallback: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Parse an Ollama reply: structured JSON first, then `fallback`. Records the outcome along with the
+        generation time Ollama reports (total_duration, in nanoseconds). Re-raises the fallback's error.
+        """
+        seconds = (response_data.get("total_duration") or 0) / 1e9
+        self.counts["generations"] += 1
+        self.generation_seconds += seconds
+        self.record_eval(response_data)
+        try:
+            parsed = parse_structured_response(response_data.get("response") or "", model)
+            self.counts["structured"] += 1
+            return parsed
+        except ValueError:
+            pass
+        try:
+            parsed = fallback(response_data)
+        except Exception:
+            self.counts["parse_failures"] += 1
+            self.wasted_seconds += seconds
+            raise
+        self.counts["fallback"] += 1
+        return parsed
+
+    def summary(self) -> dict:
+        generations = self.counts["generations"]
+        usable = generations - self.counts["parse_failures"]
+        return {
+            **self.counts,
+            "parse_failure_rate": self.counts["parse_failures"] / generations if generations else 0.0,
+            "generation_seconds": round(self.generation_seconds, 3),
+            "wasted_generation_seconds": round(self.wasted_seconds, 3),
+            # Usable predictions per second of model time
+            "predictions_per_generation_second": usable / self.generation_seconds if self.generation_seconds else None,
+            "prompt_eval": self.eval_summary(),
+        }
+
+    def eval_summary(self) -> dict:
+        generations = self.evals["generations"]
+        return {
+            **{name: round(value, 3) if isinstance(value, float) else value for name, value in self.evals.items()},
+            "avg_prompt_tokens": self.evals["prompt_tokens"] / generations if generations else None,
+            "avg_prompt_eval_seconds": self.evals["prompt_eval_seconds"] / generations if generations else None,
+            "eval_tokens_per_second": self.evals["eval_tokens"] / self.evals["eval_seconds"] if self.evals["eval_seconds"] else None,
+        }
+
+
+generation_stats = GenerationStats()
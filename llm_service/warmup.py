@@ -0,0 +1,124 @@
+"""
+Model warm-up, keep-alive pinning and readiness.
+
+On start the service asks Ollama for a one-token generation of OLLAMA_MODEL. That loads the model
+and times the first token. Warm-up repeats until a token arrives within
+OLLAMA_READY_FIRST_TOKEN_SECONDS, and /ready answers 503 until then. The attempt that loaded the
+model is retried right away; failures wait OLLAMA_WARMUP_RETRY_SECONDS.
+
+Once ready, an empty-prompt request every OLLAMA_KEEPALIVE_INTERVAL_SECONDS renews keep_alive so
+Ollama never unloads the model. Before renewing, Ollama's /api/ps is asked whether the model is
+still loaded. If it was unloaded anyway (memory pressure, an Ollama restart), or Ollama can't be
+reached, the service reports not ready and warms up again.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+import httpx
+
+from .config import settings
+from .http_clients import get_client
+from .logger import logger
+
+WARMUP_PROMPT = "Reply with OK."
+
+
+class ModelWarmer:
+    def __init__(self):
+        self._started = time.monotonic()
+        self._just_loaded = False
+        self.state: Dict[str, Any] = {
+            "ready": False,
+            "loaded": False,
+            "attempts": 0,
+            "load_seconds": None,
+            "first_token_seconds": None,
+            "warmup_seconds": None,
+            "warmed_at": None,
+            "last_keepalive_at": None,
+            "last_error": None,
+        }
+
+    async def _generate(self, payload: dict) -> Tuple[dict, float]:
+        started = time.perf_counter()
+        response = await get_client("ollama").post(
+            settings.OLLAMA_API_URL,
+            json={"model": settings.OLLAMA_MODEL, "stream": False, "keep_alive": settings.OLLAMA_KEEP_ALIVE, **payload},
+        )
+        response.raise_for_status()
+        return response.json(), time.perf_counter() - started
+
+    async def _resident(self) -> bool:
+        """Whether Ollama's /api/ps lists OLLAMA_MODEL among the loaded models."""
+        url = settings.OLLAMA_API_URL.rsplit("/api/", 1)[0] + "/api/ps"
+        response = await get_client("ollama").get(url)
+        response.raise_for_status()
+        names = {entry.get(field) for entry in response.json().get("models", []) for field in ("name", "model")}
+        # Ollama reports an untagged model name with its :latest tag
+        return settings.OLLAMA_MODEL in names or f"{settings.OLLAMA_MODEL}:latest" in names
+
+    def _unavailable(self, error: Exception) -> None:
+        self.state.update(ready=False, loaded=False, last_error=str(error) or type(error).__name__)
+
+    async def warm_up(self) -> bool:
+        """One warm-up generation. True when its first token came fast enough to take traffic."""
+        self.state["attempts"] += 1
+        try:
+            data, seconds = await self._generate({"prompt": WARMUP_PROMPT, "options": {"num_predict": 1}})
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Warm-up of {settings.OLLAMA_MODEL} failed: {str(e)}")
+            self._unavailable(e)
+            return False
+        load_seconds = (data.get("load_duration") or 0) / 1e9
+        self._just_loaded = load_seconds > settings.OLLAMA_READY_FIRST_TOKEN_SECONDS
+        self.state.update(loaded=True, first_token_seconds=round(seconds, 3), last_error=None)
+        if self._just_loaded or self.state["load_seconds"] is None:
+            self.state["load_seconds"] = round(load_seconds, 3)
+        if seconds > settings.OLLAMA_READY_FIRST_TOKEN_SECONDS:
+            logger.info(f"{settings.OLLAMA_MODEL} loaded, first token took {seconds:.1f}s; not ready yet")
+            return False
+        self.state.update(ready=True, warmed_at=datetime.utcnow().isoformat(), warmup_seconds=round(time.monotonic() - self._started, 3))
+        logger.info(f"{settings.OLLAMA_MODEL} warm: first token in {seconds:.2f}s, ready {self.state['warmup_seconds']:.1f}s after start")
+        return True
+
+    async def keep_alive(self) -> bool:
+        """
+        Check that the model is still loaded, then renew keep_alive with an empty prompt. False when
+        the model was unloaded or Ollama can't be reached.
+        """
+        try:
+            resident = await self._resident()
+            if resident:
+                await self._generate({"prompt": ""})
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Keep-alive for {settings.OLLAMA_MODEL} failed, warming up again: {str(e)}")
+            self._unavailable(e)
+            return False
+        if not resident:
+            logger.warning(f"{settings.OLLAMA_MODEL} is no longer loaded in Ollama, warming up again")
+            self._unavailable(LookupError(f"{settings.OLLAMA_MODEL} was unloaded"))
+            return False
+        self.state["last_keepalive_at"] = datetime.utcnow().isoformat()
+        return True
+
+    async def run(self) -> None:
+        self._started = time.monotonic()
+        while True:
+            if self.state["ready"]:
+                await asyncio.sleep(settings.OLLAMA_KEEPALIVE_INTERVAL_SECONDS)
+                if not await self.keep_alive():
+                    self._started = time.monotonic()
+            elif not await self.warm_up():
+                await asyncio.sleep(0 if self._just_loaded else settings.OLLAMA_WARMUP_RETRY_SECONDS)
+
+    def summary(self) -> dict:
+        return {
+            "status": "ready" if self.state["ready"] else "warming_up" if self.state["loaded"] else "unavailable",
+            "model": settings.OLLAMA_MODEL,
+            **self.state,
+        }
+
+
+model_warmer = ModelWarmer()
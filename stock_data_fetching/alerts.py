@@ -0,0 +1,215 @@
+"""
+Threshold alerts on watchlisted symbols.
+
+Rules live in an inverted index keyed by symbol. When a symbol's latest snapshot is computed
+(every /fetch without a date), only that symbol's rules are evaluated, as one vectorized
+comparison over arrays of metric positions, operators and thresholds. Alerts are edge-triggered:
+a rule fires when its condition becomes true and re-arms once it is false again.
+
+Rules are persisted as an append-only JSON-lines log of add/delete operations, compacted on load.
+"""
+import json
+import os
+import threading
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from stock_data_fetching.config import settings
+from stock_data_fetching.logger import logger
+
+OPS = (">", ">=", "<", "<=")
+
+# Numeric values of the technical_indicators and volume_features sections of /fetch
+ALERT_METRICS = (
+    "latest_close", "previous_close", "open", "high", "low", "volume",
+    "sma_5", "ema_5", "macd", "macd_signal", "macd_hist", "bb_upper", "bb_middle", "bb_lower", "rsi",
+    "latest_volume", "volume_avg", "volume_sma", "volume_ratio", "obv",
+)
+
+
+def snapshot_metrics(sections: dict) -> Dict[str, float]:
+    """Flatten the numeric values of the /fetch sections alerts can watch."""
+    metrics = {}
+    for section in ("technical_indicators", "volume_features"):
+        for name, value in (sections.get(section) or {}).items():
+            if name in ALERT_METRICS and isinstance(value, (int, float)) and not isinstance(value, bool):
+                metrics[name] = float(value)
+    return metrics
+
+
+class _SymbolRules:
+    """One symbol's rules as parallel arrays, rebuilt lazily after adds and deletes."""
+
+    def __init__(self):
+        self.rules: Dict[str, dict] = {}
+        self.armed: Dict[str, bool] = {}
+        self._compiled = None
+
+    def add(self, rule: dict) -> None:
+        self._sync_state()
+        self.rules[rule["id"]] = rule
+        self._compiled = None
+
+    def remove(self, rule_id: str) -> None:
+        self._sync_state()
+        self.rules.pop(rule_id, None)
+        self.armed.pop(rule_id, None)
+        self._compiled = None
+
+    def _sync_state(self) -> None:
+        # Carry the firing state of compiled rules over a rebuild
+        if self._compiled is not None:
+            ids, *_, active = self._compiled
+            self.armed.update(zip(ids, active.tolist()))
+
+    def compiled(self):
+        if self._compiled is None:
+            ids = list(self.rules)
+            metric_names = sorted({self.rules[i]["metric"] for i in ids})
+            position = {name: n for n, name in enumerate(metric_names)}
+            self._compiled = (
+                ids,
+                metric_names,
+                np.array([position[self.rules[i]["metric"]] for i in ids], dtype=np.int32),
+                np.array([OPS.index(self.rules[i]["op"]) for i in ids], dtype=np.int8),
+                np.array([self.rules[i]["threshold"] for i in ids], dtype=float),
+                np.array([self.armed.get(i, False) for i in ids], dtype=bool),
+            )
+        return self._compiled
+
+
+class AlertEngine:
+    def __init__(self, path: Optional[str] = None, history_limit: int = 100):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_symbol: Dict[str, _SymbolRules] = defaultdict(_SymbolRules)
+        self._by_id: Dict[str, dict] = {}
+        self._by_user: Dict[str, set] = defaultdict(set)
+        self._triggered: Dict[str, deque] = defaultdict(lambda: deque(maxlen=history_limit))
+        if path:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["op"] == "add":
+                        self._index(entry["rule"])
+                    else:
+                        self._unindex(entry["id"])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not load alert rules from {self.path}: {str(e)}")
+        self._compact()
+        logger.info(f"Loaded {len(self._by_id)} alert rules")
+
+    def _compact(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            for rule in self._by_id.values():
+                f.write(json.dumps({"op": "add", "rule": rule}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def _append(self, entry: dict) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _index(self, rule: dict) -> None:
+        self._by_id[rule["id"]] = rule
+        self._by_user[rule["user_id"]].add(rule["id"])
+        self._by_symbol[rule["symbol"]].add(rule)
+
+    def _unindex(self, rule_id: str) -> Optional[dict]:
+        rule = self._by_id.pop(rule_id, None)
+        if rule is None:
+            return None
+        self._by_user[rule["user_id"]].discard(rule_id)
+        rules = self._by_symbol[rule["symbol"]]
+        rules.remove(rule_id)
+        if not rules.rules:
+            del self._by_symbol[rule["symbol"]]
+        return rule
+
+    def add_rule(self, user_id: str, symbol: str, metric: str, op: str, threshold: float) -> dict:
+        if metric not in ALERT_METRICS:
+            raise ValueError(f"Unknown metric '{metric}'. Available: {', '.join(ALERT_METRICS)}")
+        if op not in OPS:
+            raise ValueError(f"Unknown operator '{op}'. Use one of {', '.join(OPS)}")
+        rule = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "symbol": symbol.upper(),
+            "metric": metric,
+            "op": op,
+            "threshold": float(threshold),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with self._lock:
+            self._index(rule)
+            self._append({"op": "add", "rule": rule})
+        return rule
+
+    def remove_rule(self, rule_id: str, user_id: Optional[str] = None) -> bool:
+        """Delete a rule; with user_id, only if it belongs to that user."""
+        with self._lock:
+            rule = self._by_id.get(rule_id)
+            if rule is None or (user_id is not None and rule["user_id"] != user_id):
+                return False
+            self._unindex(rule_id)
+            self._append({"op": "delete", "id": rule_id})
+        return True
+
+    def rules_for_user(self, user_id: str) -> List[dict]:
+        with self._lock:
+            return sorted((self._by_id[i] for i in self._by_user.get(user_id, ())), key=lambda r: r["created_at"])
+
+    def triggered_for_user(self, user_id: str) -> List[dict]:
+        with self._lock:
+            return list(self._triggered.get(user_id, ()))
+
+    def evaluate(self, symbol: str, metrics: Dict[str, float]) -> List[dict]:
+        """Evaluate one symbol's rules against its latest metrics; returns the alerts that fired."""
+        symbol = symbol.upper()
+        with self._lock:
+            rules = self._by_symbol.get(symbol)
+            if rules is None:
+                return []
+            ids, metric_names, metric_pos, ops, thresholds, active = rules.compiled()
+            values = np.array([metrics.get(name, np.nan) for name in metric_names], dtype=float)[metric_pos]
+            hits = np.select(
+                [ops == 0, ops == 1, ops == 2, ops == 3],
+                [values > thresholds, values >= thresholds, values < thresholds, values <= thresholds],
+                default=False,
+            )
+            # A metric missing from this snapshot (e.g. a sparse /fetch) leaves its rules' state alone
+            known = ~np.isnan(values)
+            fired_at = np.flatnonzero(hits & known & ~active)
+            active[known] = hits[known]
+
+            now = datetime.now(timezone.utc).isoformat()
+            fired = []
+            for n in fired_at:
+                rule = rules.rules[ids[n]]
+                alert = {**{k: rule[k] for k in ("user_id", "symbol", "metric", "op", "threshold")},
+                         "rule_id": rule["id"], "value": float(values[n]), "triggered_at": now}
+                self._triggered[rule["user_id"]].append(alert)
+                fired.append(alert)
+        if fired:
+            logger.info(f"{len(fired)} alert(s) triggered for {symbol}")
+        return fired
+
+
+@lru_cache()
+def get_alert_engine() -> AlertEngine:
+    return AlertEngine(settings.ALERT_RULES_PATH, history_limit=settings.ALERT_HISTORY_LIMIT)
@@ -0,0 +1,343 @@
+"""
+Point-in-time snapshots for dated /fetch requests, built only from stored data.
+
+- Prices and indicators come from the local price store cut off at the date. RSI and the extended
+  indicators are computed locally rather than asking Alpha Vantage for today's value.
+- Fundamentals have the same keys as the live OVERVIEW-based section, recomputed from documents
+  known on the date: EARNINGS reports whose reportedDate is on or before it, and DIVIDENDS with an
+  ex-dividend date in the year up to it. The next earnings date and estimate are those of the first
+  report after the date. INCOME_STATEMENT and BALANCE_SHEET carry no filing date,
+  so a report counts as public a fixed lag after its fiscal period ends.
+- News is the NEWS_SENTIMENT articles published in the 7 days up to the end of the date,
+  downloaded once per window (time_from/time_to) and kept in the store.
+
+Sections are memoized per (symbol, date, section). Only dates before today are memoized,
+because today's bar and news are still changing, and never a date whose bar is still the provisional
+one from a live quote.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import requests
+
+from stock_data_fetching.calculate_indicators import (
+    add_technical_indicators, calculate_extended_indicators, calculate_rsi, indicator_snapshot,
+)
+from stock_data_fetching.calculate_volume_features import calculate_extended_volume_features, calculate_volume_features
+from stock_data_fetching.config import settings
+from stock_data_fetching.logger import logger
+from stock_data_fetching.news_features import advanced_sentiment_from_feed, summarize_news_feed
+from stock_data_fetching.price_store import get_price_history, provisional_session
+
+NEWS_DAYS = 7
+DOCUMENT_MAX_AGE_DAYS = 7
+DIVIDEND_WINDOW_DAYS = 365
+ANNUAL_FILING_LAG_DAYS = 90
+QUARTERLY_FILING_LAG_DAYS = 45
+# Undated /fetch computes volume features over fetch_price_data's default 30 sessions
+VOLUME_WINDOW = 30
+BETA_BENCHMARK = "SPY"
+BETA_WINDOW = 252
+
+
+class AsOfDataMissing(LookupError):
+    """The store has no bar for the requested symbol and date."""
+
+
+_memo: "OrderedDict[tuple, dict]" = OrderedDict()
+_lock = threading.Lock()
+# symbol -> lock held across one news store update (read, download, merge, write)
+_news_locks: Dict[str, threading.Lock] = {}
+
+
+def _store_path(*parts: str) -> str:
+    return os.path.join(settings.PRICE_STORE_DIR, *parts)
+
+
+def _read_json(path: str):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, data) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return None
+    return result if np.isfinite(result) else None
+
+
+def stored_document(symbol: str, function: str) -> dict:
+    """
+    A raw Alpha Vantage document (EARNINGS, INCOME_STATEMENT, BALANCE_SHEET, DIVIDENDS) for a symbol, downloaded
+    when missing or older than DOCUMENT_MAX_AGE_DAYS. A failed refresh keeps serving the stored copy.
+    """
+    path = _store_path("fundamentals", f"{symbol.upper()}_{function}.json")
+    try:
+        fresh = time.time() - os.path.getmtime(path) < DOCUMENT_MAX_AGE_DAYS * 86400
+    except OSError:
+        fresh = False
+    if fresh:
+        return _read_json(path) or {}
+
+    url = f"{settings.ALPHA_VANTAGE_BASE_URL}?function={function}&symbol={symbol}&apikey={settings.ALPHA_VANTAGE_API_KEY}"
+    try:
+        data = requests.get(url, timeout=30).json()
+    except Exception as e:
+        logger.error(f"Failed to download {function} for {symbol}: {str(e)}")
+        data = {}
+    if not isinstance(data, dict) or not data or "Information" in data or "Error Message" in data:
+        return _read_json(path) or {}
+    _write_json(path, data)
+    return data
+
+
+def stored_news(symbol: str, start: datetime, end: datetime) -> list:
+    """
+    NEWS_SENTIMENT articles for a symbol published in [start, end), newest first. Windows already
+    downloaded are recorded in the store, so each historical week is fetched once.
+    """
+    symbol = symbol.upper()
+    with _lock:
+        symbol_lock = _news_locks.setdefault(symbol, threading.Lock())
+    # Held until the merged store is written, so concurrent requests neither download the same
+    # window twice nor overwrite each other's articles
+    with symbol_lock:
+        store = _load_news(symbol, start, end)
+    lo, hi = f"{start:%Y%m%dT%H%M%S}", f"{end:%Y%m%dT%H%M%S}"
+    return [item for item in store["feed"] if lo <= item.get("time_published", "") < hi]
+
+
+def _load_news(symbol: str, start: datetime, end: datetime) -> dict:
+    """The symbol's news store, with [start, end) downloaded and merged in when not yet covered."""
+    path = _store_path("news", f"{symbol}.json")
+    store = _read_json(path) or {"windows": [], "feed": []}
+    covered = any(lo <= start.isoformat() and end.isoformat() <= hi for lo, hi in store["windows"])
+
+    if not covered:
+        url = (
+            f"{settings.ALPHA_VANTAGE_BASE_URL}?function=NEWS_SENTIMENT&tickers={symbol}"
+            f"&time_from={start:%Y%m%dT%H%M}&time_to={end:%Y%m%dT%H%M}&sort=LATEST&limit=1000"
+            f"&apikey={settings.ALPHA_VANTAGE_API_KEY}"
+        )
+        try:
+            data = requests.get(url, timeout=30).json()
+        except Exception as e:
+            logger.error(f"Failed to download news for {symbol}: {str(e)}")
+            data = {}
+        if isinstance(data, dict) and "feed" in data:
+            articles = {item.get("url") or item.get("title"): item for item in store["feed"]}
+            articles.update({item.get("url") or item.get("title"): item for item in data["feed"]})
+            store["feed"] = sorted(articles.values(), key=lambda item: item.get("time_published", ""), reverse=True)
+            # A window that reaches into the future can still gain articles, so it isn't marked complete
+            if end <= datetime.utcnow():
+                store["windows"].append([start.isoformat(), end.isoformat()])
+            _write_json(path, store)
+        else:
+            logger.warning(f"No stored or downloadable news for {symbol} between {start} and {end}")
+    return store
+
+
+def _public_reports(document: dict, key: str, as_of: date, lag_days: int) -> list:
+    """Statement reports assumed public by `as_of` (fiscal period end + lag), newest first."""
+    cutoff = (as_of - timedelta(days=lag_days)).isoformat()
+    reports = [r for r in document.get(key, []) if r.get("fiscalDateEnding") and r["fiscalDateEnding"] <= cutoff]
+    return sorted(reports, key=lambda r: r["fiscalDateEnding"], reverse=True)
+
+
+def _reported_earnings(symbol: str, as_of: date) -> list:
+    quarterly = stored_document(symbol, "EARNINGS").get("quarterlyEarnings", [])
+    reported = [q for q in quarterly if q.get("reportedDate") and q["reportedDate"] <= as_of.isoformat()]
+    return sorted(reported, key=lambda q: q["reportedDate"], reverse=True)
+
+
+def _next_earnings(symbol: str, as_of: date) -> dict:
+    """The first EARNINGS report after `as_of`, i.e. the one that was upcoming on that date."""
+    quarterly = stored_document(symbol, "EARNINGS").get("quarterlyEarnings", [])
+    upcoming = [q for q in quarterly if q.get("reportedDate") and q["reportedDate"] > as_of.isoformat()]
+    return min(upcoming, key=lambda q: q["reportedDate"]) if upcoming else {}
+
+
+def _eps_ttm(reported: list) -> Optional[float]:
+    values = [_to_float(q.get("reportedEPS")) for q in reported[:4]]
+    if len(values) < 4 or any(v is None for v in values):
+        return None
+    return float(sum(values))
+
+
+def _beta(frame: pd.DataFrame) -> Optional[float]:
+    benchmark = get_price_history(BETA_BENCHMARK)
+    if benchmark.empty:
+        return None
+    closes = pd.concat({
+        "asset": frame.set_index("date")["adjusted_close"],
+        "benchmark": benchmark.set_index("date")["adjusted_close"],
+    }, axis=1).dropna()
+    closes = closes[closes.index <= frame["date"].iloc[-1]].astype(float)
+    returns = closes.tail(BETA_WINDOW + 1).pct_change().dropna()
+    if len(returns) < 20:
+        return None
+    cov = np.cov(returns["asset"], returns["benchmark"])
+    return _to_float(cov[0, 1] / cov[1, 1]) if cov[1, 1] > 0 else None
+
+
+def _dividend_yield(symbol: str, as_of: date, close: float) -> Optional[float]:
+    """Dividends with an ex-date in the year up to `as_of` over the close, the fraction OVERVIEW's DividendYield reports."""
+    document = stored_document(symbol, "DIVIDENDS")
+    if "data" not in document or not close:
+        return None
+    start = (as_of - timedelta(days=DIVIDEND_WINDOW_DAYS)).isoformat()
+    amounts = [
+        _to_float(d.get("amount")) for d in document["data"]
+        if start < (d.get("ex_dividend_date") or "") <= as_of.isoformat()
+    ]
+    return sum(amount for amount in amounts if amount) / close
+
+
+def _technical_indicators(symbol: str, as_of: date, frame: pd.DataFrame) -> dict:
+    with_indicators = add_technical_indicators(frame.copy())
+    snapshot = indicator_snapshot(with_indicators, with_indicators.iloc[-1])
+    # fetch_rsi reports 0.0 when it has no value; keep the same convention
+    snapshot["rsi"] = calculate_rsi(frame["close"]) or 0.0
+    return snapshot
+
+
+def _volume_features(symbol: str, as_of: date, frame: pd.DataFrame) -> dict:
+    return calculate_volume_features(frame.tail(VOLUME_WINDOW))
+
+
+def _fundamentals(symbol: str, as_of: date, frame: pd.DataFrame) -> dict:
+    close = float(frame["close"].iloc[-1])
+    reported = _reported_earnings(symbol, as_of)
+    eps_ttm = _eps_ttm(reported)
+    balance = _public_reports(stored_document(symbol, "BALANCE_SHEET"), "quarterlyReports", as_of, QUARTERLY_FILING_LAG_DAYS)
+    shares = _to_float(balance[0].get("commonStockSharesOutstanding")) if balance else None
+    upcoming = _next_earnings(symbol, as_of)
+    # Same keys as the live section; TTM EPS is served as extended_fundamentals.eps
+    return {
+        "market_cap": int(shares * close) if shares else None,
+        "pe_ratio": close / eps_ttm if eps_ttm and eps_ttm > 0 else None,
+        "dividend_yield": _dividend_yield(symbol, as_of, close),
+        "beta": _beta(frame),
+        "next_earnings_date": upcoming.get("reportedDate"),
+        "next_earnings_estimate": _to_float(upcoming.get("estimatedEPS")),
+    }
+
+
+def _extended_fundamentals(symbol: str, as_of: date, frame: pd.DataFrame) -> dict:
+    income = stored_document(symbol, "INCOME_STATEMENT")
+    balance = stored_document(symbol, "BALANCE_SHEET")
+    annual_income = _public_reports(income, "annualReports", as_of, ANNUAL_FILING_LAG_DAYS)
+    quarterly_income = _public_reports(income, "quarterlyReports", as_of, QUARTERLY_FILING_LAG_DAYS)[:4]
+    annual_balance = _public_reports(balance, "annualReports", as_of, ANNUAL_FILING_LAG_DAYS)
+    quarterly_balance = _public_reports(balance, "quarterlyReports", as_of, QUARTERLY_FILING_LAG_DAYS)
+
+    revenue_growth = None
+    if len(annual_income) >= 2:
+        latest_revenue = _to_float(annual_income[0].get("totalRevenue"))
+        previous_revenue = _to_float(annual_income[1].get("totalRevenue"))
+        if latest_revenue is not None and previous_revenue:
+            revenue_growth = (latest_revenue - previous_revenue) / previous_revenue
+
+    debt_equity_ratio = None
+    if annual_balance:
+        liabilities = _to_float(annual_balance[0].get("totalLiabilities"))
+        equity = _to_float(annual_balance[0].get("totalShareholderEquity"))
+        if liabilities is not None and equity and equity > 0:
+            debt_equity_ratio = liabilities / equity
+
+    def ttm(field: str) -> Optional[float]:
+        values = [_to_float(report.get(field)) for report in quarterly_income]
+        return float(sum(values)) if len(values) == 4 and None not in values else None
+
+    revenue_ttm, net_income_ttm, operating_income_ttm = ttm("totalRevenue"), ttm("netIncome"), ttm("operatingIncome")
+    equity = _to_float(quarterly_balance[0].get("totalShareholderEquity")) if quarterly_balance else None
+    return {
+        "eps": _eps_ttm(_reported_earnings(symbol, as_of)),
+        "revenue_growth_yoy": revenue_growth,
+        "roe": net_income_ttm / equity if net_income_ttm is not None and equity and equity > 0 else None,
+        "debt_equity_ratio": debt_equity_ratio,
+        "operating_margin_ttm": operating_income_ttm / revenue_ttm if operating_income_ttm is not None and revenue_ttm else None,
+    }
+
+
+def _news_window(as_of: date):
+    end = datetime.combine(as_of + timedelta(days=1), datetime.min.time())
+    return end - timedelta(days=NEWS_DAYS), end
+
+
+def _news_sentiment(symbol: str, as_of: date, frame: pd.DataFrame) -> dict:
+    return summarize_news_feed(stored_news(symbol, *_news_window(as_of)))
+
+
+def _advanced_news_sentiment(symbol: str, as_of: date, frame: pd.DataFrame) -> dict:
+    start, end = _news_window(as_of)
+    result = advanced_sentiment_from_feed(stored_news(symbol, start, end), symbol, start, end)
+    # NaN is not valid JSON; report missing values as null
+    return {key: None if isinstance(value, float) and np.isnan(value) else value for key, value in result.items()}
+
+
+SECTION_BUILDERS = {
+    "technical_indicators": _technical_indicators,
+    "volume_features": _volume_features,
+    "fundamentals": _fundamentals,
+    "news_sentiment": _news_sentiment,
+    "advanced_news_sentiment": _advanced_news_sentiment,
+    "extended_fundamentals": _extended_fundamentals,
+    "technical_indicators_ext": lambda symbol, as_of, frame: calculate_extended_indicators(frame),
+    "volume_features_ext": lambda symbol, as_of, frame: calculate_extended_volume_features(frame),
+}
+
+
+def price_frame(symbol: str, as_of: date) -> pd.DataFrame:
+    """Stored daily bars up to and including `as_of`, which must itself be a stored session."""
+    history = get_price_history(symbol)
+    history = history[history["date"] <= as_of].reset_index(drop=True) if not history.empty else history
+    if history.empty or history["date"].iloc[-1] != as_of:
+        raise AsOfDataMissing(f"No data found for {symbol} specifically on {as_of}")
+    return history
+
+
+def as_of_sections(symbol: str, as_of: date, sections: Iterable[str]) -> dict:
+    """The requested /fetch sections for `symbol` as they would have looked at the close of `as_of`."""
+    symbol = symbol.upper()
+    results, missing = {}, []
+    with _lock:
+        for section in sections:
+            key = (symbol, as_of, section)
+            if key in _memo:
+                _memo.move_to_end(key)
+                results[section] = _memo[key]
+            else:
+                missing.append(section)
+    if not missing:
+        return results
+
+    frame = price_frame(symbol, as_of)
+    cacheable = as_of < datetime.utcnow().date() and provisional_session(symbol) != as_of
+    for section in missing:
+        results[section] = SECTION_BUILDERS[section](symbol, as_of, frame)
+        if cacheable:
+            with _lock:
+                _memo[(symbol, as_of, section)] = results[section]
+                while len(_memo) > settings.AS_OF_CACHE_SIZE:
+                    _memo.popitem(last=False)
+    return results
@@ -0,0 +1,192 @@
+"""
+Watchlist price refresh through Alpha Vantage REALTIME_BULK_QUOTES.
+
+Up to BULK_QUOTE_LIMIT symbols share one upstream call. Each quote becomes the provisional bar for
+its session in the price store, which is served but never written as a stored bar; the provider's
+final daily bar takes its place once the session has closed. The technical_indicators
+snapshot is then updated incrementally: the state at the previous session's close (the last
+SMA/Bollinger window, EMA-5, the MACD EMAs and signal) is computed once per symbol and session,
+and every later quote costs O(1) arithmetic on top of it. That state is only used when the stored
+history ends at the session right before the quote; otherwise the history is topped up first, and
+a symbol still missing that session is returned without indicators.
+"""
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+from stock_data_fetching.calculate_indicators import add_technical_indicators
+from stock_data_fetching.config import settings
+from stock_data_fetching.logger import logger
+from stock_data_fetching.price_store import get_price_history, load_history, set_provisional_bar
+
+BULK_QUOTE_LIMIT = 100
+# /fetch computes indicators over fetch_price_data's default 30 sessions; match it so values agree
+INDICATOR_WINDOW = 30
+SMA_LENGTH = 5
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BAR_FIELDS = ("date", "open", "high", "low", "close", "adjusted_close", "volume")
+
+
+def chunked(symbols: List[str], size: int = BULK_QUOTE_LIMIT) -> Iterable[List[str]]:
+    for start in range(0, len(symbols), size):
+        yield symbols[start:start + size]
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_bulk_quotes(symbols: List[str], api_key: str) -> Dict[str, dict]:
+    """Latest quote per symbol for up to BULK_QUOTE_LIMIT symbols in one call. Symbols without a quote are left out."""
+    url = f"https://www.alphavantage.co/query?function=REALTIME_BULK_QUOTES&symbol={','.join(symbols)}&apikey={api_key}"
+    try:
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        payload = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Bulk quote request failed for {len(symbols)} symbols: {str(e)}")
+        return {}
+    if "data" not in payload:
+        # Premium endpoint notes and rate limits come back as Information/Note messages
+        logger.warning(f"Bulk quote response without data: {str(payload)[:300]}")
+        return {}
+
+    quotes = {}
+    for item in payload["data"]:
+        symbol = str(item.get("symbol", "")).upper()
+        close = _number(item.get("close"))
+        timestamp = pd.to_datetime(item.get("timestamp"), errors="coerce")
+        if not symbol or close is None or pd.isna(timestamp):
+            continue
+        quotes[symbol] = {
+            "date": timestamp.date(),
+            "open": _number(item.get("open")) or close,
+            "high": _number(item.get("high")) or close,
+            "low": _number(item.get("low")) or close,
+            "close": close,
+            "adjusted_close": close,
+            "volume": int(_number(item.get("volume")) or 0),
+            "previous_close": _number(item.get("previous_close")),
+        }
+    return quotes
+
+
+def fetch_quotes(symbols: List[str], api_key: str = None) -> Dict[str, dict]:
+    """
+    Quotes for `symbols` with one bulk call per BULK_QUOTE_LIMIT symbols. Each quote is kept as its
+    symbol's provisional bar in the price store.
+    """
+    api_key = api_key or settings.ALPHA_VANTAGE_API_KEY
+    requested = set(symbols)
+    quotes = {}
+    for chunk in chunked(symbols):
+        for symbol, quote in fetch_bulk_quotes(chunk, api_key).items():
+            if symbol not in requested:
+                continue
+            set_provisional_bar(symbol, {key: quote[key] for key in BAR_FIELDS})
+            quotes[symbol] = quote
+    return quotes
+
+
+class IncrementalIndicators:
+    """technical_indicators snapshots for a new last bar, from the state at the previous session's close."""
+
+    def __init__(self, base: pd.DataFrame):
+        base = base.tail(INDICATOR_WINDOW - 1).reset_index(drop=True)
+        self.base_date = base["date"].iloc[-1]
+        closes = base["close"].astype(float)
+        last = add_technical_indicators(base.copy()).iloc[-1]
+        self.window = closes.tail(SMA_LENGTH - 1).to_numpy()
+        self.previous_close = float(closes.iloc[-1])
+        self.ema_5 = float(last["ema_5"])
+        self.ema_fast = float(closes.ewm(span=MACD_FAST, adjust=False).mean().iloc[-1])
+        self.ema_slow = float(closes.ewm(span=MACD_SLOW, adjust=False).mean().iloc[-1])
+        self.macd_signal = float(last["macd_signal"])
+
+    @staticmethod
+    def _ema(previous: float, value: float, span: int) -> float:
+        return previous + 2.0 / (span + 1) * (value - previous)
+
+    def snapshot(self, bar: dict) -> dict:
+        close = float(bar["close"])
+        window = np.append(self.window, close)
+        sma = float(window.mean())
+        std = float(window.std())
+        macd = self._ema(self.ema_fast, close, MACD_FAST) - self._ema(self.ema_slow, close, MACD_SLOW)
+        signal = self._ema(self.macd_signal, macd, MACD_SIGNAL)
+        return {
+            "latest_close": close,
+            "sma_5": sma,
+            "ema_5": self._ema(self.ema_5, close, SMA_LENGTH),
+            "macd": macd,
+            "macd_signal": signal,
+            "macd_hist": macd - signal,
+            "bb_upper": sma + 2 * std,
+            "bb_middle": sma,
+            "bb_lower": sma - 2 * std,
+            "open": float(bar["open"]),
+            "high": float(bar["high"]),
+            "low": float(bar["low"]),
+            "volume": float(bar["volume"]),
+            "previous_close": self.previous_close,
+        }
+
+
+# symbol -> IncrementalIndicators for the session before the latest quote
+_states: Dict[str, IncrementalIndicators] = {}
+_lock = threading.Lock()
+
+
+def _previous_session(day) -> date:
+    """The weekday before `day`, the price store's notion of the previous session."""
+    return (pd.Timestamp(day) - pd.offsets.BDay(1)).date()
+
+
+def _indicator_state(symbol: str, history: pd.DataFrame, quote_date) -> Optional[IncrementalIndicators]:
+    """
+    The cached state at the close of the session before `quote_date`, rebuilt only when that session
+    changes. None when `history` doesn't end at that session, as indicators would skip the gap.
+    """
+    base = history[history["date"] < quote_date]
+    if len(base) < SMA_LENGTH or base["date"].iloc[-1] != _previous_session(quote_date):
+        return None
+    with _lock:
+        state = _states.get(symbol)
+    if state is None or state.base_date != base["date"].iloc[-1]:
+        state = IncrementalIndicators(base)
+        with _lock:
+            _states[symbol] = state
+    return state
+
+
+def refresh_quotes(symbols: List[str], api_key: str = None) -> Tuple[Dict[str, dict], List[str]]:
+    """
+    Refresh the latest bar for `symbols` with one bulk call per BULK_QUOTE_LIMIT symbols.
+    Returns ({symbol: technical_indicators snapshot}, symbols without a quote).
+    """
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols))
+    quotes = fetch_quotes(symbols, api_key)
+
+    snapshots = {}
+    for symbol, quote in quotes.items():
+        state = _indicator_state(symbol, load_history(symbol), quote["date"])
+        if state is None:
+            # Top the store up (throttled like any other read) and retry before giving up on indicators
+            history = get_price_history(symbol)
+            # The top-up may have set the provider's in-progress bar; the quote is newer
+            set_provisional_bar(symbol, {key: quote[key] for key in BAR_FIELDS})
+            state = _indicator_state(symbol, history, quote["date"])
+        if state is None:
+            snapshots[symbol] = {"latest_close": quote["close"], "previous_close": quote["previous_close"] or quote["close"]}
+            continue
+        snapshots[symbol] = state.snapshot(quote)
+    missing = [s for s in symbols if s not in snapshots]
+    logger.info(f"Bulk quote refresh: {len(snapshots)} of {len(symbols)} symbols in {len(list(chunked(symbols)))} calls")
+    return snapshots, missing
@@ -97,7 +97,12 @@ def calculate_macd(close_prices: pd.Series, fast=12, slow=26, signal=9) -> pd.Da
         'MACDh_12_26_9': histogram
     })
 
-def add_technical_indicators(df: pd.DataFrame) -> pd.DataFrame:
+def add_technical_indicators(df: pd.DataFrame, fill: bool = True) -> pd.DataFrame:
+    """
+    Add SMA/EMA, MACD and Bollinger Band columns. With `fill`, warm-up gaps are forward/back-filled
+    (fine for a latest-value snapshot); pass fill=False to keep them NaN, e.g. for training data,
+    where back-filling would copy later values into earlier rows.
+    """
     # Calculate SMA and EMA
     df["sma_5"] = ta.sma(df["close"], length=5)
     df["ema_5"] = ta.ema(df["close"], length=5)
@@ -132,7 +137,8 @@ def add_technical_indicators(df: pd.DataFrame) -> pd.DataFrame:
         df["bb_lower"] = np.nan
     
     # Fill NaN values using forward and backward fill
-    df = df.ffill().bfill().fillna(0)
+    if fill:
+        df = df.ffill().bfill().fillna(0)
     
     print("\n=== Technical Indicators ===")
     print("Latest values:")
@@ -144,4 +150,69 @@ def add_technical_indicators(df: pd.DataFrame) -> pd.DataFrame:
     print(f"MACD Histogram: {latest['macd_hist']:.2f}")
     print(f"Bollinger Bands - Upper: {latest['bb_upper']:.2f}, Middle: {latest['bb_middle']:.2f}, Lower: {latest['bb_lower']:.2f}")
     
-    return df
\ No newline at end of file
+    return df
+
+
+def indicator_snapshot(df_with_indicators: pd.DataFrame, latest_indicators_row: pd.Series) -> dict:
+    """The technical_indicators values of one row of add_technical_indicators output (RSI not included)."""
+    technical_indicators = {
+        "latest_close": float(latest_indicators_row["close"]),
+        "sma_5": float(latest_indicators_row["sma_5"]) if pd.notna(latest_indicators_row["sma_5"]) else 0.0,
+        "ema_5": float(latest_indicators_row["ema_5"]) if pd.notna(latest_indicators_row["ema_5"]) else 0.0,
+        "macd": float(latest_indicators_row["macd"]) if pd.notna(latest_indicators_row["macd"]) else 0.0,
+        "macd_signal": float(latest_indicators_row["macd_signal"]) if pd.notna(latest_indicators_row["macd_signal"]) else 0.0,
+        "macd_hist": float(latest_indicators_row["macd_hist"]) if pd.notna(latest_indicators_row["macd_hist"]) else 0.0,
+        "bb_upper": float(latest_indicators_row["bb_upper"]) if pd.notna(latest_indicators_row["bb_upper"]) else 0.0,
+        "bb_middle": float(latest_indicators_row["bb_middle"]) if pd.notna(latest_indicators_row["bb_middle"]) else 0.0,
+        "bb_lower": float(latest_indicators_row["bb_lower"]) if pd.notna(latest_indicators_row["bb_lower"]) else 0.0,
+        "open": float(latest_indicators_row["open"]) if "open" in latest_indicators_row and pd.notna(latest_indicators_row["open"]) else latest_indicators_row.get("close"),
+        "high": float(latest_indicators_row["high"]) if "high" in latest_indicators_row and pd.notna(latest_indicators_row["high"]) else latest_indicators_row.get("close"),
+        "low": float(latest_indicators_row["low"]) if "low" in latest_indicators_row and pd.notna(latest_indicators_row["low"]) else latest_indicators_row.get("close"),
+        "volume": float(latest_indicators_row["volume"]) if "volume" in latest_indicators_row and pd.notna(latest_indicators_row["volume"]) else 0.0,
+    }
+    # Add previous_close for frontend price change calculation
+    try:
+        if len(df_with_indicators) > 1:
+            technical_indicators["previous_close"] = float(df_with_indicators.iloc[-2]["close"])
+        else:
+            technical_indicators["previous_close"] = float(latest_indicators_row["close"])
+    except Exception:
+        technical_indicators["previous_close"] = float(latest_indicators_row["close"])
+    return technical_indicators
+
+def _latest(output, prefix: str = ""):
+    """Last value of a pandas_ta result (or of its first column starting with `prefix`); None if unavailable."""
+    if output is None or len(output) == 0:
+        return None
+    if isinstance(output, pd.DataFrame):
+        columns = [c for c in output.columns if c.startswith(prefix)]
+        if not columns:
+            return None
+        output = output[columns[0]]
+    value = output.iloc[-1]
+    return float(value) if pd.notna(value) else None
+
+def calculate_rsi(close_prices: pd.Series, length: int = 14):
+    """Latest Wilder RSI, the local counterpart of fetch_rsi."""
+    return _latest(ta.rsi(close_prices, length=length))
+
+def calculate_extended_indicators(df: pd.DataFrame) -> dict:
+    """
+    Local counterparts of fetch_aroon, fetch_adx, fetch_stoch, fetch_cci and fetch_psar for the
+    last row of a price history, with the same parameters and response keys.
+    """
+    high, low, close = df["high"], df["low"], df["close"]
+    aroon = ta.aroon(high, low, length=14)
+    stoch = ta.stoch(high, low, close, k=14, d=3, smooth_k=3)
+    psar = ta.psar(high, low, close, af0=0.02, af=0.02, max_af=0.2)
+    # pandas_ta splits PSAR into long and short columns; only one is set on any row
+    psar_value = _latest(psar, "PSARl")
+    if psar_value is None:
+        psar_value = _latest(psar, "PSARs")
+    return {
+        "aroon": {"aroon down": _latest(aroon, "AROOND"), "aroon up": _latest(aroon, "AROONU")},
+        "adx": {"adx": _latest(ta.adx(high, low, close, length=14), "ADX")},
+        "stoch": {"slowk": _latest(stoch, "STOCHk"), "slowd": _latest(stoch, "STOCHd")},
+        "cci": {"cci": _latest(ta.cci(high, low, close, length=20))},
+        "psar": {"psar": psar_value},
+    }
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import requests
 
@@ -41,6 +42,20 @@ def fetch_adl(symbol: str, api_key: str) -> dict:
         return {}
 
 
+def volume_feature_series(df: pd.DataFrame, window: int = 20) -> pd.DataFrame:
+    """Per-row volume features over a price history (the time-series counterpart of calculate_volume_features)."""
+    volume = df["volume"].astype(float)
+    # Average of the *previous* `window` sessions, matching how the snapshot features exclude the latest bar
+    volume_sma = volume.shift(1).rolling(window, min_periods=1).mean()
+    direction = np.sign(df["close"].diff().fillna(0.0))
+    return pd.DataFrame({
+        "volume_sma": volume_sma,
+        "volume_ratio": (volume / volume_sma).replace([np.inf, -np.inf], np.nan),
+        "volume_spike": (volume > 1.5 * volume_sma).astype(float),
+        "obv": (direction * volume).cumsum(),
+    }, index=df.index)
+
+
 def calculate_volume_features(df: pd.DataFrame) -> dict:
     """Calculates volume-based features from a DataFrame of historical price data."""
     if df.empty:
@@ -85,4 +100,18 @@ def calculate_volume_features(df: pd.DataFrame) -> dict:
     print(f"Volume Spike Detected: {volume_spike}")
     print(f"On-Balance Volume (OBV): {obv:,}")
     
-    return features 
\ No newline at end of file
+    return features
+
+
+def calculate_extended_volume_features(df: pd.DataFrame, window: int = 20) -> dict:
+    """Local counterparts of fetch_chaikin_money_flow and fetch_adl for the last row of a price history."""
+    high, low, close, volume = (df[c].astype(float) for c in ("high", "low", "close", "volume"))
+    price_range = (high - low).replace(0, np.nan)
+    money_flow_volume = (((close - low) - (high - close)) / price_range).fillna(0.0) * volume
+    adl = money_flow_volume.cumsum()
+    cmf = money_flow_volume.rolling(window).sum() / volume.rolling(window).sum()
+
+    def latest(series):
+        return float(series.iloc[-1]) if len(series) and pd.notna(series.iloc[-1]) else None
+
+    return {"cmf": {"cmf": latest(cmf)}, "adl": {"adl": latest(adl)}}
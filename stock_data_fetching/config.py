@@ -22,6 +22,59 @@ class Settings(BaseSettings):
     OLLAMA_API_URL: str = os.getenv("OLLAMA_API_URL", "http://eass_ollama:11434/api/generate")
     OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama2")
     
+    # Response Settings
+    GZIP_MINIMUM_SIZE: int = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+    HISTORY_DEFAULT_POINTS: int = int(os.getenv("HISTORY_DEFAULT_POINTS", "500"))
+    
+    # Price Providers: "alphavantage", "yfinance" or "hedged" (Alpha Vantage first, yfinance as the hedge)
+    PRICE_PROVIDER: str = os.getenv("PRICE_PROVIDER", "alphavantage")
+    PRICE_HEDGE_PERCENTILE: float = float(os.getenv("PRICE_HEDGE_PERCENTILE", "95"))
+    PRICE_HEDGE_DEFAULT_DELAY: float = float(os.getenv("PRICE_HEDGE_DEFAULT_DELAY", "2.0"))
+    
+    # Local Price Store
+    PRICE_STORE_DIR: str = os.getenv("PRICE_STORE_DIR", "stock_data_fetching/data")
+    PRICE_STORE_REFRESH_SECONDS: int = int(os.getenv("PRICE_STORE_REFRESH_SECONDS", "3600"))
+    
+    # Symbol Search
+    SYMBOL_LISTING_PATH: str = os.getenv("SYMBOL_LISTING_PATH", "stock_data_fetching/data/listing_status.csv")
+    SYMBOL_INDEX_REFRESH_SECONDS: int = int(os.getenv("SYMBOL_INDEX_REFRESH_SECONDS", "86400"))
+    INVALID_SYMBOL_TTL_SECONDS: int = int(os.getenv("INVALID_SYMBOL_TTL_SECONDS", "86400"))
+    
+    # Alerts
+    ALERT_RULES_PATH: str = os.getenv("ALERT_RULES_PATH", "stock_data_fetching/data/alert_rules.jsonl")
+    ALERT_HISTORY_LIMIT: int = int(os.getenv("ALERT_HISTORY_LIMIT", "100"))
+    
+    # Market Data Hub (WebSocket / SSE)
+    # One REALTIME_BULK_QUOTES call per 100 watched symbols per tick: at 60s that is 1 call a
+    # minute for a typical watchlist, well inside the 75 calls/minute of the entry premium plan
+    MARKET_HUB_POLL_SECONDS: float = float(os.getenv("MARKET_HUB_POLL_SECONDS", "60"))
+    MARKET_HUB_QUEUE_SIZE: int = int(os.getenv("MARKET_HUB_QUEUE_SIZE", "100"))
+    MARKET_HUB_MAX_SUBSCRIPTIONS: int = int(os.getenv("MARKET_HUB_MAX_SUBSCRIPTIONS", "50"))
+    
+    # Point-in-time snapshots for dated /fetch requests
+    AS_OF_CACHE_SIZE: int = int(os.getenv("AS_OF_CACHE_SIZE", "4096"))
+    
+    # Earnings calendar (one EARNINGS_CALENDAR download a day covers every symbol)
+    EARNINGS_CALENDAR_HORIZON: str = os.getenv("EARNINGS_CALENDAR_HORIZON", "3month")
+    
+    # Batched news sentiment (one shared market feed, per-symbol calls only for thin coverage)
+    NEWS_BATCH_TTL_SECONDS: float = float(os.getenv("NEWS_BATCH_TTL_SECONDS", "900"))
+    NEWS_BATCH_FEED_LIMIT: int = int(os.getenv("NEWS_BATCH_FEED_LIMIT", "1000"))
+    NEWS_BATCH_MIN_ARTICLES: int = int(os.getenv("NEWS_BATCH_MIN_ARTICLES", "5"))
+    
+    # /fetch result cache and speculative prefetching (off unless PREFETCH_PER_MINUTE is set).
+    # The budgets count Alpha Vantage calls; keep them well inside the key's own per-minute and daily quota.
+    FETCH_CACHE_SECONDS: float = float(os.getenv("FETCH_CACHE_SECONDS", "300"))
+    PREFETCH_PER_MINUTE: int = int(os.getenv("PREFETCH_PER_MINUTE", "0"))
+    PREFETCH_PER_DAY: int = int(os.getenv("PREFETCH_PER_DAY", "100"))
+    # Decayed request count a symbol needs to be prefetched for popularity alone
+    PREFETCH_MIN_SCORE: float = float(os.getenv("PREFETCH_MIN_SCORE", "3"))
+    PREFETCH_IDLE_SECONDS: float = float(os.getenv("PREFETCH_IDLE_SECONDS", "5"))
+    PREFETCH_SESSION_SECONDS: float = float(os.getenv("PREFETCH_SESSION_SECONDS", "300"))
+    PREFETCH_HALF_LIFE_SECONDS: float = float(os.getenv("PREFETCH_HALF_LIFE_SECONDS", "3600"))
+    # Symbols /fetch/batch builds at the same time
+    FETCH_BATCH_CONCURRENCY: int = int(os.getenv("FETCH_BATCH_CONCURRENCY", "4"))
+    
     # Default Stock Settings
     DEFAULT_SYMBOL: str = "AAPL"
     DEFAULT_TIMEFRAME: str = "daily"
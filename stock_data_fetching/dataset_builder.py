@@ -0,0 +1,162 @@
+"""
+Build aligned, memory-mappable feature matrices for model training from the local price store.
+
+Layout of the output directory:
+    manifest.json        columns, calendar and per-symbol completion state
+    dates.npy            shared trading calendar (datetime64[D])
+    features/<SYM>.npy   float32 matrix of shape (len(dates), len(columns)), NaN where the symbol has no bar
+                         or its indicators are still warming up
+
+Usage:
+    python -m stock_data_fetching.dataset_builder --out datasets/daily --symbols AAPL MSFT --workers 4
+    python -m stock_data_fetching.dataset_builder --out datasets/daily --all
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from stock_data_fetching.calculate_indicators import add_technical_indicators
+from stock_data_fetching.calculate_volume_features import volume_feature_series
+from stock_data_fetching.price_store import load_history, stored_symbols
+from stock_data_fetching.logger import logger
+
+PRICE_FEATURES = ["open", "high", "low", "close", "adjusted_close", "volume"]
+INDICATOR_FEATURES = ["sma_5", "ema_5", "macd", "macd_signal", "macd_hist", "bb_upper", "bb_middle", "bb_lower"]
+VOLUME_FEATURES = ["volume_sma", "volume_ratio", "volume_spike", "obv"]
+FEATURE_COLUMNS = PRICE_FEATURES + INDICATOR_FEATURES + VOLUME_FEATURES
+
+MANIFEST_FILE = "manifest.json"
+DATES_FILE = "dates.npy"
+
+
+def _write_manifest(out_dir: str, manifest: dict) -> None:
+    tmp_path = os.path.join(out_dir, f"{MANIFEST_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_FILE))
+
+
+def _load_manifest(out_dir: str):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_calendar(symbols: list) -> np.ndarray:
+    """Union of the trading dates of every symbol, as sorted datetime64[D]."""
+    dates = set()
+    for symbol in symbols:
+        dates.update(load_history(symbol)["date"])
+    return np.array(sorted(dates), dtype="datetime64[D]")
+
+
+def symbol_feature_frame(symbol: str) -> pd.DataFrame:
+    """
+    OHLCV, indicator and volume feature columns for one symbol, indexed by date. Indicators are not
+    back-filled, and the warm-up rows before every indicator has a value are dropped, so no row
+    carries information from later sessions.
+    """
+    history = load_history(symbol)
+    if history.empty:
+        return pd.DataFrame(columns=FEATURE_COLUMNS)
+    with_indicators = add_technical_indicators(history, fill=False)
+    features = pd.concat([with_indicators, volume_feature_series(with_indicators)], axis=1)
+    features.index = pd.to_datetime(features["date"]).values.astype("datetime64[D]")
+    return features[FEATURE_COLUMNS].dropna(subset=INDICATOR_FEATURES)
+
+
+def _build_symbol(symbol: str, out_dir: str, dates: np.ndarray, chunk_rows: int) -> int:
+    """
+    Worker: write one symbol's matrix aligned to `dates`, `chunk_rows` calendar rows at a time, so only
+    one chunk is ever aligned and converted in memory. Returns the number of rows with data.
+    """
+    features = symbol_feature_frame(symbol)
+    path = os.path.join(out_dir, "features", f"{symbol}.npy")
+    tmp_path = f"{path}.tmp"
+    matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(dates), len(FEATURE_COLUMNS)))
+    rows = 0
+    for start in range(0, len(dates), chunk_rows):
+        chunk = features.reindex(dates[start:start + chunk_rows])
+        matrix[start:start + len(chunk)] = chunk.to_numpy(dtype=np.float32)
+        rows += int(chunk["close"].notna().sum())
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, path)
+    return rows
+
+
+def build_feature_dataset(symbols: list, out_dir: str, workers: int = None, chunk_rows: int = 4096) -> dict:
+    """
+    Build (or resume building) the feature dataset for `symbols` in parallel.
+    Symbols already marked complete in a manifest with the same calendar and columns are skipped,
+    so an interrupted run picks up where it stopped.
+    """
+    os.makedirs(os.path.join(out_dir, "features"), exist_ok=True)
+    symbols = sorted({s.upper() for s in symbols})
+    dates = build_calendar(symbols)
+    calendar = {"start": str(dates[0]) if len(dates) else None, "end": str(dates[-1]) if len(dates) else None, "rows": len(dates)}
+
+    manifest = _load_manifest(out_dir)
+    if not manifest or manifest.get("columns") != FEATURE_COLUMNS or manifest.get("calendar") != calendar:
+        manifest = {"columns": FEATURE_COLUMNS, "calendar": calendar, "dates": DATES_FILE, "symbols": {}}
+        np.save(os.path.join(out_dir, DATES_FILE), dates)
+        _write_manifest(out_dir, manifest)
+
+    pending = [s for s in symbols if not manifest["symbols"].get(s, {}).get("complete")]
+    logger.info(f"Building feature dataset in {out_dir}: {len(symbols) - len(pending)} done, {len(pending)} pending")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_build_symbol, s, out_dir, dates, chunk_rows): s for s in pending}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                rows = future.result()
+                manifest["symbols"][symbol] = {"file": f"features/{symbol}.npy", "rows": rows, "complete": True}
+            except Exception as e:
+                logger.error(f"Failed to build features for {symbol}: {str(e)}", exc_info=True)
+                manifest["symbols"][symbol] = {"complete": False, "error": str(e)}
+            # Persist after every symbol so an interruption loses at most the in-flight work
+            _write_manifest(out_dir, manifest)
+
+    return manifest
+
+
+def open_feature_dataset(out_dir: str) -> tuple:
+    """Open a built dataset without reading it into RAM: (dates, columns, {symbol: memmap})."""
+    manifest = _load_manifest(out_dir)
+    if not manifest:
+        raise FileNotFoundError(f"No {MANIFEST_FILE} in {out_dir}")
+    dates = np.load(os.path.join(out_dir, manifest["dates"]))
+    matrices = {
+        symbol: np.load(os.path.join(out_dir, entry["file"]), mmap_mode="r")
+        for symbol, entry in manifest["symbols"].items()
+        if entry.get("complete")
+    }
+    return dates, manifest["columns"], matrices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build memory-mappable training features from the local price store.")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--symbols", nargs="*", default=[], help="Symbols to include")
+    parser.add_argument("--all", action="store_true", help="Include every symbol in the price store")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-rows", type=int, default=4096, help="Rows written per chunk")
+    args = parser.parse_args()
+
+    symbols = stored_symbols() if args.all else args.symbols
+    if not symbols:
+        parser.error("No symbols given; pass --symbols or --all")
+    manifest = build_feature_dataset(symbols, args.out, workers=args.workers, chunk_rows=args.chunk_rows)
+    done = sum(1 for entry in manifest["symbols"].values() if entry.get("complete"))
+    print(f"{done}/{len(manifest['symbols'])} symbols built into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
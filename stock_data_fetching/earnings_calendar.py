@@ -0,0 +1,113 @@
+"""
+Upcoming earnings dates for every symbol from one Alpha Vantage EARNINGS_CALENDAR download a day.
+
+The calendar is a CSV of (symbol, name, reportDate, fiscalDateEnding, estimate, currency) rows
+covering EARNINGS_CALENDAR_HORIZON. It is stored under PRICE_STORE_DIR, so restarts reuse the day's
+copy, and indexed into a symbol -> next report dict. Lookups never call upstream.
+"""
+import io
+import os
+import threading
+import time
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Optional
+
+import pandas as pd
+import requests
+
+from stock_data_fetching.config import settings
+from stock_data_fetching.logger import logger
+
+CALENDAR_COLUMNS = ["symbol", "name", "reportDate", "fiscalDateEnding", "estimate", "currency"]
+# Don't retry a failed download on every lookup
+RETRY_SECONDS = 300
+
+
+def parse_calendar(text: str, today: date) -> Dict[str, dict]:
+    """Index calendar CSV text by symbol, keeping each symbol's earliest report on or after `today`."""
+    df = pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False)
+    missing = {"symbol", "reportDate"} - set(df.columns)
+    if missing:
+        # Alpha Vantage answers errors and rate limits with a JSON note instead of CSV
+        raise ValueError(f"Unexpected earnings calendar response: {text[:200]}")
+    df["reportDate"] = pd.to_datetime(df["reportDate"], errors="coerce").dt.date
+    df = df[df["reportDate"].notna() & (df["reportDate"] >= today)]
+    df = df.sort_values(["symbol", "reportDate"]).drop_duplicates(subset="symbol", keep="first")
+    columns = [c for c in CALENDAR_COLUMNS if c in df.columns and c != "symbol"]
+    return {
+        row["symbol"].upper(): {**{c: row[c] or None for c in columns}, "reportDate": row["reportDate"].isoformat()}
+        for row in df.to_dict("records")
+    }
+
+
+class EarningsCalendar:
+    def __init__(self, path: str, horizon: str = "3month"):
+        self.path = path
+        self.horizon = horizon
+        self._index: Dict[str, dict] = {}
+        self._loaded_for: Optional[date] = None
+        self._retry_after = 0.0
+        self._lock = threading.Lock()
+
+    def _download(self) -> str:
+        url = (f"https://www.alphavantage.co/query?function=EARNINGS_CALENDAR&horizon={self.horizon}"
+               f"&apikey={settings.ALPHA_VANTAGE_API_KEY}")
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        return response.text
+
+    def _stored_text(self, today: date) -> Optional[str]:
+        """The stored calendar, if it was downloaded today."""
+        try:
+            if datetime.utcfromtimestamp(os.path.getmtime(self.path)).date() != today:
+                return None
+            with open(self.path) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _save(self, text: str) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+
+    def _ensure_current(self) -> None:
+        today = datetime.utcnow().date()
+        if self._loaded_for == today or time.monotonic() < self._retry_after:
+            return
+        with self._lock:
+            if self._loaded_for == today:
+                return
+            try:
+                text = self._stored_text(today)
+                if text is None:
+                    text = self._download()
+                    index = parse_calendar(text, today)
+                    self._save(text)
+                else:
+                    index = parse_calendar(text, today)
+            except Exception as e:
+                # Keep serving yesterday's index (dates that passed are filtered at lookup)
+                logger.warning(f"Earnings calendar refresh failed: {str(e)}")
+                self._retry_after = time.monotonic() + RETRY_SECONDS
+                return
+            self._index = index
+            self._loaded_for = today
+            logger.info(f"Earnings calendar loaded with {len(index)} symbols")
+
+    def next_earnings(self, symbol: str) -> Optional[dict]:
+        """The next scheduled report for `symbol` (reportDate, fiscalDateEnding, estimate, ...), or None."""
+        self._ensure_current()
+        report = self._index.get(symbol.strip().upper())
+        if report and report["reportDate"] < datetime.utcnow().date().isoformat():
+            return None
+        return report
+
+
+@lru_cache()
+def get_earnings_calendar() -> EarningsCalendar:
+    return EarningsCalendar(os.path.join(settings.PRICE_STORE_DIR, "earnings_calendar.csv"),
+                            horizon=settings.EARNINGS_CALENDAR_HORIZON)
@@ -0,0 +1,302 @@
+"""
+A small expression language for derived price series, e.g.
+
+    ema(close, 20) - sma(close, 50)
+    rolling_max(high, 14)
+    close > sma(close, 200)
+
+Expressions are parsed once into a tree of tuples, compiled into a flat evaluation plan in which
+identical subexpressions appear once (so `sma(close, 50)` used twice is computed once), and the
+compiled plan is cached by expression text. Every operation is a vectorized NumPy/pandas kernel
+over arrays shaped (time,) for one symbol or (time, symbols) for a screener panel.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class ExpressionError(ValueError):
+    """Raised for expressions that don't parse or can't be evaluated."""
+
+
+_TOKEN = re.compile(r"\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+)|([A-Za-z_]\w*)|(>=|<=|[-+*/(),<>]))")
+
+
+def _tokenize(source: str) -> list:
+    tokens, pos = [], 0
+    source = source.rstrip()
+    while pos < len(source):
+        match = _TOKEN.match(source, pos)
+        if not match:
+            raise ExpressionError(f"Unexpected character at position {pos}: {source[pos:pos + 10]!r}")
+        number, name, op = match.groups()
+        if number is not None:
+            tokens.append(("num", float(number)))
+        elif name is not None:
+            tokens.append(("name", name.lower()))
+        else:
+            tokens.append(("op", op))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent: comparison > additive > multiplicative > unary > primary."""
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take_op(self, *ops):
+        kind, value = self.peek()
+        if kind == "op" and value in ops:
+            self.pos += 1
+            return value
+        return None
+
+    def expect_op(self, op):
+        if not self.take_op(op):
+            raise ExpressionError(f"Expected '{op}' but found {self.peek()[1]!r}")
+
+    def parse(self):
+        node = self.comparison()
+        if self.pos != len(self.tokens):
+            raise ExpressionError(f"Unexpected {self.peek()[1]!r} after end of expression")
+        return node
+
+    def comparison(self):
+        node = self.additive()
+        op = self.take_op(">", "<", ">=", "<=")
+        if op:
+            node = ("bin", op, node, self.additive())
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while True:
+            op = self.take_op("+", "-")
+            if not op:
+                return node
+            node = ("bin", op, node, self.multiplicative())
+
+    def multiplicative(self):
+        node = self.unary()
+        while True:
+            op = self.take_op("*", "/")
+            if not op:
+                return node
+            node = ("bin", op, node, self.unary())
+
+    def unary(self):
+        if self.take_op("-"):
+            return ("neg", self.unary())
+        return self.primary()
+
+    def primary(self):
+        kind, value = self.peek()
+        if kind == "num":
+            self.pos += 1
+            return ("num", value)
+        if kind == "name":
+            self.pos += 1
+            if not self.take_op("("):
+                return ("col", value)
+            args = []
+            if not self.take_op(")"):
+                args.append(self.comparison())
+                while self.take_op(","):
+                    args.append(self.comparison())
+                self.expect_op(")")
+            return _check_call(value, tuple(args))
+        if self.take_op("("):
+            node = self.comparison()
+            self.expect_op(")")
+            return node
+        raise ExpressionError(f"Unexpected {value!r}" if value is not None else "Unexpected end of expression")
+
+
+def _frame(x: np.ndarray):
+    if np.ndim(x) == 0:
+        raise ExpressionError("Window functions need a series, not a constant")
+    return pd.DataFrame(x) if np.ndim(x) == 2 else pd.Series(x)
+
+
+def _rolling(how: str):
+    def kernel(x, n):
+        return getattr(_frame(x).rolling(n, min_periods=n), how)().to_numpy()
+    return kernel
+
+
+def _ema(x, n):
+    # Same smoothing as calculate_macd (adjust=False)
+    return _frame(x).ewm(span=n, adjust=False).mean().to_numpy()
+
+
+def _shift(x, n):
+    return _frame(x).shift(n).to_numpy()
+
+
+def _diff(x, n=1):
+    return _frame(x).diff(n).to_numpy()
+
+
+def _pct_change(x, n=1):
+    return _frame(x).pct_change(n, fill_method=None).to_numpy()
+
+
+def _rsi(x, n=14):
+    delta = _frame(x).diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / n, adjust=False, min_periods=n).mean()
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / n, adjust=False, min_periods=n).mean()
+    return (100 - 100 / (1 + gain / loss)).to_numpy()
+
+
+# name -> (kernel, number of series arguments, number of integer window arguments (required, optional))
+FUNCTIONS = {
+    "sma": (_rolling("mean"), 1, (1, 0)),
+    "ema": (_ema, 1, (1, 0)),
+    "rolling_max": (_rolling("max"), 1, (1, 0)),
+    "rolling_min": (_rolling("min"), 1, (1, 0)),
+    "rolling_std": (_rolling("std"), 1, (1, 0)),
+    "rolling_sum": (_rolling("sum"), 1, (1, 0)),
+    "shift": (_shift, 1, (1, 0)),
+    "diff": (_diff, 1, (0, 1)),
+    "pct_change": (_pct_change, 1, (0, 1)),
+    "rsi": (_rsi, 1, (0, 1)),
+    "abs": (np.abs, 1, (0, 0)),
+    "log": (np.log, 1, (0, 0)),
+    "sqrt": (np.sqrt, 1, (0, 0)),
+    "max": (np.fmax, 2, (0, 0)),
+    "min": (np.fmin, 2, (0, 0)),
+}
+
+_BINARY = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": np.divide,
+    ">": lambda a, b: np.greater(a, b).astype(float),
+    "<": lambda a, b: np.less(a, b).astype(float),
+    ">=": lambda a, b: np.greater_equal(a, b).astype(float),
+    "<=": lambda a, b: np.less_equal(a, b).astype(float),
+}
+
+
+def _check_call(name: str, args: tuple) -> tuple:
+    if name not in FUNCTIONS:
+        raise ExpressionError(f"Unknown function '{name}'. Available: {', '.join(sorted(FUNCTIONS))}")
+    _, n_series, (required, optional) = FUNCTIONS[name]
+    if not n_series + required <= len(args) <= n_series + required + optional:
+        raise ExpressionError(f"{name}() takes {n_series} series and {required} (+{optional} optional) window arguments")
+    windows = []
+    for arg in args[n_series:]:
+        if arg[0] != "num" or arg[1] != int(arg[1]) or arg[1] < 1:
+            raise ExpressionError(f"Window arguments of {name}() must be positive integers")
+        windows.append(int(arg[1]))
+    return ("call", name, args[:n_series], tuple(windows))
+
+
+@lru_cache(maxsize=1024)
+def parse_expression(source: str) -> tuple:
+    """Parse an expression into its tree of tuples (cached by text)."""
+    tokens = _tokenize(source)
+    if not tokens:
+        raise ExpressionError("Empty expression")
+    return _Parser(tokens).parse()
+
+
+class CompiledExpressions:
+    """A set of named expressions flattened into one plan with shared subexpressions."""
+
+    def __init__(self, expressions: Tuple[Tuple[str, str], ...]):
+        self.outputs = {name: parse_expression(source) for name, source in expressions}
+        self.plan = []
+        seen = set()
+
+        def visit(node):
+            if node in seen:
+                return
+            if node[0] == "bin":
+                visit(node[2])
+                visit(node[3])
+            elif node[0] == "neg":
+                visit(node[1])
+            elif node[0] == "call":
+                for arg in node[2]:
+                    visit(arg)
+            seen.add(node)
+            self.plan.append(node)
+
+        for node in self.outputs.values():
+            visit(node)
+
+    @property
+    def columns(self) -> set:
+        return {node[1] for node in self.plan if node[0] == "col"}
+
+    def evaluate(self, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Run the plan over input columns (all shaped (time,) or all (time, symbols))."""
+        missing = self.columns - set(columns)
+        if missing:
+            raise ExpressionError(f"Unknown column(s): {', '.join(sorted(missing))}. Available: {', '.join(sorted(columns))}")
+
+        values = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for node in self.plan:
+                kind = node[0]
+                if kind == "num":
+                    values[node] = np.float64(node[1])
+                elif kind == "col":
+                    values[node] = np.asarray(columns[node[1]], dtype=float)
+                elif kind == "neg":
+                    values[node] = -values[node[1]]
+                elif kind == "bin":
+                    values[node] = _BINARY[node[1]](values[node[2]], values[node[3]])
+                else:
+                    kernel = FUNCTIONS[node[1]][0]
+                    values[node] = kernel(*(values[arg] for arg in node[2]), *node[3])
+
+        shape = np.shape(next(iter(columns.values()))) if columns else ()
+        results = {}
+        for name, node in self.outputs.items():
+            result = np.broadcast_to(values[node], shape).astype(float)
+            result[~np.isfinite(result)] = np.nan
+            results[name] = result
+        return results
+
+
+@lru_cache(maxsize=256)
+def _compile(expressions: Tuple[Tuple[str, str], ...]) -> CompiledExpressions:
+    return CompiledExpressions(expressions)
+
+
+def compile_expressions(expressions: Dict[str, str]) -> CompiledExpressions:
+    """Compile named expressions, reusing a cached plan when the same set was compiled before."""
+    return _compile(tuple(sorted((name, source.strip()) for name, source in expressions.items())))
+
+
+def history_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Numeric columns of a price history (as returned by the price store) keyed by name."""
+    return {column: df[column].to_numpy(dtype=float) for column in df.columns if column != "date"}
+
+
+def panel_columns(histories: Dict[str, pd.DataFrame]) -> Tuple[np.ndarray, list, Dict[str, np.ndarray]]:
+    """
+    Align several histories on the union of their dates into (time, symbols) arrays.
+    Returns (dates, symbols, columns).
+    """
+    symbols = sorted(histories)
+    frames = {symbol: histories[symbol].set_index("date") for symbol in symbols}
+    dates = sorted(set().union(*(frame.index for frame in frames.values())))
+    shared = set.intersection(*(set(frame.columns) for frame in frames.values())) if frames else set()
+    columns = {
+        column: np.column_stack([frames[s][column].reindex(dates).to_numpy(dtype=float) for s in symbols])
+        for column in sorted(shared)
+    }
+    return np.array(dates), symbols, columns
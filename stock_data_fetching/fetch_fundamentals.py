@@ -1,29 +1,16 @@
 import requests
 import numpy as np
 
+from stock_data_fetching.earnings_calendar import get_earnings_calendar
+from stock_data_fetching.logger import logger
+
 def fetch_fundamentals(symbol: str, api_key: str) -> dict:
     overview_url = f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={symbol}&apikey={api_key}"
-    earnings_url = f"https://www.alphavantage.co/query?function=EARNINGS&symbol={symbol}&apikey={api_key}"
 
     overview = requests.get(overview_url).json()
-    earnings = requests.get(earnings_url).json()
-
-    pe_ratio = overview.get("PERatio")
-    eps = overview.get("EPS")
-    earnings_dates = earnings.get("earningsDate", [])
-    next_earnings = earnings_dates[0] if earnings_dates else None
 
-    latest_report = {}
-    history = earnings.get("quarterlyEarnings", [])
-    if history:
-        latest = history[0]
-        latest_report = {
-            "fiscalDateEnding": latest.get("fiscalDateEnding"),
-            "reportedEPS": latest.get("reportedEPS"),
-            "estimatedEPS": latest.get("estimatedEPS"),
-            "surprise": latest.get("surprise"),
-            "surprisePercentage": latest.get("surprisePercentage")
-        }
+    # Served from the shared daily EARNINGS_CALENDAR download rather than a per-symbol EARNINGS call
+    upcoming = get_earnings_calendar().next_earnings(symbol) or {}
 
     def safe_float(val, default=0.0):
         try:
@@ -49,20 +36,11 @@ def fetch_fundamentals(symbol: str, api_key: str) -> dict:
         "pe_ratio": safe_float(get_val("PERatio", 0.0)),
         "dividend_yield": safe_float(get_val("DividendYield", 0.0)),
         "beta": safe_float(get_val("Beta", 0.0)),
+        "next_earnings_date": upcoming.get("reportDate"),
+        "next_earnings_estimate": safe_float(upcoming.get("estimate"), None),
     }
-    
-    print("\n=== Fundamental Data ===")
-    print(f"P/E Ratio: {pe_ratio}")
-    print(f"EPS: {eps}")
-    print(f"Next Earnings Date: {next_earnings}")
-    if latest_report:
-        print("\nLatest Earnings Report:")
-        print(f"Fiscal Date Ending: {latest_report['fiscalDateEnding']}")
-        print(f"Reported EPS: {latest_report['reportedEPS']}")
-        print(f"Estimated EPS: {latest_report['estimatedEPS']}")
-        print(f"Surprise: {latest_report['surprise']}")
-        print(f"Surprise Percentage: {latest_report['surprisePercentage']}%")
-    
+    logger.debug(f"Fundamentals for {symbol}: EPS {overview.get('EPS')}, next report for fiscal period "
+                 f"{upcoming.get('fiscalDateEnding')} on {fundamentals['next_earnings_date']}")
     return fundamentals
 
 def fetch_extended_fundamentals(symbol: str, api_key: str) -> dict:
@@ -121,7 +99,7 @@ def fetch_extended_fundamentals(symbol: str, api_key: str) -> dict:
         }
 
     except Exception as e:
-        print(f"Error fetching extended fundamentals for {symbol}: {e}")
+        logger.error(f"Error fetching extended fundamentals for {symbol}: {str(e)}")
         return {
             "eps": np.nan,
             "revenue_growth_yoy": np.nan,
@@ -4,9 +4,10 @@ import pandas_ta as ta
 from datetime import datetime
 from fastapi import HTTPException
 from .logger import logger
+from .symbol_filter import record_unknown_symbol
 
-def fetch_price_data(symbol: str, api_key: str, days: int = 30, date: str = None) -> pd.DataFrame:
-    outputsize = "full" if date else "compact"
+def fetch_price_data(symbol: str, api_key: str, days: int = 30, date: str = None, full_history: bool = False) -> pd.DataFrame:
+    outputsize = "full" if date or full_history else "compact"
     url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY_ADJUSTED&symbol={symbol}&outputsize={outputsize}&apikey={api_key}"
     
     api_data = {}
@@ -32,7 +33,9 @@ def fetch_price_data(symbol: str, api_key: str, days: int = 30, date: str = None
         error_msg = api_data['Error Message']
         logger.error(f"Alpha Vantage API Error for {symbol}: {error_msg}")
         if "Invalid API call" in error_msg:
-            return pd.DataFrame()  # Symbol not found
+            # Symbol not found; later requests for it are rejected without a round trip
+            record_unknown_symbol(symbol)
+            return pd.DataFrame()
         if "Invalid API key" in error_msg or "API key" in error_msg:
             raise HTTPException(status_code=500, detail="Invalid or missing Alpha Vantage API key.")
         raise HTTPException(status_code=500, detail=f"External API Error for {symbol}: {error_msg}")
@@ -69,7 +72,7 @@ def fetch_price_data(symbol: str, api_key: str, days: int = 30, date: str = None
 
     df = df.sort_values("date", ascending=True).reset_index(drop=True)
     
-    if not date:
+    if not date and not full_history:
         df = df.tail(days).reset_index(drop=True)
 
     today = datetime.utcnow().date()
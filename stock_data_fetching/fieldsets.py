@@ -0,0 +1,103 @@
+from typing import Dict, List, Optional, Set
+
+# Response sections of /fetch, in response order
+SECTIONS = [
+    "technical_indicators",
+    "volume_features",
+    "fundamentals",
+    "news_sentiment",
+    "advanced_news_sentiment",
+    "extended_fundamentals",
+    "technical_indicators_ext",
+    "volume_features_ext",
+]
+
+# Keys of each section's dict in the /fetch response, i.e. the valid `section.subfield` selections
+SUBFIELDS = {
+    "technical_indicators": {
+        "latest_close", "previous_close", "open", "high", "low", "volume", "sma_5", "ema_5",
+        "macd", "macd_signal", "macd_hist", "bb_upper", "bb_middle", "bb_lower", "rsi",
+    },
+    "volume_features": {
+        "latest_volume", "volume_avg", "volume_spike", "obv", "volume_sma", "volume_ratio", "volume_trend",
+    },
+    "fundamentals": {"market_cap", "pe_ratio", "dividend_yield", "beta", "next_earnings_date", "next_earnings_estimate"},
+    "news_sentiment": {"sentiment_score", "sentiment_counts", "headlines", "sentiment_summary"},
+    "advanced_news_sentiment": {"avg_sentiment_7d", "headline_counts_7d", "sentiment_momentum"},
+    "extended_fundamentals": {"eps", "revenue_growth_yoy", "roe", "debt_equity_ratio", "operating_margin_ttm"},
+    "technical_indicators_ext": {"aroon", "adx", "stoch", "cci", "psar"},
+    "volume_features_ext": {"cmf", "adl"},
+}
+
+# Internal inputs a section is computed from. Selecting a section pulls these in automatically,
+# so e.g. asking only for fundamentals skips the price download and indicator calculation.
+SECTION_DEPENDENCIES = {
+    "technical_indicators": {"price_history"},
+    "volume_features": {"price_history"},
+}
+
+# Alpha Vantage calls an undated /fetch makes for each section or internal input
+UPSTREAM_CALLS = {
+    "price_history": 1,
+    "fundamentals": 1,
+    "news_sentiment": 1,
+    "advanced_news_sentiment": 1,
+    "extended_fundamentals": 3,
+}
+# Sections where every selected subfield is its own call
+PER_SUBFIELD_CALLS = {"technical_indicators_ext", "volume_features_ext"}
+
+
+def parse_fields(fields: Optional[List[str]]) -> Dict[str, Optional[Set[str]]]:
+    """
+    Turn a field selection like ["fundamentals", "technical_indicators_ext.adx"] into
+    {section: subfields}, where None means the whole section. No selection means everything.
+    """
+    if not fields:
+        return {section: None for section in SECTIONS}
+
+    selection: Dict[str, Optional[Set[str]]] = {}
+    for field in fields:
+        section, _, subfield = field.strip().partition(".")
+        if section not in SECTIONS:
+            raise ValueError(f"Unknown field '{field}'. Sections are: {', '.join(SECTIONS)}")
+        if subfield and subfield not in SUBFIELDS[section]:
+            raise ValueError(f"Unknown field '{field}'. {section} has: {', '.join(sorted(SUBFIELDS[section]))}")
+        if not subfield:
+            selection[section] = None
+        elif section not in selection or selection[section] is not None:
+            selection.setdefault(section, set()).add(subfield)
+    return selection
+
+
+def resolve_dependencies(selection: Dict[str, Optional[Set[str]]]) -> Set[str]:
+    """Every section and internal input needed to answer the selection."""
+    needed = set(selection)
+    for section in selection:
+        needed |= SECTION_DEPENDENCIES.get(section, set())
+    return needed
+
+
+def upstream_calls(selection: Dict[str, Optional[Set[str]]]) -> int:
+    """Alpha Vantage calls needed to answer the selection from scratch."""
+    calls = sum(UPSTREAM_CALLS.get(name, 0) for name in resolve_dependencies(selection))
+    if wants(selection, "technical_indicators", "rsi"):
+        calls += 1
+    for section in PER_SUBFIELD_CALLS:
+        if section in selection:
+            calls += len(SUBFIELDS[section] if selection[section] is None else selection[section])
+    return calls
+
+
+def wants(selection: Dict[str, Optional[Set[str]]], section: str, subfield: Optional[str] = None) -> bool:
+    """Whether a section (or one subfield of it) was selected."""
+    if section not in selection:
+        return False
+    return subfield is None or selection[section] is None or subfield in selection[section]
+
+
+def select_subfields(values: dict, subfields: Optional[Set[str]]) -> dict:
+    """Trim a section's dict to the requested subfields (all of them when subfields is None)."""
+    if subfields is None or not isinstance(values, dict) or "error" in values:
+        return values
+    return {key: value for key, value in values.items() if key in subfields}
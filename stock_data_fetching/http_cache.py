@@ -0,0 +1,46 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Response
+
+
+def serialize_payload(payload: Any) -> bytes:
+    """Serialize a JSON-compatible payload deterministically (sorted keys, compact separators)."""
+    return json.dumps(
+        payload,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        allow_nan=False,
+    ).encode("utf-8")
+
+
+def compute_etag(body: bytes) -> str:
+    """
+    Build an ETag from the SHA-256 of a serialized body.
+    The tag is weak because the gzip middleware may re-encode the bytes on the way out.
+    """
+    return f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque_tag for candidate in if_none_match.split(","))
+
+
+def conditional_json_response(payload: Any, if_none_match: Optional[str] = None) -> Response:
+    """
+    Return the payload as JSON with an ETag, or an empty 304 when the client already has it.
+    """
+    body = serialize_payload(payload)
+    etag = compute_etag(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
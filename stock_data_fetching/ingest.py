@@ -0,0 +1,170 @@
+"""
+Bulk-load daily OHLCV CSV files (e.g. the Kaggle stock-market dataset's stocks/*.csv) into the local price store.
+
+Each file is named after its symbol and has Date, Open, High, Low, Close, [Adj Close,] Volume columns
+(header case and spacing don't matter). Files are parsed in parallel worker processes, with the
+multi-threaded pyarrow CSV engine when pyarrow is installed. Rows are validated and deduplicated by
+date, then merged into the store. Dates the store already has are left alone, so data downloaded
+from the price provider wins over the import.
+
+A manifest of ingested files (keyed by path, size and mtime) makes re-runs skip unchanged files, so an
+interrupted import resumes where it stopped.
+
+Usage:
+    python -m stock_data_fetching.ingest --source app/stock-market-dataset/stocks --workers 8
+"""
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from stock_data_fetching.config import settings
+from stock_data_fetching.logger import logger
+from stock_data_fetching.price_store import PRICE_COLUMNS, load_history, merge_history
+
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+MANIFEST_FILE = "ingest_manifest.json"
+
+# Normalized source header -> price store column
+COLUMN_ALIASES = {
+    "date": "date",
+    "open": "open",
+    "high": "high",
+    "low": "low",
+    "close": "close",
+    "adj_close": "adjusted_close",
+    "adjusted_close": "adjusted_close",
+    "volume": "volume",
+}
+
+
+def _normalize(header: str) -> str:
+    return header.strip().lower().replace(" ", "_")
+
+
+def read_price_csv(path: str) -> pd.DataFrame:
+    """Read one OHLCV file into the price store schema (only the needed columns are parsed)."""
+    df = pd.read_csv(path, engine=CSV_ENGINE, usecols=lambda column: _normalize(column) in COLUMN_ALIASES)
+    df = df.rename(columns=lambda column: COLUMN_ALIASES[_normalize(column)])
+    missing = {"date", "open", "high", "low", "close", "volume"} - set(df.columns)
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(sorted(missing))}")
+    if "adjusted_close" not in df.columns:
+        df["adjusted_close"] = df["close"]
+    return df[PRICE_COLUMNS]
+
+
+def clean_prices(df: pd.DataFrame) -> tuple:
+    """Drop unparseable, non-positive and inconsistent bars and duplicate dates. Returns (clean frame, dropped rows)."""
+    total = len(df)
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    for column in PRICE_COLUMNS[1:]:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    prices = df[["open", "high", "low", "close", "adjusted_close"]]
+    valid = (
+        df["date"].notna()
+        & prices.notna().all(axis=1)
+        & (prices > 0).all(axis=1)
+        & (df["high"] >= df["low"])
+        & (df["volume"].fillna(0) >= 0)
+    )
+    df = df[valid]
+    df = df.assign(date=df["date"].dt.date, volume=df["volume"].fillna(0).astype("int64"))
+    df = df.drop_duplicates(subset="date", keep="last").sort_values("date").reset_index(drop=True)
+    return df, total - len(df)
+
+
+def ingest_file(path: str) -> dict:
+    """Worker: load, clean and merge one file. Returns counts for the manifest."""
+    symbol = os.path.splitext(os.path.basename(path))[0].upper()
+    df, dropped = clean_prices(read_price_csv(path))
+    stored_dates = set(load_history(symbol)["date"])
+    new_rows = df[~df["date"].isin(stored_dates)]
+    if not new_rows.empty:
+        merge_history(symbol, new_rows)
+    return {"symbol": symbol, "rows": len(df), "added": len(new_rows), "dropped": dropped}
+
+
+def _file_key(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _unchanged(entry: dict, path: str) -> bool:
+    return bool(entry) and entry.get("complete") and entry.get("key") == _file_key(path)
+
+
+def _manifest_path() -> str:
+    return os.path.join(settings.PRICE_STORE_DIR, MANIFEST_FILE)
+
+
+def _load_manifest() -> dict:
+    try:
+        with open(_manifest_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+
+def _write_manifest(manifest: dict) -> None:
+    os.makedirs(settings.PRICE_STORE_DIR, exist_ok=True)
+    tmp_path = f"{_manifest_path()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, _manifest_path())
+
+
+def ingest_directory(sources: list, workers: int = None, force: bool = False) -> dict:
+    """
+    Ingest every *.csv in `sources` (directories or files). Files already ingested with the same size
+    and mtime are skipped unless `force` is set. Returns the updated manifest.
+    """
+    paths = []
+    for source in sources:
+        paths.extend(sorted(glob.glob(os.path.join(source, "*.csv"))) if os.path.isdir(source) else [source])
+    manifest = _load_manifest()
+    done = manifest["files"]
+    pending = [p for p in paths if force or not _unchanged(done.get(os.path.abspath(p)), p)]
+    logger.info(f"Ingesting {len(pending)} of {len(paths)} files with the {CSV_ENGINE} CSV engine")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(ingest_file, p): p for p in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            entry = {"key": _file_key(path)}
+            try:
+                entry.update(future.result(), complete=True)
+            except Exception as e:
+                logger.error(f"Failed to ingest {path}: {str(e)}")
+                entry.update(complete=False, error=str(e))
+            done[os.path.abspath(path)] = entry
+            # Persist after every file so an interruption loses at most the in-flight work
+            _write_manifest(manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load OHLCV CSV files into the local price store.")
+    parser.add_argument("--source", nargs="+", required=True, help="Directories of <SYMBOL>.csv files, or individual files")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Re-ingest files even if unchanged since the last run")
+    args = parser.parse_args()
+
+    manifest = ingest_directory(args.source, workers=args.workers, force=args.force)
+    entries = list(manifest["files"].values())
+    complete = [e for e in entries if e.get("complete")]
+    print(f"{len(complete)}/{len(entries)} files ingested, "
+          f"{sum(e.get('added', 0) for e in complete)} new rows, {sum(e.get('dropped', 0) for e in complete)} invalid rows dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,64 @@
 # stock_data_fetching/main.py
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, WebSocket, WebSocketDisconnect, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, List, Optional, Union
+from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
+import numpy as np
 import pandas as pd
 import requests
-import hashlib
 import json
+import jwt
 import re
 
-from stock_data_fetching.fetch_price_data import fetch_price_data, fetch_rsi
-from stock_data_fetching.calculate_indicators import add_technical_indicators, fetch_aroon, fetch_adx, fetch_stoch, fetch_cci, fetch_psar
+from stock_data_fetching.fetch_price_data import fetch_rsi
+from stock_data_fetching.calculate_indicators import add_technical_indicators, indicator_snapshot, fetch_aroon, fetch_adx, fetch_stoch, fetch_cci, fetch_psar
 from stock_data_fetching.calculate_volume_features import calculate_volume_features, fetch_chaikin_money_flow, fetch_adl
 from stock_data_fetching.fetch_fundamentals import fetch_fundamentals, fetch_extended_fundamentals
 from stock_data_fetching.news_features import fetch_news_sentiment, fetch_advanced_news_sentiment
+from stock_data_fetching.http_cache import conditional_json_response
+from stock_data_fetching.fieldsets import parse_fields, resolve_dependencies, wants, select_subfields
+from stock_data_fetching.price_store import get_price_history
+from stock_data_fetching.price_providers import get_price_provider
+from stock_data_fetching.downsampling import lttb_indices
+from stock_data_fetching.symbol_search import get_symbol_index, refresh_symbol_index_periodically
+from stock_data_fetching.expressions import ExpressionError, compile_expressions, history_columns, panel_columns
+from stock_data_fetching.alerts import ALERT_METRICS, OPS, get_alert_engine, snapshot_metrics
+from stock_data_fetching.portfolio import portfolio_analytics
+from stock_data_fetching.market_hub import market_hub
+from stock_data_fetching.as_of import AsOfDataMissing, as_of_sections
+from stock_data_fetching.symbol_filter import rejection_reason
+from stock_data_fetching.bulk_quotes import refresh_quotes
+from stock_data_fetching.news_batch import batch_news_sentiment, cached_news
+from stock_data_fetching.prefetcher import fetch_cache, prefetcher, selection_key
 from stock_data_fetching.config import settings
 from stock_data_fetching.logger import logger
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the symbol index off the event loop so the first autocomplete keystroke is already fast
+    asyncio.create_task(asyncio.to_thread(get_symbol_index))
+    background_tasks = [asyncio.create_task(refresh_symbol_index_periodically())]
+    if settings.PREFETCH_PER_MINUTE > 0:
+        prefetcher.build = build_live_sections
+        background_tasks.append(asyncio.create_task(prefetcher.run()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await market_hub.close()
+
 app = FastAPI(
     title="Stock Data Fetching Service",
     description="Service for fetching and analyzing stock data using Alpha Vantage",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -32,12 +68,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Compress large payloads (headlines and extended sections make /fetch responses big)
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
+
+# Alert endpoints identify the user by the auth_service JWT in the Authorization header
+bearer_scheme = HTTPBearer(auto_error=True)
+
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> str:
+    """The email (`sub`) of the caller's auth_service token; 401 if it is invalid or expired."""
+    try:
+        payload = jwt.decode(credentials.credentials, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+        return payload["sub"]
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+def reject_unknown_symbol(symbol: str) -> None:
+    """404 straight away for symbols that can't be valid (see symbol_filter), without spending API quota."""
+    reason = rejection_reason(symbol)
+    if reason:
+        raise HTTPException(status_code=404, detail=f"Unknown symbol {symbol}: {reason}.")
+
+def validate_expression_map(expressions: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+    """Expression names become column names, so keep them to identifiers; syntax is checked by compiling."""
+    if expressions is None:
+        return expressions
+    for name in expressions:
+        if not re.fullmatch(r"[A-Za-z_]\w*", name):
+            raise ValueError(f"Invalid expression name '{name}'. Use letters, digits and underscores.")
+    try:
+        compile_expressions(expressions)
+    except ExpressionError as e:
+        raise ValueError(str(e))
+    return expressions
+
 class StockDataRequest(BaseModel):
     symbol: str
     timeframe: Optional[str] = settings.DEFAULT_TIMEFRAME
     date: Optional[str] = None
+    fields: Optional[List[str]] = None
 
     @validator("timeframe")
     def validate_timeframe(cls, v):
@@ -46,17 +117,213 @@ class StockDataRequest(BaseModel):
             raise ValueError(f"Invalid timeframe: {v}. Must be one of {allowed}")
         return v
 
+    @validator("fields")
+    def validate_fields(cls, v):
+        parse_fields(v)
+        return v
+
+class FundamentalsData(BaseModel):
+    """Valuation figures plus the next scheduled earnings report (date and consensus EPS estimate)."""
+    market_cap: Optional[int] = None
+    pe_ratio: Optional[float] = None
+    dividend_yield: Optional[float] = None
+    beta: Optional[float] = None
+    next_earnings_date: Optional[str] = None
+    next_earnings_estimate: Optional[float] = None
+
 class StockDataResponse(BaseModel):
     symbol: str
-    technical_indicators: Dict[str, float]
-    volume_features: Dict[str, Union[float, str]]
-    fundamentals: Dict[str, Any]
-    news_sentiment: Dict[str, Any]
+    technical_indicators: Optional[Dict[str, float]] = None
+    volume_features: Optional[Dict[str, Union[float, str]]] = None
+    fundamentals: Optional[FundamentalsData] = None
+    news_sentiment: Optional[Dict[str, Any]] = None
     advanced_news_sentiment: Optional[Dict[str, Any]] = None
     extended_fundamentals: Optional[Dict[str, Any]] = None
     technical_indicators_ext: Optional[Dict[str, Any]] = None
     volume_features_ext: Optional[Dict[str, Any]] = None
 
+class HistoryRequest(BaseModel):
+    symbol: str
+    points: Optional[int] = settings.HISTORY_DEFAULT_POINTS
+    start: Optional[str] = None
+    end: Optional[str] = None
+    indicators: bool = True
+    expressions: Optional[Dict[str, str]] = None
+
+    @validator("points")
+    def validate_points(cls, v):
+        if v is not None and v < 3:
+            raise ValueError("points must be at least 3 (first, last and one bucket)")
+        return v
+
+    @validator("expressions")
+    def validate_expression_names(cls, v):
+        return validate_expression_map(v)
+
+class HistoryResponse(BaseModel):
+    symbol: str
+    total_points: int
+    points: int
+    columns: Dict[str, List[Any]]
+
+class ScreenRequest(BaseModel):
+    symbols: List[str]
+    expressions: Dict[str, str]
+
+    @validator("symbols")
+    def validate_symbols(cls, v):
+        symbols = sorted({s.strip().upper() for s in v if s.strip()})
+        if not symbols:
+            raise ValueError("symbols must not be empty")
+        return symbols
+
+    @validator("expressions")
+    def validate_expression_names(cls, v):
+        if not v:
+            raise ValueError("expressions must not be empty")
+        return validate_expression_map(v)
+
+class ScreenResponse(BaseModel):
+    date: Optional[str]
+    results: Dict[str, Dict[str, Optional[float]]]
+    missing: List[str]
+
+class QuotesRequest(BaseModel):
+    symbols: List[str]
+
+    @validator("symbols")
+    def validate_symbols(cls, v):
+        symbols = list(dict.fromkeys(s.strip().upper() for s in v if s.strip()))
+        if not symbols:
+            raise ValueError("symbols must not be empty")
+        if len(symbols) > 500:
+            raise ValueError("At most 500 symbols per request")
+        return symbols
+
+class QuotesResponse(BaseModel):
+    quotes: Dict[str, Dict[str, Optional[float]]]
+    missing: List[str]
+
+class NewsBatchRequest(BaseModel):
+    symbols: List[str]
+
+    @validator("symbols")
+    def validate_symbols(cls, v):
+        symbols = list(dict.fromkeys(s.strip().upper() for s in v if s.strip()))
+        if not symbols:
+            raise ValueError("symbols must not be empty")
+        if len(symbols) > 100:
+            raise ValueError("At most 100 symbols per request")
+        return symbols
+
+class NewsBatchResponse(BaseModel):
+    results: Dict[str, Dict[str, Any]]
+    upstream_calls: int
+
+class FetchBatchRequest(BaseModel):
+    symbols: List[str]
+    fields: Optional[List[str]] = None
+
+    @validator("symbols")
+    def validate_symbols(cls, v):
+        symbols = list(dict.fromkeys(s.strip().upper() for s in v if s.strip()))
+        if not symbols:
+            raise ValueError("symbols must not be empty")
+        if len(symbols) > 100:
+            raise ValueError("At most 100 symbols per request")
+        return symbols
+
+    @validator("fields")
+    def validate_fields(cls, v):
+        parse_fields(v)
+        return v
+
+class FetchBatchResponse(BaseModel):
+    results: Dict[str, Dict[str, Any]]
+    errors: Dict[str, str]
+
+class AlertRuleRequest(BaseModel):
+    symbol: str
+    metric: str
+    op: str
+    threshold: float
+
+    @validator("metric")
+    def validate_metric(cls, v):
+        if v not in ALERT_METRICS:
+            raise ValueError(f"Unknown metric '{v}'. Available: {', '.join(ALERT_METRICS)}")
+        return v
+
+    @validator("op")
+    def validate_op(cls, v):
+        if v not in OPS:
+            raise ValueError(f"Unknown operator '{v}'. Use one of {', '.join(OPS)}")
+        return v
+
+class AlertRule(BaseModel):
+    id: str
+    user_id: str
+    symbol: str
+    metric: str
+    op: str
+    threshold: float
+    created_at: str
+
+class TriggeredAlert(BaseModel):
+    rule_id: str
+    user_id: str
+    symbol: str
+    metric: str
+    op: str
+    threshold: float
+    value: float
+    triggered_at: str
+
+class PortfolioRequest(BaseModel):
+    symbols: List[str]
+    benchmark: str = "SPY"
+    weights: Optional[Dict[str, float]] = None
+    as_of: Optional[str] = None
+    lookback: int = 252
+    confidence: float = 0.95
+
+    @validator("symbols")
+    def validate_symbols(cls, v):
+        if not v:
+            raise ValueError("symbols must not be empty")
+        return v
+
+    @validator("lookback")
+    def validate_lookback(cls, v):
+        if v < 20:
+            raise ValueError("lookback must be at least 20 trading days")
+        return v
+
+    @validator("confidence")
+    def validate_confidence(cls, v):
+        if not 0.5 <= v < 1:
+            raise ValueError("confidence must be between 0.5 and 1")
+        return v
+
+class PortfolioResponse(BaseModel):
+    as_of: str
+    benchmark: str
+    observations: int
+    confidence: float
+    symbols: Dict[str, Dict[str, Optional[float]]]
+    correlation: Dict[str, Dict[str, Optional[float]]]
+    portfolio: Dict[str, Any]
+
+class SymbolMatch(BaseModel):
+    symbol: str
+    name: str
+    exchange: str
+    asset_type: str
+
+class SymbolSearchResponse(BaseModel):
+    query: str
+    results: List[SymbolMatch]
+
 class PredictRequest(BaseModel):
     symbol: str
     features: Dict[str, Any]
@@ -73,161 +340,515 @@ async def health_check():
     return {"status": "healthy", "service": settings.SERVICE_NAME}
 
 @app.post("/fetch", response_model=StockDataResponse)
-async def fetch_stock_data(request: StockDataRequest):
+async def fetch_stock_data(request: StockDataRequest, http_request: Request, if_none_match: Optional[str] = Header(default=None)):
     """
-    Fetch stock data including technical indicators, volume features, fundamentals, and news sentiment
+    Fetch stock data including technical indicators, volume features, fundamentals, and news sentiment.
+    `fields` limits the response to the listed sections (or `section.subfield`s); only what is needed
+    for them is fetched or computed. Omitting it returns every section.
+    Responses carry a content-hash ETag; sending it back in If-None-Match returns 304 when nothing changed.
+    Undated results are cached for FETCH_CACHE_SECONDS, and the symbols usually requested next are prefetched.
     """
     try:
         allowed = {"daily", "weekly", "monthly"}
         if request.timeframe not in allowed:
             raise HTTPException(status_code=422, detail=f"Invalid timeframe: {request.timeframe}. Must be one of {allowed}")
-        logger.info(f"Starting data fetch for symbol: {request.symbol}, date: {request.date}")
-        # Use fetch_price_data directly
-        df = fetch_price_data(request.symbol, settings.ALPHA_VANTAGE_API_KEY, date=request.date)
-        # Check for invalid API key or error message in response
-        if hasattr(df, 'error') or (isinstance(df, dict) and 'Error Message' in df):
-            logger.error(f"Alpha Vantage API key invalid or error: {getattr(df, 'error', df.get('Error Message', 'Unknown error'))}")
-            raise HTTPException(status_code=500, detail="Alpha Vantage API key is invalid or request failed.")
-        if df.empty:
-            logger.warning(f"No data returned from fetch_price_data for symbol {request.symbol} and date {request.date}")
-            raise HTTPException(status_code=404, detail=f"No data found for symbol {request.symbol} on the specified date or in recent history.")
-        
-        logger.info(f"Price data obtained for {request.symbol}. Shape: {df.shape}")
-        
-        # Filter to the specific date if provided, AFTER all data is fetched.
-        target_df_for_indicators = df.copy()
+        reject_unknown_symbol(request.symbol)
+        selection = parse_fields(request.fields)
+        logger.info(f"Starting data fetch for symbol: {request.symbol}, date: {request.date}, sections: {sorted(selection)}")
 
         if request.date:
-            try:
-                target_date_dt = pd.to_datetime(request.date).date()
-                target_df_for_indicators = df[df["date"] <= target_date_dt].copy()
-                if target_df_for_indicators.empty:
-                     raise HTTPException(status_code=404, detail=f"No data available up to {target_date_dt} for {request.symbol} to calculate indicators.")
-
-                specific_date_df = df[df["date"] == target_date_dt].copy()
-                if specific_date_df.empty:
-                    raise HTTPException(status_code=404, detail=f"No data found for {request.symbol} specifically on {target_date_dt}")
-                
-            except ValueError:
-                logger.error(f"Invalid date format provided: {request.date}")
-                raise HTTPException(status_code=400, detail=f"Invalid date format: {request.date}. Use YYYY-MM-DD.")
-        
-        # Calculate indicators and features using the potentially larger historical df
-        try:
-            df_with_indicators = add_technical_indicators(target_df_for_indicators)
-            logger.info(f"Technical indicators added. Columns: {df_with_indicators.columns.tolist()}")
-        except Exception as e:
-            logger.error(f"Error calculating technical indicators for {request.symbol}: {str(e)}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Error calculating technical indicators: {str(e)}")
-        
-        # Select the specific date's data AFTER indicators are calculated on the series
-        final_row_data = df_with_indicators.iloc[-1:]
-        if request.date:
-            target_date_dt = pd.to_datetime(request.date).date()
-            final_row_data = df_with_indicators[df_with_indicators["date"] == target_date_dt]
-            if final_row_data.empty:
-                 raise HTTPException(status_code=404, detail=f"Data for {target_date_dt} disappeared after indicator calculation.")
+            # Dated requests are answered from stored history, never with today's live values
+            sections = await asyncio.to_thread(load_as_of_sections, request, selection)
+            return fetch_response(request.symbol, sections, if_none_match)
 
-        if final_row_data.empty:
-            raise HTTPException(status_code=404, detail=f"No data available for {request.symbol} to extract features after indicator calculation.")
+        key = selection_key(request.symbol, selection)
+        sections = fetch_cache.get(key)
+        if sections is None:
+            sections = build_live_sections(request.symbol, selection)
+            if not has_section_errors(sections):
+                fetch_cache.put(key, sections)
+        prefetcher.observe(client_id(http_request), request.symbol, selection)
+        return fetch_response(request.symbol, sections, if_none_match)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Unexpected error fetching stock data for {request.symbol}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+@app.post("/fetch/batch", response_model=FetchBatchResponse)
+async def fetch_stock_data_batch(request: FetchBatchRequest):
+    """
+    Undated /fetch for many symbols in one call. News for all symbols missing from fetch_cache comes
+    from one /news/batch pass; the rest is built FETCH_BATCH_CONCURRENCY symbols at a time. A symbol
+    that fails is reported in `errors` without affecting the others.
+    """
+    selection = parse_fields(request.fields)
+    rejected = {symbol: rejection_reason(symbol) for symbol in request.symbols}
+    errors = {symbol: reason for symbol, reason in rejected.items() if reason}
+    symbols = [symbol for symbol in request.symbols if symbol not in errors]
+    pending = [symbol for symbol in symbols if not fetch_cache.contains(selection_key(symbol, selection))]
+    if pending and (wants(selection, "news_sentiment") or wants(selection, "advanced_news_sentiment")):
         try:
-            volume_features = calculate_volume_features(df_with_indicators) 
-            logger.info(f"Volume features calculated: {volume_features}")
+            await asyncio.to_thread(batch_news_sentiment, pending)
         except Exception as e:
-            logger.error(f"Error calculating volume features for {request.symbol}: {str(e)}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Error calculating volume features: {str(e)}")
-            
+            logger.error(f"Batched news sentiment failed, falling back to per-symbol news: {str(e)}")
+
+    semaphore = asyncio.Semaphore(settings.FETCH_BATCH_CONCURRENCY)
+
+    async def build(symbol: str) -> dict:
+        key = selection_key(symbol, selection)
+        sections = fetch_cache.get(key)
+        if sections is None:
+            async with semaphore:
+                sections = await asyncio.to_thread(build_live_sections, symbol, selection)
+            if not has_section_errors(sections):
+                fetch_cache.put(key, sections)
+        result = jsonable_encoder(StockDataResponse(symbol=symbol, **sections), exclude_unset=True)
+        return {key: value for key, value in result.items() if key == "symbol" or key in sections}
+
+    results = {}
+    for symbol, outcome in zip(symbols, await asyncio.gather(*(build(s) for s in symbols), return_exceptions=True)):
+        if isinstance(outcome, Exception):
+            logger.error(f"Batch fetch failed for {symbol}: {str(outcome)}")
+            errors[symbol] = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+        else:
+            results[symbol] = json_safe(outcome)
+    return FetchBatchResponse(results=results, errors=errors)
+
+def client_id(request: Request) -> str:
+    """The caller's address (nginx passes it in X-Forwarded-For), used to tell browsing sessions apart."""
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def json_safe(value):
+    """Replace NaN/inf (e.g. advanced_news_sentiment without articles) with None so the payload is valid JSON."""
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_safe(item) for item in value]
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+def has_section_errors(sections: dict) -> bool:
+    return any(isinstance(values, dict) and "error" in values for values in sections.values())
+
+def build_live_sections(symbol: str, selection: dict) -> dict:
+    """
+    The selected /fetch sections with today's data, fetched and computed from scratch.
+    Also used by the prefetcher to warm fetch_cache.
+    """
+    needed = resolve_dependencies(selection)
+    sections = {}
+    if "price_history" in needed:
+        df_with_indicators, final_row_data = load_price_indicators(symbol)
+
+        if wants(selection, "volume_features"):
+            try:
+                volume_features = calculate_volume_features(df_with_indicators) 
+                logger.info(f"Volume features calculated: {volume_features}")
+            except Exception as e:
+                logger.error(f"Error calculating volume features for {symbol}: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=f"Error calculating volume features: {str(e)}")
+            sections["volume_features"] = select_subfields(volume_features, selection["volume_features"])
+
+        if wants(selection, "technical_indicators"):
+            technical_indicators = build_technical_indicators(symbol, df_with_indicators, final_row_data, selection)
+            sections["technical_indicators"] = select_subfields(technical_indicators, selection["technical_indicators"])
+
+    if wants(selection, "fundamentals"):
         try:
-            fundamentals = fetch_fundamentals(request.symbol, settings.ALPHA_VANTAGE_API_KEY)
+            fundamentals = fetch_fundamentals(symbol, settings.ALPHA_VANTAGE_API_KEY)
             logger.info(f"Fundamentals fetched: {fundamentals}")
         except Exception as e:
-            logger.error(f"Error fetching fundamentals for {request.symbol}: {str(e)}", exc_info=True)
+            logger.error(f"Error fetching fundamentals for {symbol}: {str(e)}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Error fetching fundamentals: {str(e)}")
+        sections["fundamentals"] = select_subfields(fundamentals, selection["fundamentals"])
 
-        # Fetch news sentiment
+    # Fetch news sentiment
+    if wants(selection, "news_sentiment") or wants(selection, "advanced_news_sentiment"):
+        # A recent /news/batch result already holds both sections
+        batched = cached_news(symbol) or {}
         try:
-            news_sentiment = fetch_news_sentiment(request.symbol, settings.ALPHA_VANTAGE_API_KEY)
-            advanced_news_sentiment = fetch_advanced_news_sentiment(request.symbol, settings.ALPHA_VANTAGE_API_KEY)
-            logger.info(f"News sentiment fetched: {news_sentiment}")
+            if batched:
+                sections.update({section: values for section, values in batched.items() if wants(selection, section)})
+            elif wants(selection, "news_sentiment"):
+                sections["news_sentiment"] = fetch_news_sentiment(symbol, settings.ALPHA_VANTAGE_API_KEY)
+                logger.info(f"News sentiment fetched: {sections['news_sentiment']}")
+            if not batched and wants(selection, "advanced_news_sentiment"):
+                sections["advanced_news_sentiment"] = fetch_advanced_news_sentiment(symbol, settings.ALPHA_VANTAGE_API_KEY)
         except Exception as e:
-            logger.error(f"Error fetching news sentiment for {request.symbol}: {str(e)}", exc_info=True)
-            news_sentiment = {"error": str(e)}
-            advanced_news_sentiment = {"error": str(e)}
+            logger.error(f"Error fetching news sentiment for {symbol}: {str(e)}", exc_info=True)
+            for section in ("news_sentiment", "advanced_news_sentiment"):
+                if wants(selection, section):
+                    sections[section] = {"error": str(e)}
+        for section in ("news_sentiment", "advanced_news_sentiment"):
+            if section in sections:
+                sections[section] = select_subfields(sections[section], selection[section])
 
+    extended_sections = ("extended_fundamentals", "technical_indicators_ext", "volume_features_ext")
+    if any(wants(selection, section) for section in extended_sections):
         try:
-            extended_fundamentals = fetch_extended_fundamentals(request.symbol, settings.ALPHA_VANTAGE_API_KEY)
-            technical_indicators_ext = {
-                "aroon": fetch_aroon(request.symbol, settings.ALPHA_VANTAGE_API_KEY),
-                "adx": fetch_adx(request.symbol, settings.ALPHA_VANTAGE_API_KEY),
-                "stoch": fetch_stoch(request.symbol, settings.ALPHA_VANTAGE_API_KEY),
-                "cci": fetch_cci(request.symbol, settings.ALPHA_VANTAGE_API_KEY),
-                "psar": fetch_psar(request.symbol, settings.ALPHA_VANTAGE_API_KEY),
+            if wants(selection, "extended_fundamentals"):
+                extended_fundamentals = fetch_extended_fundamentals(symbol, settings.ALPHA_VANTAGE_API_KEY)
+                sections["extended_fundamentals"] = select_subfields(extended_fundamentals, selection["extended_fundamentals"])
+            # Each of these is a separate upstream call, so only the selected ones are made
+            indicator_fetchers = {
+                "aroon": fetch_aroon,
+                "adx": fetch_adx,
+                "stoch": fetch_stoch,
+                "cci": fetch_cci,
+                "psar": fetch_psar,
             }
-            volume_features_ext = {
-                "cmf": fetch_chaikin_money_flow(request.symbol, settings.ALPHA_VANTAGE_API_KEY),
-                "adl": fetch_adl(request.symbol, settings.ALPHA_VANTAGE_API_KEY),
+            if wants(selection, "technical_indicators_ext"):
+                sections["technical_indicators_ext"] = {
+                    name: fetcher(symbol, settings.ALPHA_VANTAGE_API_KEY)
+                    for name, fetcher in indicator_fetchers.items()
+                    if wants(selection, "technical_indicators_ext", name)
+                }
+            volume_fetchers = {
+                "cmf": fetch_chaikin_money_flow,
+                "adl": fetch_adl,
             }
+            if wants(selection, "volume_features_ext"):
+                sections["volume_features_ext"] = {
+                    name: fetcher(symbol, settings.ALPHA_VANTAGE_API_KEY)
+                    for name, fetcher in volume_fetchers.items()
+                    if wants(selection, "volume_features_ext", name)
+                }
         except Exception as e:
-            logger.error(f"Error fetching extended features for {request.symbol}: {str(e)}", exc_info=True)
+            logger.error(f"Error fetching extended features for {symbol}: {str(e)}", exc_info=True)
             # Assign error messages to all extended features if any one of them fails
-            extended_fundamentals = {"error": str(e)}
-            technical_indicators_ext = {"error": str(e)}
-            volume_features_ext = {"error": str(e)}
-        
-        try:
-            latest_indicators_row = final_row_data.iloc[-1]
-            technical_indicators = {
-                "latest_close": float(latest_indicators_row["close"]),
-                "sma_5": float(latest_indicators_row["sma_5"]) if pd.notna(latest_indicators_row["sma_5"]) else 0.0,
-                "ema_5": float(latest_indicators_row["ema_5"]) if pd.notna(latest_indicators_row["ema_5"]) else 0.0,
-                "macd": float(latest_indicators_row["macd"]) if pd.notna(latest_indicators_row["macd"]) else 0.0,
-                "macd_signal": float(latest_indicators_row["macd_signal"]) if pd.notna(latest_indicators_row["macd_signal"]) else 0.0,
-                "macd_hist": float(latest_indicators_row["macd_hist"]) if pd.notna(latest_indicators_row["macd_hist"]) else 0.0,
-                "bb_upper": float(latest_indicators_row["bb_upper"]) if pd.notna(latest_indicators_row["bb_upper"]) else 0.0,
-                "bb_middle": float(latest_indicators_row["bb_middle"]) if pd.notna(latest_indicators_row["bb_middle"]) else 0.0,
-                "bb_lower": float(latest_indicators_row["bb_lower"]) if pd.notna(latest_indicators_row["bb_lower"]) else 0.0,
-                "open": float(latest_indicators_row["open"]) if "open" in latest_indicators_row and pd.notna(latest_indicators_row["open"]) else latest_indicators_row.get("close"),
-                "high": float(latest_indicators_row["high"]) if "high" in latest_indicators_row and pd.notna(latest_indicators_row["high"]) else latest_indicators_row.get("close"),
-                "low": float(latest_indicators_row["low"]) if "low" in latest_indicators_row and pd.notna(latest_indicators_row["low"]) else latest_indicators_row.get("close"),
-                "volume": float(latest_indicators_row["volume"]) if "volume" in latest_indicators_row and pd.notna(latest_indicators_row["volume"]) else 0.0,
-            }
-            # Add previous_close for frontend price change calculation
-            try:
-                if len(df_with_indicators) > 1:
-                    technical_indicators["previous_close"] = float(df_with_indicators.iloc[-2]["close"])
-                else:
-                    technical_indicators["previous_close"] = float(latest_indicators_row["close"])
-            except Exception:
-                technical_indicators["previous_close"] = float(latest_indicators_row["close"])
-            # Fetch RSI from Alpha Vantage and add to technical_indicators
-            technical_indicators["rsi"] = fetch_rsi(request.symbol, settings.ALPHA_VANTAGE_API_KEY)
-            logger.info(f"Technical indicators prepared for response: {technical_indicators}")
-        except IndexError:
-             logger.error(f"Cannot extract latest_indicators_row for {request.symbol}, final_row_data might be empty.", exc_info=True)
-             raise HTTPException(status_code=500, detail="Failed to extract features from processed data.")
-        except Exception as e:
-            logger.error(f"Error preparing technical indicators for response for {request.symbol}: {str(e)}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Error preparing technical indicators for response: {str(e)}")
-        
-        logger.info(f"Successfully completed data fetch for {request.symbol}")
-        
-        return StockDataResponse(
-            symbol=request.symbol,
-            technical_indicators=technical_indicators,
-            volume_features=volume_features,
-            fundamentals=fundamentals,
-            news_sentiment=news_sentiment,
-            advanced_news_sentiment=advanced_news_sentiment,
-            extended_fundamentals=extended_fundamentals,
-            technical_indicators_ext=technical_indicators_ext,
-            volume_features_ext=volume_features_ext
-        )
+            for section in extended_sections:
+                if wants(selection, section):
+                    sections[section] = {"error": str(e)}
+    
+    logger.info(f"Successfully completed data fetch for {symbol}")
+
+    # A fresh snapshot of the latest bar is what alert rules are evaluated against
+    try:
+        get_alert_engine().evaluate(symbol, snapshot_metrics(sections))
+    except Exception as e:
+        logger.error(f"Error evaluating alerts for {symbol}: {str(e)}", exc_info=True)
+    return sections
+
+def fetch_response(symbol: str, sections: dict, if_none_match: Optional[str]):
+    result = jsonable_encoder(StockDataResponse(symbol=symbol, **sections), exclude_unset=True)
+    # Unselected sections and subfields are left out rather than sent as nulls
+    payload = {key: value for key, value in result.items() if key == "symbol" or key in sections}
+    return conditional_json_response(json_safe(payload), if_none_match)
+
+def load_as_of_sections(request: StockDataRequest, selection: dict) -> dict:
+    """The selected sections as of request.date, computed from the price, fundamentals and news stores."""
+    try:
+        as_of = pd.to_datetime(request.date).date()
+    except ValueError:
+        logger.error(f"Invalid date format provided: {request.date}")
+        raise HTTPException(status_code=400, detail=f"Invalid date format: {request.date}. Use YYYY-MM-DD.")
+    try:
+        sections = as_of_sections(request.symbol, as_of, selection)
+    except AsOfDataMissing as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error building point-in-time data for {request.symbol} on {as_of}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error building point-in-time data: {str(e)}")
+    return {section: select_subfields(values, selection[section]) for section, values in sections.items()}
+
+def load_price_indicators(symbol: str):
+    """
+    Recent price history with indicators for an undated /fetch request, plus the latest row,
+    which the snapshot is taken from. Dated requests go through load_as_of_sections instead.
+    """
+    # Alpha Vantage by default; see PRICE_PROVIDER for the yfinance and hedged modes
+    df = get_price_provider().fetch(symbol)
+    # Check for invalid API key or error message in response
+    if hasattr(df, 'error') or (isinstance(df, dict) and 'Error Message' in df):
+        logger.error(f"Alpha Vantage API key invalid or error: {getattr(df, 'error', df.get('Error Message', 'Unknown error'))}")
+        raise HTTPException(status_code=500, detail="Alpha Vantage API key is invalid or request failed.")
+    if df.empty:
+        logger.warning(f"No data returned from the price provider for symbol {symbol}")
+        raise HTTPException(status_code=404, detail=f"No data found for symbol {symbol} on the specified date or in recent history.")
+    
+    logger.info(f"Price data obtained for {symbol}. Shape: {df.shape}")
+    
+    try:
+        df_with_indicators = add_technical_indicators(df.copy())
+        logger.info(f"Technical indicators added. Columns: {df_with_indicators.columns.tolist()}")
+    except Exception as e:
+        logger.error(f"Error calculating technical indicators for {symbol}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error calculating technical indicators: {str(e)}")
+    
+    final_row_data = df_with_indicators.iloc[-1:]
+    if final_row_data.empty:
+        raise HTTPException(status_code=404, detail=f"No data available for {symbol} to extract features after indicator calculation.")
+    return df_with_indicators, final_row_data
+
+def build_technical_indicators(symbol: str, df_with_indicators: pd.DataFrame, final_row_data: pd.DataFrame, selection: dict) -> dict:
+    """The technical_indicators section; the RSI upstream call is only made when rsi is selected."""
+    try:
+        latest_indicators_row = final_row_data.iloc[-1]
+        technical_indicators = indicator_snapshot(df_with_indicators, latest_indicators_row)
+        # Fetch RSI from Alpha Vantage and add to technical_indicators
+        if wants(selection, "technical_indicators", "rsi"):
+            technical_indicators["rsi"] = fetch_rsi(symbol, settings.ALPHA_VANTAGE_API_KEY)
+        logger.info(f"Technical indicators prepared for response: {technical_indicators}")
+        return technical_indicators
+    except IndexError:
+         logger.error(f"Cannot extract latest_indicators_row for {symbol}, final_row_data might be empty.", exc_info=True)
+         raise HTTPException(status_code=500, detail="Failed to extract features from processed data.")
+    except Exception as e:
+        logger.error(f"Error preparing technical indicators for response for {symbol}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error preparing technical indicators for response: {str(e)}")
+
+@app.post("/history", response_model=HistoryResponse)
+async def fetch_history(request: HistoryRequest, if_none_match: Optional[str] = Header(default=None)):
+    """
+    Price and indicator history in columnar form (parallel arrays keyed by column name).
+    Series longer than `points` are downsampled with Largest-Triangle-Three-Buckets on the close.
+    """
+    try:
+        # Store reads, provider top-ups and the indicator/downsampling work all block, so they run off the event loop
+        result = await asyncio.to_thread(build_history, request)
+        return conditional_json_response(jsonable_encoder(result), if_none_match)
     except HTTPException as e:
         raise e
     except Exception as e:
-        logger.error(f"Unexpected error fetching stock data for {request.symbol}: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+        logger.error(f"Error building price history for {request.symbol}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error building price history: {str(e)}")
+
+def build_history(request: HistoryRequest) -> HistoryResponse:
+    """The /history response for `request`."""
+    reject_unknown_symbol(request.symbol)
+    df = get_price_history(request.symbol)
+    if df.empty:
+        raise HTTPException(status_code=404, detail=f"No price history found for symbol {request.symbol}.")
+
+    # Indicators are computed on the whole series so the first rows of a window are warmed up.
+    # Bars before an indicator has enough history stay null rather than borrowing later values.
+    if request.indicators:
+        df = add_technical_indicators(df.copy(), fill=False)
+    if request.expressions:
+        try:
+            derived = compile_expressions(request.expressions).evaluate(history_columns(df))
+        except ExpressionError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        df = df.assign(**derived)
+
+    try:
+        if request.start:
+            df = df[df["date"] >= pd.to_datetime(request.start).date()]
+        if request.end:
+            df = df[df["date"] <= pd.to_datetime(request.end).date()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid start/end date format. Use YYYY-MM-DD.")
+    if df.empty:
+        raise HTTPException(status_code=404, detail=f"No price history for {request.symbol} in the requested range.")
+
+    total_points = len(df)
+    if request.points:
+        keep = lttb_indices(np.arange(total_points), df["close"].to_numpy(dtype=float), request.points)
+        df = df.iloc[keep]
+
+    columns = {"date": [d.isoformat() for d in df["date"]]}
+    for column in df.columns.drop("date"):
+        values = df[column].to_numpy(dtype=float)
+        columns[column] = [None if np.isnan(v) else float(v) for v in values]
+
+    return HistoryResponse(symbol=request.symbol, total_points=total_points, points=len(df), columns=columns)
+
+@app.post("/screen", response_model=ScreenResponse)
+async def screen_symbols(request: ScreenRequest):
+    """
+    Evaluate expressions over several symbols at once. Histories are aligned into a
+    (dates x symbols) panel so each expression runs as one vectorized pass; the latest
+    value of each expression is returned per symbol.
+    """
+    histories, missing = {}, []
+    for symbol in request.symbols:
+        # One store read (and possibly a provider top-up) per symbol, off the event loop
+        df = await asyncio.to_thread(get_price_history, symbol) if not rejection_reason(symbol) else pd.DataFrame()
+        if df.empty:
+            missing.append(symbol)
+        else:
+            histories[symbol] = df
+    if not histories:
+        raise HTTPException(status_code=404, detail="No price history found for any of the requested symbols.")
+
+    dates, symbols, columns = panel_columns(histories)
+    try:
+        derived = compile_expressions(request.expressions).evaluate(columns)
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    results = {}
+    for j, symbol in enumerate(symbols):
+        # Latest row where the symbol actually traded, so a stale listing doesn't report all NaN
+        traded = np.flatnonzero(~np.isnan(columns["close"][:, j]))
+        row = traded[-1] if len(traded) else len(dates) - 1
+        results[symbol] = {
+            name: None if np.isnan(values[row, j]) else float(values[row, j])
+            for name, values in derived.items()
+        }
+    return ScreenResponse(date=dates[-1].isoformat() if len(dates) else None, results=results, missing=missing)
+
+@app.post("/quotes/refresh", response_model=QuotesResponse)
+async def refresh_watchlist_quotes(request: QuotesRequest):
+    """
+    Latest price and technical_indicators snapshot for many symbols, refreshed with one
+    REALTIME_BULK_QUOTES call per 100 symbols instead of one price download each.
+    Alert rules are evaluated against every refreshed snapshot.
+    """
+    symbols = [s for s in request.symbols if not rejection_reason(s)]
+    rejected = [s for s in request.symbols if s not in symbols]
+    quotes, missing = await asyncio.to_thread(refresh_quotes, symbols) if symbols else ({}, [])
+    for symbol, snapshot in quotes.items():
+        try:
+            get_alert_engine().evaluate(symbol, snapshot_metrics({"technical_indicators": snapshot}))
+        except Exception as e:
+            logger.error(f"Error evaluating alerts for {symbol}: {str(e)}", exc_info=True)
+    return QuotesResponse(quotes=quotes, missing=rejected + missing)
+
+@app.post("/news/batch", response_model=NewsBatchResponse)
+async def fetch_news_batch(request: NewsBatchRequest):
+    """
+    news_sentiment and advanced_news_sentiment for many symbols, split out of one shared
+    NEWS_SENTIMENT feed where it covers them (see news_batch). Results also serve later /fetch calls.
+    """
+    symbols = [s for s in request.symbols if not rejection_reason(s)]
+    results, calls = await asyncio.to_thread(batch_news_sentiment, symbols) if symbols else ({}, 0)
+    for symbol in request.symbols:
+        results.setdefault(symbol, {"error": "not a valid symbol"})
+    return NewsBatchResponse(results=json_safe(results), upstream_calls=calls)
+
+@app.post("/portfolio/analytics", response_model=PortfolioResponse)
+async def analyze_portfolio(request: PortfolioRequest):
+    """
+    Correlation matrix, beta against the benchmark, annualized volatility and one-day historical VaR
+    for each symbol and for the weighted portfolio (equal weights unless given).
+    """
+    try:
+        as_of = pd.to_datetime(request.as_of).date() if request.as_of else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid as_of date format. Use YYYY-MM-DD.")
+    try:
+        # Loads every symbol's and the benchmark's history, so it runs off the event loop
+        return await asyncio.to_thread(portfolio_analytics, request.symbols, benchmark=request.benchmark, weights=request.weights,
+                                       as_of=as_of, lookback=request.lookback, confidence=request.confidence)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error computing portfolio analytics for {request.symbols}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error computing portfolio analytics: {str(e)}")
+
+@app.post("/alerts", response_model=AlertRule)
+async def create_alert(request: AlertRuleRequest, user_id: str = Depends(get_current_user)):
+    """Register a threshold alert, e.g. latest_close > 200 or rsi < 30, evaluated on every /fetch of the symbol."""
+    reject_unknown_symbol(request.symbol)
+    return get_alert_engine().add_rule(user_id, request.symbol, request.metric, request.op, request.threshold)
+
+@app.get("/alerts", response_model=List[AlertRule])
+async def list_alerts(user_id: str = Depends(get_current_user)):
+    return get_alert_engine().rules_for_user(user_id)
+
+@app.get("/alerts/triggered", response_model=List[TriggeredAlert])
+async def list_triggered_alerts(user_id: str = Depends(get_current_user)):
+    """The user's most recent triggered alerts, oldest first."""
+    return get_alert_engine().triggered_for_user(user_id)
+
+@app.delete("/alerts/{rule_id}")
+async def delete_alert(rule_id: str, user_id: str = Depends(get_current_user)):
+    if not get_alert_engine().remove_rule(rule_id, user_id=user_id):
+        raise HTTPException(status_code=404, detail=f"Alert {rule_id} not found.")
+    return {"deleted": rule_id}
+
+@app.websocket("/ws/market")
+async def market_websocket(websocket: WebSocket):
+    """
+    Live quote updates. Send {"action": "subscribe" | "unsubscribe", "symbols": ["AAPL", ...]};
+    receive a full snapshot per symbol on subscribe, then {"type": "delta", "symbol", "data"} messages
+    with only the fields that changed. Invalid symbols and subscriptions beyond
+    MARKET_HUB_MAX_SUBSCRIPTIONS per connection are answered with {"type": "error", "symbol", "detail"}.
+    """
+    await websocket.accept()
+    queue = market_hub.new_queue()
+
+    async def send_updates():
+        while True:
+            await websocket.send_json(await queue.get())
+
+    sender = asyncio.create_task(send_updates())
+    try:
+        while True:
+            message = await websocket.receive_json()
+            action = message.get("action") if isinstance(message, dict) else None
+            symbols = message.get("symbols", []) if isinstance(message, dict) else []
+            if action not in ("subscribe", "unsubscribe") or not isinstance(symbols, list):
+                await websocket.send_json({"type": "error", "detail": "Expected {\"action\": \"subscribe\"|\"unsubscribe\", \"symbols\": [...]}"})
+                continue
+            for symbol in (str(s).strip().upper() for s in symbols):
+                if action == "unsubscribe":
+                    market_hub.unsubscribe(symbol, queue)
+                    continue
+                # Every accepted symbol may start an upstream poller, so junk and excess symbols are refused
+                reason = rejection_reason(symbol)
+                subscribed = market_hub.subscribed_symbols(queue)
+                if not reason and symbol not in subscribed and len(subscribed) >= settings.MARKET_HUB_MAX_SUBSCRIPTIONS:
+                    reason = f"at most {settings.MARKET_HUB_MAX_SUBSCRIPTIONS} symbols per connection"
+                if reason:
+                    await websocket.send_json({"type": "error", "symbol": symbol, "detail": reason})
+                else:
+                    market_hub.subscribe(symbol, queue)
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        sender.cancel()
+        market_hub.unsubscribe_all(queue)
+
+@app.get("/stream/market")
+async def market_stream(request: Request, symbols: str = Query(..., min_length=1)):
+    """Server-Sent Events version of /ws/market for clients that only need to listen: ?symbols=AAPL,MSFT"""
+    wanted = sorted({s.strip().upper() for s in symbols.split(",") if s.strip()})
+    rejected = {symbol: reason for symbol in wanted if (reason := rejection_reason(symbol))}
+    if rejected:
+        raise HTTPException(status_code=400, detail={"rejected": rejected})
+    if len(wanted) > settings.MARKET_HUB_MAX_SUBSCRIPTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.MARKET_HUB_MAX_SUBSCRIPTIONS} symbols per stream")
+    queue = market_hub.new_queue()
+    for symbol in wanted:
+        market_hub.subscribe(symbol, queue)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            market_hub.unsubscribe_all(queue)
+
+    # identity encoding keeps GZipMiddleware from buffering the stream
+    headers = {"Cache-Control": "no-cache", "Content-Encoding": "identity", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+@app.get("/prefetch/stats")
+async def prefetch_stats():
+    """/fetch cache hit ratio and how often speculative prefetches were used before expiring."""
+    return prefetcher.summary()
+
+@app.get("/symbols/search", response_model=SymbolSearchResponse)
+async def search_symbols(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    """Ticker and company-name prefix autocomplete served from the local listing index."""
+    # The first call may download the listing and build the index
+    index = await asyncio.to_thread(get_symbol_index)
+    if index is None:
+        raise HTTPException(status_code=503, detail="Symbol index is not available yet.")
+    return SymbolSearchResponse(query=q, results=index.search(q, limit=limit))
 
 @app.post("/predict", response_model=PredictResponse)
 async def predict(request: PredictRequest):
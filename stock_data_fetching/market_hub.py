@@ -0,0 +1,164 @@
+"""
+Shared market-data fan-out for WebSocket and SSE clients.
+
+Clients subscribe to symbols; the hub runs a single polling task (started with the first
+subscriber, cancelled with the last) that quotes every watched symbol with one REALTIME_BULK_QUOTES
+call per BULK_QUOTE_LIMIT symbols each tick, and pushes only the fields that changed since the
+previous poll to every subscriber's queue. Upstream calls therefore grow with the number of
+hundred-symbol batches being watched, not with symbols or open browsers.
+"""
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from stock_data_fetching.alerts import get_alert_engine
+from stock_data_fetching.bulk_quotes import fetch_quotes
+from stock_data_fetching.config import settings
+from stock_data_fetching.logger import logger
+from stock_data_fetching.price_store import load_history
+
+# Snapshot field -> alert metric it feeds
+ALERT_FIELDS = {
+    "close": "latest_close",
+    "previous_close": "previous_close",
+    "open": "open",
+    "high": "high",
+    "low": "low",
+    "volume": "volume",
+}
+
+
+def _previous_close(symbol: str, quote: dict) -> float:
+    if quote["previous_close"] is not None:
+        return quote["previous_close"]
+    history = load_history(symbol)
+    earlier = history[history["date"] < quote["date"]]
+    return float(earlier["close"].iloc[-1]) if not earlier.empty else quote["close"]
+
+
+def fetch_quote_snapshots(symbols: List[str]) -> Dict[str, dict]:
+    """
+    Latest quote plus the change from the previous close for every symbol that has one. Each quote
+    is kept as the symbol's provisional bar in the price store.
+    """
+    snapshots = {}
+    for symbol, quote in fetch_quotes(symbols).items():
+        close = quote["close"]
+        previous_close = _previous_close(symbol, quote)
+        snapshots[symbol] = {
+            "date": quote["date"].isoformat(),
+            "open": quote["open"],
+            "high": quote["high"],
+            "low": quote["low"],
+            "close": close,
+            "volume": quote["volume"],
+            "previous_close": previous_close,
+            "change": round(close - previous_close, 4),
+            "change_percent": round((close - previous_close) / previous_close * 100, 4) if previous_close else 0.0,
+        }
+    return snapshots
+
+
+def diff_snapshot(previous: Optional[dict], current: dict) -> dict:
+    """Fields of `current` that are new or changed compared to `previous`."""
+    if not previous:
+        return dict(current)
+    return {key: value for key, value in current.items() if previous.get(key) != value}
+
+
+class MarketHub:
+    def __init__(self, poll_seconds: float = 60.0, queue_size: int = 100, fetch=fetch_quote_snapshots):
+        self.poll_seconds = poll_seconds
+        self.queue_size = queue_size
+        self.fetch = fetch
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._snapshots: Dict[str, dict] = {}
+        self.stats = {"polls": 0, "messages": 0, "dropped": 0}
+
+    def new_queue(self) -> asyncio.Queue:
+        """One queue per client connection, shared by all of that client's subscriptions."""
+        return asyncio.Queue(maxsize=self.queue_size)
+
+    def _push(self, queue: asyncio.Queue, message: dict) -> None:
+        # A client that stops reading loses its oldest updates instead of holding up everyone else
+        if queue.full():
+            queue.get_nowait()
+            self.stats["dropped"] += 1
+        queue.put_nowait(message)
+        self.stats["messages"] += 1
+
+    def subscribe(self, symbol: str, queue: asyncio.Queue) -> None:
+        symbol = symbol.upper()
+        subscribers = self._subscribers.setdefault(symbol, set())
+        if queue in subscribers:
+            return
+        subscribers.add(queue)
+        # New subscribers get the full current snapshot, then deltas
+        if symbol in self._snapshots:
+            self._push(queue, {"type": "snapshot", "symbol": symbol, "data": self._snapshots[symbol]})
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+        if len(subscribers) == 1:
+            logger.info(f"Market hub watching {symbol} ({len(self._subscribers)} symbols)")
+
+    def unsubscribe(self, symbol: str, queue: asyncio.Queue) -> None:
+        symbol = symbol.upper()
+        subscribers = self._subscribers.get(symbol)
+        if not subscribers:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[symbol]
+            self._snapshots.pop(symbol, None)
+        if not self._subscribers and self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    def unsubscribe_all(self, queue: asyncio.Queue) -> None:
+        for symbol in [s for s, subscribers in self._subscribers.items() if queue in subscribers]:
+            self.unsubscribe(symbol, queue)
+
+    def subscribed_symbols(self, queue: asyncio.Queue) -> Set[str]:
+        """Symbols one client connection is subscribed to."""
+        return {symbol for symbol, subscribers in self._subscribers.items() if queue in subscribers}
+
+    def subscriber_count(self, symbol: str) -> int:
+        return len(self._subscribers.get(symbol.upper(), ()))
+
+    def _publish(self, symbol: str, snapshot: dict) -> None:
+        previous = self._snapshots.get(symbol)
+        delta = diff_snapshot(previous, snapshot)
+        if not delta:
+            return
+        self._snapshots[symbol] = snapshot
+        message = {"type": "delta" if previous else "snapshot", "symbol": symbol, "data": delta}
+        for queue in list(self._subscribers.get(symbol, ())):
+            self._push(queue, message)
+        get_alert_engine().evaluate(symbol, {
+            metric: float(snapshot[field]) for field, metric in ALERT_FIELDS.items() if field in snapshot
+        })
+
+    async def _poll(self) -> None:
+        while True:
+            symbols = sorted(self._subscribers)
+            try:
+                snapshots = await asyncio.to_thread(self.fetch, symbols)
+                self.stats["polls"] += 1
+            except Exception as e:
+                logger.error(f"Market hub poll failed for {len(symbols)} symbols: {str(e)}")
+                snapshots = {}
+
+            for symbol, snapshot in snapshots.items():
+                # Skip symbols whose last subscriber left while the batch was in flight
+                if symbol in self._subscribers:
+                    self._publish(symbol, snapshot)
+            await asyncio.sleep(self.poll_seconds)
+
+    async def close(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        self._subscribers.clear()
+
+market_hub = MarketHub(poll_seconds=settings.MARKET_HUB_POLL_SECONDS, queue_size=settings.MARKET_HUB_QUEUE_SIZE)
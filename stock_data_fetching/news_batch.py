@@ -0,0 +1,168 @@
+"""
+News sentiment for many symbols with as few NEWS_SENTIMENT calls as possible.
+
+A comma-separated `tickers` filter makes Alpha Vantage return only articles that mention *all*
+of the tickers, so watchlist symbols can't simply be grouped into one filtered call. Instead:
+  1. the unfiltered market feed for the NEWS_DAYS window (shared by every batch for
+     NEWS_BATCH_TTL_SECONDS) is split per symbol using each article's `ticker_sentiment` list.
+     One call returns at most NEWS_BATCH_FEED_LIMIT articles, usually well under the window, so
+     it is walked back in time_to slices. That only pays off while it costs fewer calls than the
+     symbols it serves; the time one slice spans is remembered, and the feed is skipped (or the
+     walk abandoned) as soon as covering the window is expected to cost more.
+  2. symbols with fewer than NEWS_BATCH_MIN_ARTICLES articles in it, or all of them when the feed
+     isn't used, get one filtered call each, which answers both news sections
+Per-symbol results are cached for NEWS_BATCH_TTL_SECONDS and also used by /fetch.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from stock_data_fetching.config import settings
+from stock_data_fetching.logger import logger
+from stock_data_fetching.news_features import advanced_sentiment_from_feed, summarize_news_feed
+
+NEWS_DAYS = 7
+# NEWS_SENTIMENT's default page size; fetch_news_sentiment summarizes this many articles
+SUMMARY_ARTICLES = 50
+
+# "market" -> (expiry, feed); symbol -> (expiry, sections)
+_feed_cache: Dict[str, Tuple[float, list]] = {}
+_results: Dict[str, Tuple[float, dict]] = {}
+# "market" -> seconds of news one full feed call covered last time
+_slice_seconds: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def _news_feed(query: str, api_key: str) -> list:
+    url = f"https://www.alphavantage.co/query?function=NEWS_SENTIMENT{query}&sort=LATEST&apikey={api_key}"
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    if "feed" not in data:
+        raise ValueError(data.get("Information") or data.get("Error Message") or "NEWS_SENTIMENT returned no feed")
+    return data["feed"]
+
+
+def _published(article: dict) -> datetime:
+    return datetime.strptime(article["time_published"], "%Y%m%dT%H%M%S")
+
+
+def feed_covers(feed: list, since: datetime) -> bool:
+    """Whether the oldest article of `feed` was published at or before `since`."""
+    oldest = min((article.get("time_published", "") for article in feed), default="")
+    return bool(oldest) and oldest <= f"{since:%Y%m%dT%H%M%S}"
+
+
+def _market_feed(api_key: str, since: datetime, budget: int) -> Tuple[Optional[list], int]:
+    """
+    Every article across all tickers published since `since`, walked back in time_to slices of up
+    to NEWS_BATCH_FEED_LIMIT articles and cached for NEWS_BATCH_TTL_SECONDS. Returns (feed, calls
+    made); the feed is None when covering the window is expected to take more than `budget` calls.
+    """
+    with _lock:
+        cached = _feed_cache.get("market")
+        if cached and cached[0] > time.monotonic():
+            return cached[1], 0
+        slice_seconds = _slice_seconds.get("market")
+    now = datetime.utcnow()
+    if budget < 1 or (slice_seconds and math.ceil((now - since).total_seconds() / slice_seconds) > budget):
+        return None, 0
+
+    limit = settings.NEWS_BATCH_FEED_LIMIT
+    articles: Dict[str, dict] = {}
+    until, calls = None, 0
+    while True:
+        query = f"&time_from={since:%Y%m%dT%H%M}&limit={limit}" + (f"&time_to={until:%Y%m%dT%H%M}" if until else "")
+        page = _news_feed(query, api_key)
+        calls += 1
+        new = {a.get("url") or a.get("title"): a for a in page if (a.get("url") or a.get("title")) not in articles}
+        articles.update(new)
+        if len(page) < limit or feed_covers(page, since):
+            break
+        oldest = min(_published(a) for a in page)
+        if not new or (until is not None and oldest >= until):
+            # A single minute holds more than `limit` articles; the window can't be walked further
+            return None, calls
+        until = oldest
+        slice_seconds = (now - oldest).total_seconds() / calls
+        with _lock:
+            _slice_seconds["market"] = slice_seconds
+        if calls + math.ceil((oldest - since).total_seconds() / slice_seconds) > budget:
+            logger.info(f"Shared news feed covers {slice_seconds / 3600:.1f}h per call, too short for {budget} calls")
+            return None, calls
+
+    feed = sorted(articles.values(), key=lambda a: a.get("time_published", ""), reverse=True)
+    with _lock:
+        _feed_cache["market"] = (time.monotonic() + settings.NEWS_BATCH_TTL_SECONDS, feed)
+    return feed, calls
+
+
+def split_feed_by_ticker(feed: list, symbols: List[str]) -> Dict[str, list]:
+    """Articles of `feed` per requested symbol, by the tickers in each article's ticker_sentiment."""
+    wanted = set(symbols)
+    per_symbol = {symbol: [] for symbol in symbols}
+    for article in feed:
+        for entry in article.get("ticker_sentiment", []):
+            ticker = str(entry.get("ticker", "")).upper()
+            if ticker in wanted:
+                per_symbol[ticker].append(article)
+    return per_symbol
+
+
+def news_sections(feed: list, symbol: str, since: datetime) -> dict:
+    """Both /fetch news sections for `symbol` from one feed of its articles (newest first)."""
+    return {
+        "news_sentiment": summarize_news_feed(feed[:SUMMARY_ARTICLES]),
+        "advanced_news_sentiment": advanced_sentiment_from_feed(feed, symbol, since),
+    }
+
+
+def cached_news(symbol: str) -> Optional[dict]:
+    """A batch result for `symbol` that is still fresh, if any."""
+    with _lock:
+        cached = _results.get(symbol.upper())
+    return cached[1] if cached and cached[0] > time.monotonic() else None
+
+
+def batch_news_sentiment(symbols: List[str], api_key: str = None) -> Tuple[Dict[str, dict], int]:
+    """
+    news_sentiment and advanced_news_sentiment for every symbol.
+    Returns ({symbol: sections}, number of upstream calls made).
+    """
+    api_key = api_key or settings.ALPHA_VANTAGE_API_KEY
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols))
+    results = {symbol: cached_news(symbol) for symbol in symbols}
+    pending = [symbol for symbol, sections in results.items() if sections is None]
+    if not pending:
+        return results, 0
+
+    since = datetime.utcnow() - timedelta(days=NEWS_DAYS)
+    calls = 0
+    per_symbol = {}
+    try:
+        # The shared feed has to cost fewer calls than fetching every pending symbol on its own
+        feed, calls = _market_feed(api_key, since, budget=len(pending) - 1)
+        if feed is not None:
+            per_symbol = split_feed_by_ticker(feed, pending)
+    except Exception as e:
+        logger.warning(f"Shared news feed unavailable, fetching per symbol: {str(e)}")
+
+    for symbol in pending:
+        feed = per_symbol.get(symbol)
+        if feed is None or len(feed) < settings.NEWS_BATCH_MIN_ARTICLES:
+            try:
+                calls += 1
+                feed = _news_feed(f"&tickers={symbol}&limit=1000", api_key)
+            except Exception as e:
+                logger.error(f"Error fetching news sentiment for {symbol}: {str(e)}")
+                results[symbol] = {"news_sentiment": {"error": str(e)}, "advanced_news_sentiment": {"error": str(e)}}
+                continue
+        results[symbol] = news_sections(feed, symbol, since)
+        with _lock:
+            _results[symbol] = (time.monotonic() + settings.NEWS_BATCH_TTL_SECONDS, results[symbol])
+    logger.info(f"News for {len(symbols)} symbols with {calls} NEWS_SENTIMENT calls")
+    return results, calls
@@ -0,0 +1,131 @@
+"""
+Risk analytics for a set of symbols (typically a user's watchlist) from the local price store.
+
+Daily returns of every symbol and the benchmark are aligned on their common trading dates into one
+(days x assets) matrix. A single covariance matrix then gives volatility (its diagonal),
+correlation (the covariance scaled by volatilities), beta (each column's covariance with the
+benchmark over the benchmark's variance) and the equal- or custom-weighted portfolio's variance.
+Historical VaR is a per-column quantile of the same matrix.
+"""
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from stock_data_fetching.price_store import get_price_history, load_history
+
+TRADING_DAYS = 252
+
+
+def aligned_returns(symbols: Tuple[str, ...], as_of: Optional[date] = None, lookback: int = TRADING_DAYS) -> pd.DataFrame:
+    """Daily simple returns of adjusted closes on the dates every symbol traded, up to `as_of`."""
+    closes = {}
+    for symbol in symbols:
+        history = load_history(symbol)
+        if history.empty:
+            raise ValueError(f"No price history found for symbol {symbol}.")
+        closes[symbol] = history.set_index("date")["adjusted_close"].astype(float)
+    prices = pd.DataFrame(closes).dropna()
+    if as_of is not None:
+        prices = prices[prices.index <= as_of]
+    # One extra price row so the window holds `lookback` returns
+    return prices.tail(lookback + 1).pct_change().iloc[1:]
+
+
+def compute_risk_metrics(returns: np.ndarray, weights: np.ndarray, confidence: float = 0.95) -> dict:
+    """
+    Risk metrics from a (days x assets) return matrix whose last column is the benchmark.
+    `weights` covers the non-benchmark columns and sums to 1.
+    """
+    observations = returns.shape[0]
+    centered = returns - returns.mean(axis=0)
+    cov = centered.T @ centered / (observations - 1)
+    vol = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(vol, vol)
+    benchmark_var = cov[-1, -1]
+    beta = cov[:, -1] / benchmark_var if benchmark_var > 0 else np.full(len(vol), np.nan)
+    var = -np.quantile(returns, 1 - confidence, axis=0)
+
+    assets = cov[:-1, :-1]
+    portfolio_returns = returns[:, :-1] @ weights
+    return {
+        "observations": observations,
+        "volatility": vol * np.sqrt(TRADING_DAYS),
+        "beta": beta,
+        "var": var,
+        "correlation": corr,
+        "covariance": cov,
+        "portfolio_volatility": float(np.sqrt(weights @ assets @ weights) * np.sqrt(TRADING_DAYS)),
+        "portfolio_beta": float(weights @ beta[:-1]),
+        "portfolio_var": float(-np.quantile(portfolio_returns, 1 - confidence)),
+    }
+
+
+def _clean(value: float) -> Optional[float]:
+    return None if not np.isfinite(value) else float(value)
+
+
+@lru_cache(maxsize=256)
+def _cached_analytics(symbols: Tuple[str, ...], weights: Tuple[float, ...], benchmark: str, as_of: date,
+                      lookback: int, confidence: float) -> dict:
+    returns = aligned_returns(symbols + (benchmark,), as_of=as_of, lookback=lookback)
+    if len(returns) < 2:
+        raise ValueError("Not enough overlapping history to compute risk metrics.")
+    metrics = compute_risk_metrics(returns.to_numpy(), np.array(weights), confidence)
+    names = list(symbols) + [benchmark]
+    return {
+        "as_of": returns.index[-1].isoformat(),
+        "benchmark": benchmark,
+        "observations": metrics["observations"],
+        "confidence": confidence,
+        "symbols": {
+            name: {
+                "volatility": _clean(metrics["volatility"][i]),
+                "beta": _clean(metrics["beta"][i]),
+                "var": _clean(metrics["var"][i]),
+            }
+            for i, name in enumerate(names)
+        },
+        "correlation": {
+            a: {b: _clean(metrics["correlation"][i, j]) for j, b in enumerate(names)}
+            for i, a in enumerate(names)
+        },
+        "portfolio": {
+            "weights": dict(zip(symbols, weights)),
+            "volatility": _clean(metrics["portfolio_volatility"]),
+            "beta": _clean(metrics["portfolio_beta"]),
+            "var": _clean(metrics["portfolio_var"]),
+        },
+    }
+
+
+def portfolio_analytics(symbols: list, benchmark: str = "SPY", weights: Optional[Dict[str, float]] = None,
+                        as_of: Optional[date] = None, lookback: int = TRADING_DAYS, confidence: float = 0.95) -> dict:
+    """
+    Correlation, beta, volatility and historical VaR for `symbols` against `benchmark`.
+    Stored histories are topped up first; results are cached per (symbol set, weights, as-of date, window).
+    """
+    symbols = tuple(sorted({s.upper() for s in symbols} - {benchmark.upper()}))
+    benchmark = benchmark.upper()
+    if not symbols:
+        raise ValueError("At least one symbol other than the benchmark is required.")
+
+    weights = {k.upper(): float(v) for k, v in (weights or {}).items()}
+    raw = np.array([weights.get(s, 0.0 if weights else 1.0) for s in symbols])
+    if raw.sum() <= 0:
+        raise ValueError("Weights must sum to a positive number.")
+
+    latest = {}
+    for symbol in symbols + (benchmark,):
+        history = get_price_history(symbol)
+        if history.empty:
+            raise ValueError(f"No price history found for symbol {symbol}.")
+        latest[symbol] = history["date"].max()
+    # The last date every series has is the as-of date, so the cache key is stable until new bars arrive
+    resolved = min(latest.values())
+    if as_of is not None:
+        resolved = min(resolved, as_of)
+    return _cached_analytics(symbols, tuple((raw / raw.sum()).tolist()), benchmark, resolved, lookback, confidence)
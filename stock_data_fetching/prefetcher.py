@@ -0,0 +1,257 @@
+"""
+Predictive prefetching for /fetch.
+
+Live /fetch results are kept for FETCH_CACHE_SECONDS. The prefetcher watches which symbols each
+client asks for, one after another, and keeps two statistics:
+  - popularity: an exponentially decayed request count per symbol (recent and frequent both count)
+  - co-access: decayed counts of "B was requested within PREFETCH_SESSION_SECONDS after A" by the same client
+After a request for A, the most likely next symbols are queued with the fields A was requested
+with. A background loop warms them when the service has been idle for PREFETCH_IDLE_SECONDS. Each
+prefetch is charged the Alpha Vantage calls its fields need, and at most PREFETCH_PER_MINUTE calls a
+minute and PREFETCH_PER_DAY a day are spent. When nothing is queued, the hottest symbols whose
+popularity is still at least PREFETCH_MIN_SCORE are refreshed with the fields last asked for.
+Stats report how many requests were served from cache, and how many prefetched entries were
+actually used before they expired.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from stock_data_fetching.config import settings
+from stock_data_fetching.fieldsets import upstream_calls
+from stock_data_fetching.logger import logger
+
+
+def selection_key(symbol: str, selection: Dict[str, Optional[Set[str]]]) -> Tuple:
+    """Hashable cache key for a symbol and a parse_fields selection."""
+    return (symbol.upper(), tuple(sorted((s, tuple(sorted(sub)) if sub else None) for s, sub in selection.items())))
+
+
+class FetchCache:
+    """Bounded TTL cache of /fetch sections. Entries remember whether a prefetch filled them."""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> [expiry, sections, filled speculatively and not yet used]
+        self._entries: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "speculative_hits": 0, "prefetched": 0, "prefetch_wasted": 0}
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            if entry[2]:
+                self.stats["speculative_hits"] += 1
+                entry[2] = False
+            return entry[1]
+
+    def contains(self, key: Hashable) -> bool:
+        """Fresh entry present; unlike get, not counted as a hit or miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def put(self, key: Hashable, sections: dict, speculative: bool = False) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = [time.monotonic() + self.ttl, sections, speculative]
+            if speculative:
+                self.stats["prefetched"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _drop(self, key: Hashable) -> None:
+        if self._entries.pop(key)[2]:
+            self.stats["prefetch_wasted"] += 1
+
+    def summary(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+            # Share of speculative fetches that a real request used
+            "prefetch_precision": self.stats["speculative_hits"] / self.stats["prefetched"] if self.stats["prefetched"] else 0.0,
+        }
+
+
+class AccessModel:
+    """Decayed popularity and client-local co-access statistics with a half-life of `half_life` seconds."""
+
+    def __init__(self, half_life: float = 3600.0, session_seconds: float = 300.0, max_followers: int = 20):
+        self.decay = math.log(2) / half_life
+        self.session_seconds = session_seconds
+        self.max_followers = max_followers
+        # symbol -> (score, time of last update)
+        self.popularity: Dict[str, Tuple[float, float]] = {}
+        # symbol -> {follower: (score, time of last update)}
+        self.co_access: Dict[str, Dict[str, Tuple[float, float]]] = {}
+        # client -> (symbol, time) of their previous request
+        self._last_seen: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bump(self, table: dict, key: str, now: float) -> None:
+        score, updated = table.get(key, (0.0, now))
+        table[key] = (score * math.exp(-self.decay * (now - updated)) + 1.0, now)
+
+    def _score(self, entry: Tuple[float, float], now: float) -> float:
+        return entry[0] * math.exp(-self.decay * (now - entry[1]))
+
+    def record(self, client: str, symbol: str, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        symbol = symbol.upper()
+        with self._lock:
+            self._bump(self.popularity, symbol, now)
+            previous = self._last_seen.pop(client, None)
+            if previous and previous[0] != symbol and now - previous[1] <= self.session_seconds:
+                followers = self.co_access.setdefault(previous[0], {})
+                self._bump(followers, symbol, now)
+                if len(followers) > self.max_followers:
+                    del followers[min(followers, key=lambda s: self._score(followers[s], now))]
+            self._last_seen[client] = (symbol, now)
+            while len(self._last_seen) > 10000:
+                self._last_seen.popitem(last=False)
+
+    def likely_next(self, symbol: str, limit: int = 3, now: Optional[float] = None) -> List[str]:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            followers = self.co_access.get(symbol.upper(), {})
+            ranked = sorted(followers, key=lambda s: self._score(followers[s], now), reverse=True)
+        return ranked[:limit]
+
+    def hottest(self, limit: int = 10, now: Optional[float] = None, min_score: float = 0.0) -> List[str]:
+        """The most popular symbols, leaving out those whose decayed score fell below `min_score`."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            scores = {symbol: self._score(entry, now) for symbol, entry in self.popularity.items()}
+        ranked = sorted((s for s, score in scores.items() if score >= min_score), key=scores.get, reverse=True)
+        return ranked[:limit]
+
+
+class Prefetcher:
+    """
+    Ties the access model to the cache. `build` computes the sections for (symbol, selection)
+    exactly as /fetch would; it is only called from the background loop.
+    """
+
+    def __init__(self, cache: FetchCache, model: AccessModel, build: Optional[Callable] = None,
+                 per_minute: int = 0, per_day: int = 0, min_score: float = 0.0, idle_seconds: float = 5.0,
+                 fanout: int = 3):
+        self.cache = cache
+        self.model = model
+        self.build = build
+        # Upstream calls; per_day=0 means no daily limit
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.min_score = min_score
+        self.idle_seconds = idle_seconds
+        self.fanout = fanout
+        # key -> selection, in the order predictions were made (newest last)
+        self._queue: "OrderedDict[Hashable, Tuple[str, dict]]" = OrderedDict()
+        # symbol -> the selection it was last requested with
+        self._selections: "OrderedDict[str, dict]" = OrderedDict()
+        self._last_request = 0.0
+        # (time, upstream calls) of each prefetch in the last day
+        self._spent: List[Tuple[float, int]] = []
+
+    def observe(self, client: str, symbol: str, selection: dict) -> None:
+        """Record a foreground /fetch and queue the symbols likely to be requested next with the same fields."""
+        self._last_request = time.monotonic()
+        self.model.record(client, symbol)
+        self._selections.pop(symbol.upper(), None)
+        self._selections[symbol.upper()] = selection
+        while len(self._selections) > 10000:
+            self._selections.popitem(last=False)
+        for follower in self.model.likely_next(symbol, self.fanout):
+            key = selection_key(follower, selection)
+            self._queue.pop(key, None)
+            self._queue[key] = (follower, selection)
+        while len(self._queue) > 100:
+            self._queue.popitem(last=False)
+
+    def _affordable(self, calls: int, now: float) -> bool:
+        """Whether `calls` more upstream calls fit in the per-minute and per-day budgets."""
+        self._spent = [(t, n) for t, n in self._spent if now - t < 86400]
+        last_minute = sum(n for t, n in self._spent if now - t < 60)
+        last_day = sum(n for _, n in self._spent)
+        return last_minute + calls <= self.per_minute and (not self.per_day or last_day + calls <= self.per_day)
+
+    def next_candidate(self) -> Optional[Tuple[Hashable, str, dict]]:
+        """Newest queued prediction that isn't cached yet, falling back to popular symbols with their last fields."""
+        while self._queue:
+            key, (symbol, selection) = self._queue.popitem(last=True)
+            if not self.cache.contains(key):
+                return key, symbol, selection
+        for symbol in self.model.hottest(min_score=self.min_score):
+            selection = self._selections.get(symbol)
+            if selection is None:
+                continue
+            key = selection_key(symbol, selection)
+            if not self.cache.contains(key):
+                return key, symbol, selection
+        return None
+
+    async def warm_once(self) -> bool:
+        """Prefetch one candidate if the service is idle and the budget allows. Returns whether it fetched."""
+        now = time.monotonic()
+        if self.build is None or now - self._last_request < self.idle_seconds or not self._affordable(1, now):
+            return False
+        candidate = self.next_candidate()
+        if candidate is None:
+            return False
+        key, symbol, selection = candidate
+        calls = upstream_calls(selection)
+        if not self._affordable(calls, now):
+            # Retried once the budget has recovered, unless it could never fit in a minute
+            if calls <= self.per_minute:
+                self._queue[key] = (symbol, selection)
+            return False
+        self._spent.append((now, calls))
+        try:
+            sections = await asyncio.to_thread(self.build, symbol, selection)
+        except Exception as e:
+            logger.info(f"Prefetch of {symbol} failed: {str(e)}")
+            return False
+        self.cache.put(key, sections, speculative=True)
+        logger.info(f"Prefetched {symbol}")
+        return True
+
+    async def run(self, interval: float = 1.0) -> None:
+        while True:
+            try:
+                await self.warm_once()
+            except Exception as e:
+                logger.error(f"Prefetch loop error: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def summary(self) -> dict:
+        return {**self.cache.summary(), "queued": len(self._queue), "budget_per_minute": self.per_minute,
+                "budget_per_day": self.per_day, "calls_spent_today": sum(n for _, n in self._spent),
+                "hot_symbols": self.model.hottest(5, min_score=self.min_score)}
+
+
+fetch_cache = FetchCache(settings.FETCH_CACHE_SECONDS)
+prefetcher = Prefetcher(
+    fetch_cache,
+    AccessModel(half_life=settings.PREFETCH_HALF_LIFE_SECONDS, session_seconds=settings.PREFETCH_SESSION_SECONDS),
+    per_minute=settings.PREFETCH_PER_MINUTE,
+    per_day=settings.PREFETCH_PER_DAY,
+    min_score=settings.PREFETCH_MIN_SCORE,
+    idle_seconds=settings.PREFETCH_IDLE_SECONDS,
+)
@@ -0,0 +1,155 @@
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait, FIRST_COMPLETED
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from stock_data_fetching.config import settings
+from stock_data_fetching.fetch_price_data import fetch_price_data
+from stock_data_fetching.logger import logger
+
+PRICE_COLUMNS = ["date", "open", "high", "low", "close", "adjusted_close", "volume"]
+
+
+class PriceProvider(ABC):
+    """A source of daily OHLCV bars, normalized to the schema fetch_price_data returns."""
+
+    name = "provider"
+
+    @abstractmethod
+    def fetch(self, symbol: str, days: int = 30, date: str = None, full_history: bool = False) -> pd.DataFrame:
+        """Daily bars oldest first; the last `days` rows unless `date` or `full_history` is set. Empty if unavailable."""
+
+
+class AlphaVantageProvider(PriceProvider):
+    name = "alphavantage"
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+
+    def fetch(self, symbol: str, days: int = 30, date: str = None, full_history: bool = False) -> pd.DataFrame:
+        return fetch_price_data(symbol, self.api_key, days=days, date=date, full_history=full_history)
+
+
+class YFinanceProvider(PriceProvider):
+    name = "yfinance"
+
+    def fetch(self, symbol: str, days: int = 30, date: str = None, full_history: bool = False) -> pd.DataFrame:
+        period = "max" if date or full_history else "1y"
+        hist = yf.Ticker(symbol).history(period=period, interval="1d", auto_adjust=False)
+        if hist is None or hist.empty:
+            logger.warning(f"yfinance returned no data for {symbol}")
+            return pd.DataFrame()
+
+        hist = hist.reset_index()
+        dates = pd.to_datetime(hist["Date"])
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        df = pd.DataFrame({
+            "date": dates.dt.date,
+            "open": hist["Open"].astype(float),
+            "high": hist["High"].astype(float),
+            "low": hist["Low"].astype(float),
+            "close": hist["Close"].astype(float),
+            "adjusted_close": hist.get("Adj Close", hist["Close"]).astype(float),
+            "volume": hist["Volume"].fillna(0).astype(int),
+        }).dropna(subset=["close"])
+        df = df.sort_values("date").reset_index(drop=True)
+        if not date and not full_history:
+            df = df.tail(days).reset_index(drop=True)
+        return df[PRICE_COLUMNS]
+
+
+class HedgedPriceProvider(PriceProvider):
+    """
+    Sends every request to the primary provider and fires the secondary when the primary is slower
+    than its recent latency percentile, fails, or comes back empty (Alpha Vantage answers rate limits
+    with an "Information" message, which fetch_price_data turns into an empty frame).
+    The first non-empty result wins.
+    """
+
+    name = "hedged"
+
+    def __init__(self, primary: PriceProvider, secondary: PriceProvider, percentile: float = 95.0,
+                 min_samples: int = 20, default_delay: float = 2.0, max_wait: float = 30.0):
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.max_wait = max_wait
+        self._latencies = deque(maxlen=200)
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="price-hedge")
+        self.stats = {"requests": 0, "hedged": 0, "primary_wins": 0, "secondary_wins": 0}
+
+    def hedge_delay(self) -> float:
+        """How long to wait for the primary before hedging: its latency percentile once enough samples exist."""
+        if len(self._latencies) < self.min_samples:
+            return self.default_delay
+        return float(np.percentile(self._latencies, self.percentile))
+
+    def _timed_primary(self, symbol: str, **kwargs) -> pd.DataFrame:
+        start = time.monotonic()
+        df = self.primary.fetch(symbol, **kwargs)
+        if not df.empty:
+            self._latencies.append(time.monotonic() - start)
+        return df
+
+    def fetch(self, symbol: str, days: int = 30, date: str = None, full_history: bool = False) -> pd.DataFrame:
+        kwargs = {"days": days, "date": date, "full_history": full_history}
+        self.stats["requests"] += 1
+        primary = self._executor.submit(self._timed_primary, symbol, **kwargs)
+        try:
+            df = primary.result(timeout=self.hedge_delay())
+            if not df.empty:
+                self.stats["primary_wins"] += 1
+                return df
+            logger.warning(f"{self.primary.name} returned no data for {symbol}; hedging to {self.secondary.name}")
+        except FuturesTimeout:
+            logger.info(f"{self.primary.name} slower than p{self.percentile:g} for {symbol}; hedging to {self.secondary.name}")
+        except Exception as e:
+            logger.warning(f"{self.primary.name} failed for {symbol} ({e}); hedging to {self.secondary.name}")
+
+        self.stats["hedged"] += 1
+        secondary = self._executor.submit(self.secondary.fetch, symbol, **kwargs)
+        futures = {primary: "primary", secondary: "secondary"}
+        deadline = time.monotonic() + self.max_wait
+        last_error = None
+        while futures:
+            done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                winner = futures.pop(future)
+                try:
+                    df = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if not df.empty:
+                    self.stats[f"{winner}_wins"] += 1
+                    return df
+
+        if last_error is not None:
+            logger.error(f"Both price providers failed for {symbol}: {last_error}")
+        return pd.DataFrame()
+
+
+@lru_cache()
+def get_price_provider() -> PriceProvider:
+    """The provider selected by PRICE_PROVIDER: "alphavantage" (default), "yfinance" or "hedged"."""
+    alpha_vantage = AlphaVantageProvider(settings.ALPHA_VANTAGE_API_KEY)
+    if settings.PRICE_PROVIDER == "yfinance":
+        return YFinanceProvider()
+    if settings.PRICE_PROVIDER == "hedged":
+        return HedgedPriceProvider(
+            alpha_vantage,
+            YFinanceProvider(),
+            percentile=settings.PRICE_HEDGE_PERCENTILE,
+            default_delay=settings.PRICE_HEDGE_DEFAULT_DELAY,
+        )
+    return alpha_vantage
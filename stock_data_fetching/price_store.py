@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Optional
+
+import pandas as pd
+
+from stock_data_fetching.config import settings
+from stock_data_fetching.price_providers import get_price_provider
+from stock_data_fetching.logger import logger
+
+PRICE_COLUMNS = ["date", "open", "high", "low", "close", "adjusted_close", "volume"]
+# Alpha Vantage's compact daily series covers the last 100 sessions (~140 calendar days)
+COMPACT_SESSIONS = 100
+COMPACT_CALENDAR_DAYS = 130
+
+# symbol -> (file mtime, DataFrame); re-read only when the file on disk changes
+_history_cache = {}
+# symbol -> monotonic time of the last upstream top-up, so holidays don't trigger a refetch per request
+_last_refresh = {}
+# symbol -> bar for a session that hasn't closed yet (from live quotes or the provider's in-progress
+# bar). Served on top of the stored history but never written to the CSV, so the provider's final
+# bar is downloaded once the session is over.
+_provisional = {}
+_lock = threading.Lock()
+
+
+def _price_path(symbol: str) -> str:
+    return os.path.join(settings.PRICE_STORE_DIR, "prices", f"{symbol.upper()}.csv")
+
+
+def _empty_history() -> pd.DataFrame:
+    return pd.DataFrame(columns=PRICE_COLUMNS)
+
+
+def load_history(symbol: str) -> pd.DataFrame:
+    """Load the stored daily OHLCV history for a symbol, oldest first. Empty if nothing is stored."""
+    path = _price_path(symbol)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return _empty_history()
+
+    cached = _history_cache.get(symbol.upper())
+    if cached and cached[0] == mtime:
+        return cached[1].copy()
+
+    df = pd.read_csv(path, parse_dates=["date"])
+    df["date"] = df["date"].dt.date
+    df = df.sort_values("date").reset_index(drop=True)
+    _history_cache[symbol.upper()] = (mtime, df)
+    return df.copy()
+
+
+def stored_symbols() -> list:
+    """Every symbol that has a stored price history, sorted."""
+    prices_dir = os.path.join(settings.PRICE_STORE_DIR, "prices")
+    if not os.path.isdir(prices_dir):
+        return []
+    return sorted(name[:-4] for name in os.listdir(prices_dir) if name.endswith(".csv"))
+
+
+def save_history(symbol: str, df: pd.DataFrame) -> None:
+    """Atomically replace the stored history for a symbol."""
+    path = _price_path(symbol)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    df[PRICE_COLUMNS].to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    _history_cache.pop(symbol.upper(), None)
+
+
+def _price_rows(rows: pd.DataFrame) -> pd.DataFrame:
+    rows = rows.copy()
+    if "adjusted_close" not in rows.columns:
+        rows["adjusted_close"] = rows["close"]
+    rows["date"] = pd.to_datetime(rows["date"]).dt.date
+    return rows
+
+
+def merge_history(symbol: str, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """Merge new rows into the stored history, keeping the newest row for each date."""
+    if new_rows is None or new_rows.empty:
+        return load_history(symbol)
+    with _lock:
+        stored = load_history(symbol)
+        new_rows = _price_rows(new_rows)
+        frames = [frame for frame in (stored, new_rows[PRICE_COLUMNS]) if not frame.empty]
+        merged = (
+            pd.concat(frames, ignore_index=True)
+            .drop_duplicates(subset="date", keep="last")
+            .sort_values("date")
+            .reset_index(drop=True)
+        )
+        save_history(symbol, merged)
+        return merged
+
+
+def _latest_session() -> date:
+    """Most recent weekday strictly before today (UTC); the last session whose close is known."""
+    today = pd.Timestamp(datetime.utcnow().date())
+    return (today - pd.offsets.BDay(1)).date()
+
+
+def is_stale(df: pd.DataFrame) -> bool:
+    return df.empty or df["date"].max() < _latest_session()
+
+
+def set_provisional_bar(symbol: str, bar: dict) -> None:
+    """Serve `bar` (e.g. from a live quote) as the latest session until the store has a final bar for its date."""
+    bar = _price_rows(pd.DataFrame([bar])).iloc[0]
+    with _lock:
+        _provisional[symbol.upper()] = {column: bar[column] for column in PRICE_COLUMNS}
+
+
+def provisional_session(symbol: str, history: Optional[pd.DataFrame] = None) -> Optional[date]:
+    """Date of the provisional bar served for `symbol`, or None once the stored history covers it."""
+    bar = _provisional.get(symbol.upper())
+    if bar is None:
+        return None
+    history = load_history(symbol) if history is None else history
+    return None if not history.empty and history["date"].max() >= bar["date"] else bar["date"]
+
+
+def with_provisional(symbol: str, history: pd.DataFrame) -> pd.DataFrame:
+    """`history` (as stored) with the provisional bar for `symbol` appended when it is newer."""
+    if provisional_session(symbol, history) is None:
+        return history
+    bar = pd.DataFrame([_provisional[symbol.upper()]])
+    return pd.concat([history, bar], ignore_index=True) if not history.empty else bar
+
+
+def merge_session_bars(symbol: str, rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store provider bars: sessions up to the last closed one are merged, a bar for the session still
+    in progress only becomes the provisional bar. Returns the stored history with that bar applied.
+    """
+    if rows is None or rows.empty:
+        return with_provisional(symbol, load_history(symbol))
+    rows = _price_rows(rows)
+    closed = rows["date"] <= _latest_session()
+    merged = merge_history(symbol, rows[closed]) if closed.any() else load_history(symbol)
+    if not closed.all():
+        set_provisional_bar(symbol, rows[~closed].iloc[-1].to_dict())
+    return with_provisional(symbol, merged)
+
+
+def get_price_history(symbol: str, refresh: bool = False) -> pd.DataFrame:
+    """
+    Return the full stored history for a symbol, topping it up from the price provider when it is stale.
+    The first call for a symbol downloads the full daily series; later top-ups use the compact one
+    unless the stored series is older than what the compact one covers. A provisional bar for the
+    current session is appended but doesn't count as stored, so it never keeps the history fresh.
+    """
+    stored = load_history(symbol)
+    last_refresh = _last_refresh.get(symbol.upper())
+    recently_refreshed = last_refresh is not None and time.monotonic() - last_refresh < settings.PRICE_STORE_REFRESH_SECONDS
+    if not refresh and (not is_stale(stored) or (recently_refreshed and not stored.empty)):
+        return with_provisional(symbol, stored)
+
+    full_history = stored.empty or (_latest_session() - stored["date"].max()).days > COMPACT_CALENDAR_DAYS
+    fresh = get_price_provider().fetch(symbol, days=COMPACT_SESSIONS, full_history=full_history)
+    _last_refresh[symbol.upper()] = time.monotonic()
+    if fresh.empty:
+        logger.warning(f"Price store top-up for {symbol} returned no data; serving {len(stored)} stored rows")
+        return with_provisional(symbol, stored)
+
+    merged = merge_session_bars(symbol, fresh)
+    logger.info(f"Price store for {symbol} now holds {len(merged)} rows up to {merged['date'].max()}")
+    return merged
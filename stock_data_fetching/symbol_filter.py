@@ -0,0 +1,81 @@
+"""
+Cheap rejection of symbols that can't be valid, before any upstream call is made.
+
+Three checks, cheapest first:
+  1. shape: tickers are short runs of letters, digits, '.' and '-'
+  2. negative cache: symbols Alpha Vantage reported as unknown within INVALID_SYMBOL_TTL_SECONDS
+  3. listing: plain tickers must be in the symbol index (a sorted array, so membership is a bisect).
+     The listing only covers US exchanges, so exchange-suffixed symbols such as SHOP.TRT pass through,
+     and the check is skipped until the index has been built.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from stock_data_fetching.config import settings
+from stock_data_fetching.logger import logger
+from stock_data_fetching.symbol_search import current_symbol_index
+
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9][A-Z0-9.\-]{0,14}$")
+
+
+class NegativeCache:
+    """Symbols known to be invalid, each remembered for `ttl` seconds (oldest evicted past `max_entries`)."""
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._expiry: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, symbol: str) -> None:
+        with self._lock:
+            self._expiry.pop(symbol, None)
+            self._expiry[symbol] = time.monotonic() + self.ttl
+            while len(self._expiry) > self.max_entries:
+                self._expiry.popitem(last=False)
+
+    def discard(self, symbol: str) -> None:
+        with self._lock:
+            self._expiry.pop(symbol, None)
+
+    def __contains__(self, symbol: str) -> bool:
+        with self._lock:
+            expiry = self._expiry.get(symbol)
+            if expiry is None:
+                return False
+            if expiry < time.monotonic():
+                del self._expiry[symbol]
+                return False
+            return True
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+
+negative_cache = NegativeCache(settings.INVALID_SYMBOL_TTL_SECONDS)
+stats = {"malformed": 0, "negative_cache": 0, "not_listed": 0}
+
+
+def record_unknown_symbol(symbol: str) -> None:
+    """Remember that the data provider doesn't know `symbol`."""
+    negative_cache.add(symbol.strip().upper())
+    logger.info(f"Symbol {symbol} marked unknown for {settings.INVALID_SYMBOL_TTL_SECONDS}s")
+
+
+def rejection_reason(symbol: str) -> Optional[str]:
+    """Why `symbol` can be rejected without an upstream call, or None if it may be valid."""
+    symbol = symbol.strip().upper()
+    if not SYMBOL_PATTERN.match(symbol):
+        stats["malformed"] += 1
+        return "not a valid ticker format"
+    if symbol in negative_cache:
+        stats["negative_cache"] += 1
+        return "recently reported unknown by the data provider"
+    index = current_symbol_index()
+    if index is not None and "." not in symbol and symbol not in index:
+        stats["not_listed"] += 1
+        return "not in the symbol listing"
+    return None
@@ -0,0 +1,146 @@
+import asyncio
+import csv
+import io
+import os
+import time
+from bisect import bisect_left
+from typing import List, Optional
+
+import requests
+
+from stock_data_fetching.config import settings
+from stock_data_fetching.logger import logger
+
+
+class SymbolIndex:
+    """
+    Prefix index over a listing file, built from sorted key arrays so a lookup is two bisects
+    plus a short scan. Tickers are matched case-insensitively on their prefix; names on the
+    prefix of the full name or of any word in it.
+    """
+
+    def __init__(self, records: List[dict]):
+        self.records = records
+        ticker_keys = sorted((r["symbol"].upper(), i) for i, r in enumerate(records))
+        self._tickers = [key for key, _ in ticker_keys]
+        self._ticker_ids = [i for _, i in ticker_keys]
+
+        name_keys = set()
+        for i, record in enumerate(records):
+            name = record["name"].lower()
+            if not name:
+                continue
+            name_keys.add((name, i))
+            for word in name.split()[1:]:
+                name_keys.add((word, i))
+        name_keys = sorted(name_keys)
+        self._names = [key for key, _ in name_keys]
+        self._name_ids = [i for _, i in name_keys]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, symbol: str) -> bool:
+        symbol = symbol.upper()
+        pos = bisect_left(self._tickers, symbol)
+        return pos < len(self._tickers) and self._tickers[pos] == symbol
+
+    @staticmethod
+    def _prefix_scan(keys: list, ids: list, prefix: str, limit: int) -> list:
+        matches = []
+        pos = bisect_left(keys, prefix)
+        while pos < len(keys) and keys[pos].startswith(prefix) and len(matches) < limit:
+            matches.append(ids[pos])
+            pos += 1
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """Ticker-prefix matches first (an exact ticker sorts first), then name-prefix matches."""
+        query = query.strip()
+        if not query:
+            return []
+        ticker_hits = self._prefix_scan(self._tickers, self._ticker_ids, query.upper(), limit)
+        name_hits = self._prefix_scan(self._names, self._name_ids, query.lower(), limit)
+
+        results, seen = [], set()
+        for record_id in ticker_hits + name_hits:
+            if record_id not in seen:
+                seen.add(record_id)
+                results.append(self.records[record_id])
+            if len(results) >= limit:
+                break
+        return results
+
+
+def parse_listing(text: str) -> List[dict]:
+    """Parse a LISTING_STATUS CSV (symbol,name,exchange,assetType,ipoDate,delistingDate,status)."""
+    records = []
+    for row in csv.DictReader(io.StringIO(text)):
+        symbol = (row.get("symbol") or "").strip()
+        if not symbol:
+            continue
+        records.append({
+            "symbol": symbol.upper(),
+            "name": (row.get("name") or "").strip(),
+            "exchange": (row.get("exchange") or "").strip(),
+            "asset_type": (row.get("assetType") or "").strip(),
+        })
+    return records
+
+
+def download_listing(path: str) -> None:
+    """Download Alpha Vantage's LISTING_STATUS CSV (one call for every active symbol) to `path`."""
+    url = f"{settings.ALPHA_VANTAGE_BASE_URL}?function=LISTING_STATUS&apikey={settings.ALPHA_VANTAGE_API_KEY}"
+    response = requests.get(url, timeout=60)
+    response.raise_for_status()
+    if not response.text.startswith("symbol,"):
+        raise ValueError(f"Unexpected LISTING_STATUS response: {response.text[:200]}")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(response.text)
+    os.replace(tmp_path, path)
+
+
+def build_symbol_index(download: bool = False) -> Optional[SymbolIndex]:
+    """Build an index from SYMBOL_LISTING_PATH, downloading the listing first if asked or if it is missing."""
+    path = settings.SYMBOL_LISTING_PATH
+    try:
+        if download or (not os.path.exists(path) and settings.ALPHA_VANTAGE_API_KEY):
+            download_listing(path)
+        with open(path) as f:
+            records = parse_listing(f.read())
+    except Exception as e:
+        logger.error(f"Could not build symbol index from {path}: {str(e)}")
+        return None
+    logger.info(f"Symbol index built with {len(records)} listings")
+    return SymbolIndex(records)
+
+
+_index: Optional[SymbolIndex] = None
+_last_build_attempt = None
+BUILD_RETRY_SECONDS = 60
+
+
+def get_symbol_index() -> Optional[SymbolIndex]:
+    """The current index, built lazily from the listing file on first use (retried at most once a minute)."""
+    global _index, _last_build_attempt
+    if _index is None and (_last_build_attempt is None or time.monotonic() - _last_build_attempt > BUILD_RETRY_SECONDS):
+        _last_build_attempt = time.monotonic()
+        _index = build_symbol_index()
+    return _index
+
+
+def current_symbol_index() -> Optional[SymbolIndex]:
+    """The index if it has been built, without triggering a build."""
+    return _index
+
+
+async def refresh_symbol_index_periodically():
+    """Background task: re-download the listing and swap in a fresh index every SYMBOL_INDEX_REFRESH_SECONDS."""
+    global _index
+    while True:
+        await asyncio.sleep(settings.SYMBOL_INDEX_REFRESH_SECONDS)
+        index = await asyncio.to_thread(build_symbol_index, True)
+        if index is not None:
+            _index = index
@@ -4,9 +4,17 @@ from httpx import AsyncClient
 import json
 from llm_service.main import app
 from llm_service.config import settings
+from llm_service.http_clients import PooledClient
+from llm_service.prediction_cache import prediction_cache
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def clear_prediction_cache():
+    prediction_cache.clear()
+    yield
+    prediction_cache.clear()
+
 @pytest.fixture
 def sample_stock_features():
     return {
@@ -106,4 +114,458 @@ async def test_predict_ollama_unavailable(sample_stock_features):
         m.setattr("llm_service.main.call_ollama", mock_call_ollama)
         async with AsyncClient(app=app, base_url="http://test") as ac:
             response = await ac.post("/predict", json=sample_stock_features)
-            assert response.status_code == 503 
\ No newline at end of file
+            assert response.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_pooled_client_reuses_connections():
+    """Consecutive requests share one keep-alive connection, and the metrics say so."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pooled = PooledClient("test", timeout=5)
+    try:
+        for _ in range(3):
+            response = await pooled.post(f"http://127.0.0.1:{server.server_port}/", json={})
+            assert response.json() == {"ok": True}
+        metrics = pooled.summary()
+        assert metrics["requests"] == 3
+        assert metrics["new_connections"] == 1
+        assert metrics["reused_connections"] == 2
+        assert metrics["avg_pool_wait_seconds"] >= 0
+    finally:
+        await pooled.aclose()
+        server.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_predict_stream_emits_fields_before_generation_ends(sample_stock_features):
+    """The recommendation event precedes the rest of the generation, and the final result matches /predict."""
+    text = ("RECOMMENDATION: SELL\nCONFIDENCE: 0.6\nTIME_FRAME: Next 2 trading days\nPRICE_PREDICTIONS:\n"
+            "Day 1: 180.25\nDay 2: 178.00\nREASONING: Momentum is fading.\nVolume is drying up.")
+    tokens = [text[i:i + 7] for i in range(0, len(text), 7)]
+
+    async def mock_stream_ollama(prompt, final=None):
+        for token in tokens:
+            yield token
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("llm_service.main.stream_ollama", mock_stream_ollama)
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/predict/stream", json=sample_stock_features)
+
+    assert response.status_code == 200
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    names = [name for name, _ in events]
+    structured = [(name, data) for name, data in events if name != "token"]
+    assert structured[0] == ("field", {"name": "recommendation", "value": "SELL"})
+    assert names.index("field") <= 3
+    assert ("price_prediction", {"key": "Day 2", "price": 178.0}) in structured
+    assert [data["text"] for name, data in structured if name == "reasoning"] == ["Momentum is fading.", "Volume is drying up."]
+    assert "".join(data["text"] for name, data in events if name == "token") == text
+    result = events[-1]
+    assert result[0] == "result"
+    assert result[1]["recommendation"] == "SELL" and result[1]["confidence"] == 0.6
+    assert result[1]["price_predictions"] == {"Day 1": 180.25, "Day 2": 178.0}
+    assert result[1]["reasoning"] == "Momentum is fading. Volume is drying up."
+
+@pytest.mark.asyncio
+async def test_predict_stream_shares_its_generation_and_records_the_parse(sample_stock_features):
+    """/predict and a second stream wait for a stream's in-flight generation, whose parse is counted in /metrics."""
+    import asyncio
+    from llm_service.structured_output import generation_stats
+
+    calls = []
+    release = asyncio.Event()
+
+    async def mock_stream_ollama(prompt, final=None):
+        calls.append(prompt)
+        yield "RECOMMENDATION: BUY\n"
+        await release.wait()
+        yield "CONFIDENCE: 0.7\nTIME_FRAME: Next 5 trading days\nPRICE_PREDICTIONS:\nDay 1: 191.00\nREASONING: Breakout."
+        final.update({"done": True, "total_duration": 2_000_000_000})
+
+    async def mock_call_ollama(prompt):
+        raise AssertionError("started a second generation")
+
+    before = dict(generation_stats.counts)
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("llm_service.main.stream_ollama", mock_stream_ollama)
+        m.setattr("llm_service.main.call_ollama", mock_call_ollama)
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            streamed = asyncio.create_task(ac.post("/predict/stream", json=sample_stock_features))
+            await asyncio.sleep(0.1)
+            joined = [asyncio.create_task(ac.post(path, json=sample_stock_features)) for path in ("/predict", "/predict/stream")]
+            await asyncio.sleep(0.1)
+            release.set()
+            first, predicted, second = await asyncio.gather(streamed, *joined)
+            stats = (await ac.get("/metrics")).json()
+
+    assert len(calls) == 1
+    events = [json.loads(block.split("\n")[1][len("data: "):]) for block in first.text.strip().split("\n\n")]
+    result = events[-1]
+    assert result["recommendation"] == "BUY" and predicted.json() == result
+    assert second.text == f"event: result\ndata: {json.dumps(result)}\n\n"
+    assert stats["prediction_cache"]["misses"] == 1 and stats["prediction_cache"]["coalesced"] == 2
+    assert generation_stats.counts["generations"] == before["generations"] + 1
+    assert generation_stats.counts["fallback"] == before["fallback"] + 1
+
+@pytest.mark.asyncio
+async def test_predict_structured_output_and_parse_metrics(sample_stock_features):
+    """Schema-constrained replies are decoded as JSON; unusable generations are counted as wasted."""
+    from llm_service.main import PredictionResponse
+    from llm_service.structured_output import generation_stats, prediction_schema
+
+    schema = prediction_schema(PredictionResponse)
+    assert set(schema["required"]) == {"recommendation", "confidence", "time_frame", "price_predictions", "reasoning"}
+    assert schema["properties"]["recommendation"]["enum"] == ["BUY", "SELL", "HOLD"]
+
+    replies = [
+        {"response": json.dumps({
+            "recommendation": "SELL",
+            "confidence": 0.64,
+            "time_frame": "Next 3 trading days",
+            "price_predictions": {"2025-06-09": 187.5, "2025-06-10": 186.0},
+            "reasoning": "MACD momentum is fading near the upper band.",
+        }), "total_duration": 2_000_000_000},
+        {"response": "I think the stock will probably go up.", "total_duration": 3_000_000_000},
+    ]
+    prompts = []
+
+    async def mock_call_ollama(prompt):
+        prompts.append(prompt)
+        return replies[len(prompts) - 1]
+
+    before = generation_stats.summary()
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("llm_service.main.call_ollama", mock_call_ollama)
+        m.setattr(settings, "OLLAMA_STRUCTURED_OUTPUT", True)
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/predict", json=sample_stock_features)
+            assert response.status_code == 200
+            data = response.json()
+            assert data["recommendation"] == "SELL"
+            assert data["price_predictions"] == {"2025-06-09": 187.5, "2025-06-10": 186.0}
+            assert "Stock Symbol: AAPL" in prompts[0]
+
+            response = await ac.post("/predict", json={**sample_stock_features, "time_frame": "Next week"})
+            assert response.status_code == 500
+
+            stats = (await ac.get("/metrics")).json()["generations"]
+    assert stats["generations"] - before["generations"] == 2
+    assert stats["structured"] - before["structured"] == 1
+    assert stats["parse_failures"] - before["parse_failures"] == 1
+    assert stats["wasted_generation_seconds"] - before["wasted_generation_seconds"] == pytest.approx(3.0)
+
+@pytest.mark.asyncio
+async def test_prediction_cache_quantizes_features_and_coalesces(sample_stock_features):
+    """Near-identical features share one generation, and concurrent requests wait for it."""
+    import asyncio
+
+    calls = []
+    release = asyncio.Event()
+
+    async def mock_call_ollama(prompt):
+        calls.append(prompt)
+        await release.wait()
+        return {"response": json.dumps({
+            "recommendation": "HOLD",
+            "confidence": 0.5,
+            "time_frame": "Next 5 trading days",
+            "price_predictions": {"2025-06-09": 190.0},
+            "reasoning": "Range-bound.",
+        })}
+
+    noisy = {**sample_stock_features, "features": {**sample_stock_features["features"], "latest_close": 190.1201, "macd": 0.32001}}
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("llm_service.main.call_ollama", mock_call_ollama)
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            pending = [asyncio.create_task(ac.post("/predict", json=body)) for body in (sample_stock_features, noisy, sample_stock_features)]
+            await asyncio.sleep(0.1)
+            release.set()
+            responses = await asyncio.gather(*pending)
+            assert [r.status_code for r in responses] == [200, 200, 200]
+            assert len({r.json()["timestamp"] for r in responses}) == 1
+
+            response = await ac.post("/predict", json=noisy)
+            assert response.json() == responses[0].json()
+
+            response = await ac.post("/predict", json={**sample_stock_features, "time_frame": "Next month"})
+            assert response.status_code == 200
+
+            stats = (await ac.get("/metrics")).json()["prediction_cache"]
+    assert len(calls) == 2
+    assert stats["misses"] == 2 and stats["coalesced"] == 2 and stats["hits"] == 1
+    assert stats["entries"] == 2
+
+@pytest.mark.asyncio
+async def test_prediction_cache_survives_cancelled_owner():
+    """Cancelling the request that started a generation doesn't fail a request coalesced onto it."""
+    import asyncio
+    from llm_service.prediction_cache import PredictionCache
+
+    cache = PredictionCache()
+    release = asyncio.Event()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await release.wait()
+        return {"recommendation": "BUY"}
+
+    owner = asyncio.create_task(cache.get_or_compute("AAPL|daily|x", compute))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_compute("AAPL|daily|x", compute))
+    await asyncio.sleep(0)
+    owner.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await waiter == ({"recommendation": "BUY"}, "coalesced")
+    assert owner.cancelled()
+    assert len(calls) == 1
+    assert cache.get("AAPL|daily|x") == {"recommendation": "BUY"} and cache.summary()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_admission_queues_by_priority_and_rejects_with_retry_after(sample_stock_features):
+    """Interactive requests jump queued background ones; a full queue or an exhausted budget answers fast."""
+    import asyncio
+    from llm_service.admission import admission
+
+    order = []
+    gate = asyncio.Event()
+
+    async def mock_call_ollama(prompt):
+        frame = prompt.split("following time frame: ")[1].split(".")[0]
+        order.append(frame)
+        if frame == "A":
+            await gate.wait()
+        return {"response": json.dumps({
+            "recommendation": "BUY",
+            "confidence": 0.7,
+            "time_frame": frame,
+            "price_predictions": {"2025-06-09": 191.0},
+            "reasoning": "Momentum.",
+        })}
+
+    def body(frame, priority="interactive"):
+        return {**sample_stock_features, "time_frame": frame, "priority": priority}
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("llm_service.main.call_ollama", mock_call_ollama)
+        m.setattr(admission, "max_concurrent", 1)
+        m.setattr(admission, "max_queue", 2)
+        m.setattr(admission, "queue_timeouts", {"interactive": 5.0, "background": 5.0})
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            running = asyncio.create_task(ac.post("/predict", json=body("A")))
+            await asyncio.sleep(0.05)
+            background = asyncio.create_task(ac.post("/predict", json=body("B", "background")))
+            await asyncio.sleep(0.05)
+
+            rejected = await ac.post("/predict", json=body("C", "background"))
+            assert rejected.status_code == 429
+            assert int(rejected.headers["Retry-After"]) >= 1
+
+            interactive = asyncio.create_task(ac.post("/predict", json=body("D")))
+            await asyncio.sleep(0.05)
+            queue = (await ac.get("/metrics")).json()["admission"]
+            assert queue["in_flight"] == 1 and queue["queued"] == {"interactive": 1, "background": 1}
+
+            gate.set()
+            responses = await asyncio.gather(running, background, interactive)
+            assert [r.status_code for r in responses] == [200, 200, 200]
+            assert order == ["A", "D", "B"]
+
+            gate.clear()
+            m.setattr(admission, "queue_timeouts", {"interactive": 5.0, "background": 0.05})
+            running = asyncio.create_task(ac.post("/predict", json=body("A", "interactive") | {"symbol": "MSFT"}))
+            await asyncio.sleep(0.05)
+            timed_out = await ac.post("/predict", json=body("E", "background"))
+            assert timed_out.status_code == 503
+            assert "Retry-After" in timed_out.headers
+            gate.set()
+            assert (await running).status_code == 200
+
+            stats = (await ac.get("/metrics")).json()["admission"]
+    assert stats["rejected"] == 1 and stats["timed_out"] == 1
+    assert stats["in_flight"] == 0 and stats["queued"] == {"interactive": 0, "background": 0}
+
+@pytest.mark.asyncio
+async def test_predict_batch_streams_each_symbol_with_isolated_errors(sample_stock_features):
+    """One /fetch/batch call for features; per-symbol NDJSON lines; generations bounded by the backend's slots."""
+    import asyncio
+    import httpx
+    from fastapi import HTTPException
+    from llm_service.admission import admission
+
+    fetched = []
+
+    class FakeStockData:
+        async def post(self, url, json=None, **kwargs):
+            fetched.append((url, json["symbols"]))
+            results = {symbol: {"symbol": symbol, "technical_indicators": {**sample_stock_features["features"], "latest_close": price}}
+                       for symbol, price in (("AAPL", 190.0), ("MSFT", 410.0), ("NVDA", 120.0), ("TSLA", 250.0))}
+            return httpx.Response(200, json={"results": results, "errors": {"ZZZZ": "No price data for ZZZZ"}}, request=httpx.Request("POST", url))
+
+    running = 0
+    peak = 0
+
+    async def mock_call_ollama(prompt):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        if "Stock Symbol: NVDA" in prompt:
+            return {"response": "no idea"}
+        if "Stock Symbol: TSLA" in prompt:
+            raise HTTPException(status_code=429, detail="Generation queue is full", headers={"Retry-After": "7"})
+        return {"response": json.dumps({
+            "recommendation": "BUY",
+            "confidence": 0.6,
+            "time_frame": "Next 5 trading days",
+            "price_predictions": {"2025-06-09": 1.0},
+            "reasoning": "Trend.",
+        })}
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("llm_service.main.call_ollama", mock_call_ollama)
+        m.setattr("llm_service.main.get_client", lambda name: FakeStockData())
+        m.setattr(admission, "max_concurrent", 2)
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/predict/batch", json={"symbols": ["aapl", "MSFT", "NVDA", "TSLA", "ZZZZ"]})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = {line["symbol"]: line for line in map(json.loads, response.text.splitlines())}
+    assert len(fetched) == 1 and fetched[0][0].endswith("/fetch/batch") and fetched[0][1] == ["AAPL", "MSFT", "NVDA", "TSLA", "ZZZZ"]
+    assert lines["AAPL"]["prediction"]["recommendation"] == "BUY"
+    assert lines["MSFT"]["prediction"]["symbol"] == "MSFT"
+    assert lines["NVDA"]["status_code"] == 500 and "retry_after" not in lines["NVDA"]
+    assert lines["TSLA"] == {"symbol": "TSLA", "error": "Generation queue is full", "status_code": 429, "retry_after": 7}
+    assert lines["ZZZZ"] == {"symbol": "ZZZZ", "error": "No price data for ZZZZ", "status_code": 404}
+    assert peak == 2
+
+@pytest.mark.asyncio
+async def test_call_ollama_sends_static_system_prompt_and_records_prompt_eval(sample_stock_features):
+    """Instructions go in `system` (a shared prefix), per-symbol data in `prompt`; prompt eval time is tracked."""
+    import httpx
+    from llm_service import main as llm_main
+    from llm_service.main import STRUCTURED_SYSTEM_PROMPT, StockFeatures, call_ollama, format_prompt
+    from llm_service.structured_output import generation_stats
+
+    sent = []
+
+    class FakeOllama:
+        async def post(self, url, json=None, **kwargs):
+            sent.append(json)
+            body = {"response": "{}", "prompt_eval_count": 120, "prompt_eval_duration": 400_000_000, "eval_count": 50, "eval_duration": 1_000_000_000}
+            return httpx.Response(200, json=body, request=httpx.Request("POST", url))
+
+    features = StockFeatures(**sample_stock_features["features"])
+    prompts = [format_prompt(symbol, features, "Next week") for symbol in ("AAPL", "MSFT")]
+    assert all("Instructions" not in prompt for prompt in prompts)
+    assert all(prompt.rstrip().endswith("following time frame: Next week.") for prompt in prompts)
+
+    before = generation_stats.eval_summary()
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr(llm_main, "get_client", lambda name: FakeOllama())
+        m.setattr(settings, "OLLAMA_STRUCTURED_OUTPUT", True)
+        for prompt in prompts:
+            generation_stats.record_eval(await call_ollama(prompt))
+
+    assert [payload["system"] for payload in sent] == [STRUCTURED_SYSTEM_PROMPT] * 2
+    assert "single JSON object" in STRUCTURED_SYSTEM_PROMPT
+    assert [payload["prompt"] for payload in sent] == prompts
+    assert all(payload["keep_alive"] == settings.OLLAMA_KEEP_ALIVE and "format" in payload for payload in sent)
+    after = generation_stats.eval_summary()
+    assert after["generations"] - before["generations"] == 2
+    assert after["prompt_tokens"] - before["prompt_tokens"] == 240
+    assert after["prompt_eval_seconds"] - before["prompt_eval_seconds"] == pytest.approx(0.8)
+
+@pytest.mark.asyncio
+async def test_warmup_gates_readiness_until_first_token_is_fast():
+    """/ready is 503 while the model loads, 200 once a first token is fast, and 503 again if the model is unloaded or keep-alive fails."""
+    import asyncio
+    import httpx
+    from llm_service import warmup
+    from llm_service.warmup import ModelWarmer
+
+    calls = []
+    ollama_up = True
+    loaded = [{"name": f"{settings.OLLAMA_MODEL}:latest", "model": f"{settings.OLLAMA_MODEL}:latest"}]
+
+    class FakeOllama:
+        async def get(self, url, **kwargs):
+            assert url.endswith("/api/ps")
+            if not ollama_up:
+                raise httpx.ConnectError("Connection refused", request=httpx.Request("GET", url))
+            return httpx.Response(200, json={"models": loaded}, request=httpx.Request("GET", url))
+
+        async def post(self, url, json=None, **kwargs):
+            calls.append(json)
+            if not ollama_up:
+                raise httpx.ConnectError("Connection refused", request=httpx.Request("POST", url))
+            cold = len(calls) == 1
+            if cold:
+                await asyncio.sleep(0.2)
+            body = {"response": "OK", "done": True, "load_duration": 190_000_000 if cold else 0}
+            return httpx.Response(200, json=body, request=httpx.Request("POST", url))
+
+    warmer = ModelWarmer()
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr(warmup, "get_client", lambda name: FakeOllama())
+        m.setattr("llm_service.main.model_warmer", warmer)
+        m.setattr(settings, "OLLAMA_WARMUP_ENABLED", True)
+        m.setattr(settings, "OLLAMA_READY_FIRST_TOKEN_SECONDS", 0.1)
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            assert (await ac.get("/ready")).status_code == 503
+
+            assert await warmer.warm_up() is False
+            response = await ac.get("/ready")
+            assert response.status_code == 503
+            assert response.json()["status"] == "warming_up" and response.json()["load_seconds"] == pytest.approx(0.19)
+
+            assert await warmer.warm_up() is True
+            response = await ac.get("/ready")
+            assert response.status_code == 200
+            state = response.json()
+            assert state["status"] == "ready" and state["model"] == settings.OLLAMA_MODEL
+            assert state["first_token_seconds"] < 0.1 and state["warmup_seconds"] is not None
+
+            assert await warmer.keep_alive() is True
+            loaded.clear()
+            assert await warmer.keep_alive() is False
+            assert (await ac.get("/ready")).status_code == 503
+            assert len(calls) == 3  # nothing was sent to renew a model that is gone
+
+            assert await warmer.warm_up() is True
+            ollama_up = False
+            assert await warmer.keep_alive() is False
+            state = (await ac.get("/ready")).json()
+            assert state["status"] == "unavailable" and "Connection refused" in state["last_error"]
+
+            assert (await ac.get("/health")).json() == {"status": "healthy", "service": settings.SERVICE_NAME}
+
+    assert calls[0]["options"] == {"num_predict": 1} and calls[0]["keep_alive"] == settings.OLLAMA_KEEP_ALIVE
+    assert calls[2]["prompt"] == ""
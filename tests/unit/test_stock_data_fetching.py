@@ -1,16 +1,41 @@
+import asyncio
+import time
 import pytest
 from unittest.mock import patch, MagicMock
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from stock_data_fetching.main import app, StockDataRequest
 from stock_data_fetching.fetch_price_data import fetch_price_data
 from stock_data_fetching.calculate_indicators import add_technical_indicators
-from stock_data_fetching.calculate_volume_features import calculate_volume_features
+from stock_data_fetching.calculate_volume_features import calculate_volume_features, volume_feature_series
 from stock_data_fetching.fetch_fundamentals import fetch_fundamentals
+from stock_data_fetching.http_cache import conditional_json_response
+from stock_data_fetching.downsampling import lttb_indices
+from stock_data_fetching.price_providers import HedgedPriceProvider, PriceProvider
+from stock_data_fetching.symbol_search import SymbolIndex, parse_listing
+from stock_data_fetching.fieldsets import parse_fields, resolve_dependencies, upstream_calls, wants
+from stock_data_fetching.expressions import ExpressionError, compile_expressions
+from stock_data_fetching.alerts import AlertEngine
+from stock_data_fetching.portfolio import compute_risk_metrics
+from stock_data_fetching.market_hub import MarketHub
+from stock_data_fetching import as_of
+from stock_data_fetching import symbol_filter
+from stock_data_fetching import ingest, price_store, bulk_quotes, news_batch
+from stock_data_fetching.earnings_calendar import EarningsCalendar
+from stock_data_fetching.prefetcher import AccessModel, FetchCache, Prefetcher, fetch_cache, selection_key
 from fastapi.testclient import TestClient
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def clear_fetch_cache():
+    """Each test sees live /fetch results, not ones cached by an earlier test."""
+    fetch_cache.clear()
+    yield
+    fetch_cache.clear()
+
 @pytest.fixture
 def sample_price_data():
     """Create sample price data for testing using hard-coded trading days (business days)."""
@@ -37,7 +62,9 @@ def sample_fundamentals():
         "market_cap": 2000000000000,
         "pe_ratio": 25.5,
         "dividend_yield": 0.5,
-        "beta": 1.2
+        "beta": 1.2,
+        "next_earnings_date": "2024-07-25",
+        "next_earnings_estimate": 1.35
     }
 
 def test_health_check():
@@ -51,7 +78,7 @@ def test_fetch_stock_data_invalid_symbol():
     response = client.post("/fetch", json={"symbol": "INVALID", "timeframe": "daily"})
     assert response.status_code == 404
 
-@patch('stock_data_fetching.main.fetch_price_data')
+@patch('stock_data_fetching.price_providers.fetch_price_data')
 @patch('stock_data_fetching.calculate_indicators.add_technical_indicators')
 @patch('stock_data_fetching.calculate_volume_features.calculate_volume_features')
 @patch('stock_data_fetching.main.fetch_fundamentals')
@@ -171,9 +198,13 @@ def test_calculate_volume_features(sample_price_data):
     assert isinstance(volume_features["volume_trend"], str)
     assert volume_features["volume_trend"] in ["increasing", "decreasing", "stable"]
 
+@patch('stock_data_fetching.fetch_fundamentals.get_earnings_calendar')
 @patch('stock_data_fetching.fetch_fundamentals.requests.get')
-def test_fetch_fundamentals(mock_get, sample_fundamentals):
+def test_fetch_fundamentals(mock_get, mock_calendar, sample_fundamentals):
     """Test fundamental data fetching."""
+    mock_calendar.return_value.next_earnings.return_value = {
+        "name": "Apple Inc", "reportDate": "2024-07-25", "fiscalDateEnding": "2024-06-30", "estimate": "1.35", "currency": "USD",
+    }
     # Mock the API response
     mock_response = MagicMock()
     mock_response.json.return_value = {
@@ -192,4 +223,730 @@ def test_fetch_fundamentals(mock_get, sample_fundamentals):
     assert isinstance(fundamentals["market_cap"], int)
     assert isinstance(fundamentals["pe_ratio"], float)
     assert isinstance(fundamentals["dividend_yield"], float)
-    assert isinstance(fundamentals["beta"], float) 
\ No newline at end of file
+    assert isinstance(fundamentals["beta"], float)
+
+    mock_calendar.return_value.next_earnings.return_value = None
+    upcoming = fetch_fundamentals("AAPL", "dummy_api_key")
+    assert upcoming["next_earnings_date"] is None and upcoming["next_earnings_estimate"] is None
+
+def test_conditional_json_response_etag():
+    """Identical payloads hash to the same ETag and a matching If-None-Match yields 304."""
+    payload = {"symbol": "AAPL", "technical_indicators": {"latest_close": 190.12, "sma_5": 188.23}}
+    first = conditional_json_response(payload)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    reordered = {"technical_indicators": {"sma_5": 188.23, "latest_close": 190.12}, "symbol": "AAPL"}
+    assert conditional_json_response(reordered).headers["ETag"] == etag
+
+    not_modified = conditional_json_response(payload, if_none_match=etag)
+    assert not_modified.status_code == 304
+    assert not_modified.body == b""
+
+    changed = conditional_json_response({**payload, "symbol": "MSFT"}, if_none_match=etag)
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_lttb_indices_keeps_endpoints_and_extremes():
+    """LTTB returns `threshold` increasing indices, keeps both ends and the visible spike."""
+    y = [1.0] * 1000
+    y[437] = 50.0
+    indices = lttb_indices(list(range(1000)), y, 100)
+
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 999
+    assert all(b > a for a, b in zip(indices, indices[1:]))
+    assert 437 in indices
+
+    # Nothing to do when the series already fits the budget
+    assert list(lttb_indices([0, 1, 2], [1.0, 2.0, 3.0], 10)) == [0, 1, 2]
+
+def test_volume_feature_series(sample_price_data):
+    """Per-row volume features line up with the price rows and use only past volume for the average."""
+    series = volume_feature_series(sample_price_data, window=5)
+
+    assert list(series.columns) == ["volume_sma", "volume_ratio", "volume_spike", "obv"]
+    assert len(series) == len(sample_price_data)
+    assert series["volume_sma"].iloc[5] == sample_price_data["volume"].iloc[0:5].mean()
+    # Closes rise every day, so OBV accumulates every volume after the first bar
+    assert series["obv"].iloc[-1] == sample_price_data["volume"].iloc[1:].sum()
+
+class StaticProvider(PriceProvider):
+    """Test provider returning a fixed frame after an optional delay."""
+    def __init__(self, name, frame, delay=0.0):
+        self.name = name
+        self.frame = frame
+        self.delay = delay
+
+    def fetch(self, symbol, days=30, date=None, full_history=False):
+        import time
+        time.sleep(self.delay)
+        return self.frame
+
+def test_hedged_provider_falls_back_on_empty_and_slow_primary(sample_price_data):
+    """The secondary answers when the primary is rate limited (empty) or slower than the hedge delay."""
+    secondary_frame = sample_price_data.reset_index()
+
+    rate_limited = HedgedPriceProvider(StaticProvider("primary", pd.DataFrame()), StaticProvider("secondary", secondary_frame))
+    assert rate_limited.fetch("AAPL").equals(secondary_frame)
+    assert rate_limited.stats["secondary_wins"] == 1
+
+    slow = HedgedPriceProvider(
+        StaticProvider("primary", sample_price_data, delay=1.0),
+        StaticProvider("secondary", secondary_frame),
+        default_delay=0.05,
+    )
+    assert slow.fetch("AAPL").equals(secondary_frame)
+    assert slow.stats["hedged"] == 1
+
+def test_symbol_index_prefix_search():
+    """Ticker prefixes match before name prefixes, and membership is exact."""
+    listing = (
+        "symbol,name,exchange,assetType,ipoDate,delistingDate,status\n"
+        "AAPL,Apple Inc,NASDAQ,Stock,1980-12-12,null,Active\n"
+        "APLE,Apple Hospitality REIT Inc,NYSE,Stock,2015-05-18,null,Active\n"
+        "MSFT,Microsoft Corporation,NASDAQ,Stock,1986-03-13,null,Active\n"
+    )
+    index = SymbolIndex(parse_listing(listing))
+
+    assert [r["symbol"] for r in index.search("ap")] == ["APLE", "AAPL"]
+    assert [r["symbol"] for r in index.search("micro")] == ["MSFT"]
+    assert [r["symbol"] for r in index.search("hospitality")] == ["APLE"]
+    assert index.search("zzz") == []
+    assert "msft" in index
+    assert "MSF" not in index
+
+def test_parse_fields_and_dependencies():
+    """Sections pull in the price history they depend on; other sections don't."""
+    selection = parse_fields(["fundamentals", "technical_indicators_ext.adx"])
+    assert selection == {"fundamentals": None, "technical_indicators_ext": {"adx"}}
+    assert "price_history" not in resolve_dependencies(selection)
+    assert wants(selection, "technical_indicators_ext", "adx")
+    assert not wants(selection, "technical_indicators_ext", "aroon")
+
+    selection = parse_fields(["technical_indicators.latest_close", "technical_indicators"])
+    assert selection == {"technical_indicators": None}
+    assert "price_history" in resolve_dependencies(selection)
+
+    assert set(parse_fields(None)) == set(parse_fields([])) and len(parse_fields(None)) == 8
+    with pytest.raises(ValueError):
+        parse_fields(["not_a_section"])
+    with pytest.raises(ValueError, match="latest_clsoe"):
+        parse_fields(["technical_indicators.latest_clsoe"])
+    response = client.post("/fetch", json={"symbol": "AAPL", "fields": ["technical_indicators.latest_clsoe"]})
+    assert response.status_code == 422
+
+
+def test_expressions_share_subexpressions_and_run_on_panels():
+    """Repeated subexpressions are planned once and the same plan runs on 1-D and 2-D inputs."""
+    close = pd.Series(range(1, 61), dtype=float)
+    compiled = compile_expressions({
+        "spread": "ema(close, 20) - sma(close, 50)",
+        "double": "sma(close, 50) * 2",
+        "trend": "close > sma(close, 5)",
+    })
+    assert sum(1 for node in compiled.plan if node[:2] == ("call", "sma") and node[3] == (50,)) == 1
+    assert compile_expressions({"trend": "close > sma(close, 5)", "double": "sma(close, 50) * 2",
+                                "spread": "ema(close, 20) - sma(close, 50)"}) is compiled
+
+    result = compiled.evaluate({"close": close.to_numpy()})
+    expected = close.ewm(span=20, adjust=False).mean() - close.rolling(50).mean()
+    assert result["spread"][-1] == pytest.approx(expected.iloc[-1])
+    assert result["double"][-1] == pytest.approx(2 * close.tail(50).mean())
+    assert result["trend"][-1] == 1.0
+
+    panel = compiled.evaluate({"close": pd.concat([close, close * 2], axis=1).to_numpy()})
+    assert panel["spread"].shape == (60, 2)
+    assert panel["spread"][-1, 1] == pytest.approx(2 * expected.iloc[-1])
+
+    for bad in ["sma(close)", "unknown(close)", "close +", "sma(close, 2.5)"]:
+        with pytest.raises(ExpressionError):
+            compile_expressions({"x": bad})
+
+
+def test_alert_engine_fires_on_crossing_and_persists(tmp_path):
+    """Rules only see their own symbol, fire once per crossing and survive a reload."""
+    path = str(tmp_path / "alerts.jsonl")
+    engine = AlertEngine(path)
+    above = engine.add_rule("u1", "aapl", "latest_close", ">", 200)
+    oversold = engine.add_rule("u2", "AAPL", "rsi", "<", 30)
+    engine.add_rule("u1", "MSFT", "latest_close", ">", 1)
+
+    assert engine.evaluate("AAPL", {"latest_close": 190.0, "rsi": 45.0}) == []
+    fired = engine.evaluate("AAPL", {"latest_close": 210.0})
+    assert [a["rule_id"] for a in fired] == [above["id"]]
+    assert engine.evaluate("AAPL", {"latest_close": 215.0}) == []
+    engine.evaluate("AAPL", {"latest_close": 190.0})
+    assert len(engine.evaluate("AAPL", {"latest_close": 205.0, "rsi": 25.0})) == 2
+    assert [a["value"] for a in engine.triggered_for_user("u1")] == [210.0, 205.0]
+
+    assert not engine.remove_rule(oversold["id"], user_id="u1")
+    assert engine.remove_rule(oversold["id"], user_id="u2")
+    reloaded = AlertEngine(path)
+    assert [r["id"] for r in reloaded.rules_for_user("u2")] == []
+    assert {r["symbol"] for r in reloaded.rules_for_user("u1")} == {"AAPL", "MSFT"}
+
+
+def test_alert_endpoints_scope_rules_to_the_token_user(tmp_path, monkeypatch):
+    """Alert rules belong to the JWT's user; other users can't list or delete them, and no token means no access."""
+    import jwt
+    import stock_data_fetching.main as main_module
+
+    monkeypatch.setattr(main_module.settings, "JWT_SECRET", "test-secret")
+    monkeypatch.setattr(main_module.settings, "JWT_ALGORITHM", "HS256")
+    monkeypatch.setattr(symbol_filter, "current_symbol_index", lambda: None)
+    engine = AlertEngine(str(tmp_path / "alerts.jsonl"))
+    monkeypatch.setattr(main_module, "get_alert_engine", lambda: engine)
+
+    def auth(email):
+        return {"Authorization": f"Bearer {jwt.encode({'sub': email}, 'test-secret', algorithm='HS256')}"}
+
+    rule = {"symbol": "AAPL", "metric": "rsi", "op": "<", "threshold": 30}
+    created = client.post("/alerts", json={**rule, "user_id": "bob@example.com"}, headers=auth("alice@example.com")).json()
+    assert created["user_id"] == "alice@example.com"
+    assert [r["id"] for r in client.get("/alerts", headers=auth("alice@example.com")).json()] == [created["id"]]
+    assert client.get("/alerts", headers=auth("bob@example.com")).json() == []
+    assert client.delete(f"/alerts/{created['id']}", headers=auth("bob@example.com")).status_code == 404
+
+    assert client.get("/alerts/triggered").status_code == 403
+    assert client.get("/alerts", headers={"Authorization": "Bearer forged"}).status_code == 401
+    assert client.delete(f"/alerts/{created['id']}", headers=auth("alice@example.com")).status_code == 200
+
+
+def test_compute_risk_metrics_matches_pandas():
+    """Beta, correlation and volatility from the single covariance pass agree with pandas."""
+    rng = np.random.default_rng(0)
+    market = rng.normal(0, 0.01, 500)
+    returns = pd.DataFrame({
+        "AAA": 1.5 * market + rng.normal(0, 0.005, 500),
+        "BBB": -0.5 * market + rng.normal(0, 0.01, 500),
+        "SPY": market,
+    })
+    metrics = compute_risk_metrics(returns.to_numpy(), np.array([0.5, 0.5]))
+
+    cov = returns.cov()
+    assert metrics["beta"][0] == pytest.approx(cov.loc["AAA", "SPY"] / cov.loc["SPY", "SPY"])
+    assert metrics["beta"][-1] == pytest.approx(1.0)
+    assert metrics["correlation"] == pytest.approx(returns.corr().to_numpy())
+    assert metrics["volatility"] == pytest.approx(returns.std().to_numpy() * np.sqrt(252))
+    assert metrics["var"][0] == pytest.approx(-returns["AAA"].quantile(0.05))
+    portfolio = returns[["AAA", "BBB"]].mean(axis=1)
+    assert metrics["portfolio_volatility"] == pytest.approx(portfolio.std() * np.sqrt(252))
+
+
+@pytest.mark.asyncio
+async def test_market_hub_polls_all_symbols_in_one_batch():
+    """All watched symbols share one fetch per tick; clients receive a snapshot, then only changed fields."""
+    polls = []
+
+    def fake_fetch(symbols):
+        polls.append(symbols)
+        return {symbol: {"date": "2024-01-02", "close": 100.0 + min(len(polls), 2), "volume": 10} for symbol in symbols}
+
+    hub = MarketHub(poll_seconds=0.01, fetch=fake_fetch)
+    first, second, third = hub.new_queue(), hub.new_queue(), hub.new_queue()
+    hub.subscribe("aapl", first)
+    hub.subscribe("AAPL", second)
+    hub.subscribe("MSFT", third)
+
+    snapshot = await asyncio.wait_for(first.get(), timeout=1)
+    delta = await asyncio.wait_for(first.get(), timeout=1)
+    assert snapshot == {"type": "snapshot", "symbol": "AAPL", "data": {"date": "2024-01-02", "close": 101.0, "volume": 10}}
+    assert delta == {"type": "delta", "symbol": "AAPL", "data": {"close": 102.0}}
+    assert await asyncio.wait_for(second.get(), timeout=1) == snapshot
+    assert (await asyncio.wait_for(third.get(), timeout=1))["symbol"] == "MSFT"
+    assert polls[0] == ["AAPL", "MSFT"] and hub.stats["polls"] == len(polls)
+
+    hub.unsubscribe_all(first)
+    assert hub.subscriber_count("AAPL") == 1
+    hub.unsubscribe_all(second)
+    hub.unsubscribe_all(third)
+    assert hub._poller is None
+    await hub.close()
+
+
+def test_live_market_endpoints_reject_invalid_and_excess_symbols(monkeypatch):
+    """Invalid symbols and subscriptions past the per-connection cap never reach the hub."""
+    from stock_data_fetching.main import market_hub, settings
+    monkeypatch.setattr(symbol_filter, "current_symbol_index", lambda: None)
+    monkeypatch.setattr(market_hub, "fetch", lambda symbols: {})
+    monkeypatch.setattr(settings, "MARKET_HUB_MAX_SUBSCRIPTIONS", 2)
+
+    with client.websocket_connect("/ws/market") as websocket:
+        websocket.send_json({"action": "subscribe", "symbols": ["BAD!", "aapl", "MSFT", "NVDA"]})
+        assert websocket.receive_json() == {"type": "error", "symbol": "BAD!", "detail": "not a valid ticker format"}
+        assert websocket.receive_json() == {"type": "error", "symbol": "NVDA", "detail": "at most 2 symbols per connection"}
+        assert market_hub.subscriber_count("AAPL") == 1 and market_hub.subscriber_count("NVDA") == 0
+    assert market_hub.subscriber_count("AAPL") == 0
+
+    assert client.get("/stream/market?symbols=AAPL,bad!").status_code == 400
+    assert client.get("/stream/market?symbols=AAPL,MSFT,NVDA").status_code == 400
+
+
+def test_as_of_sections_only_use_data_known_on_the_date(tmp_path, monkeypatch):
+    """Earnings reported and news published after the date are ignored, and results are memoized."""
+    monkeypatch.setattr(as_of.settings, "PRICE_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(as_of, "_memo", as_of.OrderedDict())
+    dates = pd.date_range("2024-01-01", periods=200).date
+    closes = np.linspace(100, 120, 200)
+    history = pd.DataFrame({"date": dates, "open": closes, "high": closes + 1, "low": closes - 1,
+                            "close": closes, "adjusted_close": closes, "volume": 1000})
+    monkeypatch.setattr(as_of, "get_price_history", lambda symbol: history.copy() if symbol == "AAPL" else pd.DataFrame())
+
+    documents = {
+        "EARNINGS": {"quarterlyEarnings": [
+            {"fiscalDateEnding": "2024-06-30", "reportedDate": "2024-08-01", "reportedEPS": "2.5", "estimatedEPS": "2.4"},
+            {"fiscalDateEnding": "2024-03-31", "reportedDate": "2024-05-02", "reportedEPS": "2.0", "estimatedEPS": "1.9"},
+            {"fiscalDateEnding": "2023-12-31", "reportedDate": "2024-02-01", "reportedEPS": "1.0"},
+            {"fiscalDateEnding": "2023-09-30", "reportedDate": "2023-11-02", "reportedEPS": "1.0"},
+            {"fiscalDateEnding": "2023-06-30", "reportedDate": "2023-08-03", "reportedEPS": "1.0"},
+            {"fiscalDateEnding": "2023-03-31", "reportedDate": "2023-05-04", "reportedEPS": "1.0"},
+        ]},
+        "BALANCE_SHEET": {"quarterlyReports": []},
+        "DIVIDENDS": {"data": [
+            {"ex_dividend_date": "2024-05-10", "amount": "0.5"},
+            {"ex_dividend_date": "2024-02-09", "amount": "0.25"},
+            {"ex_dividend_date": "2023-11-10", "amount": "0.25"},
+            {"ex_dividend_date": "2023-02-10", "amount": "0.25"},
+        ]},
+    }
+    news = {"feed": [
+        {"title": "before", "url": "a", "time_published": "20240325T090000", "overall_sentiment_label": "positive"},
+        {"title": "after", "url": "b", "time_published": "20240402T090000", "overall_sentiment_label": "negative"},
+    ]}
+    calls = []
+
+    def fake_get(url, timeout=None):
+        calls.append(url)
+        function = url.split("function=")[1].split("&")[0]
+        return MagicMock(json=MagicMock(return_value=news if function == "NEWS_SENTIMENT" else documents[function]))
+
+    monkeypatch.setattr(as_of.requests, "get", fake_get)
+    day = pd.Timestamp("2024-03-31").date()
+    sections = as_of.as_of_sections("aapl", day, ["fundamentals", "news_sentiment", "volume_features_ext"])
+
+    fundamentals = sections["fundamentals"]
+    close = history.loc[history["date"] == day, "close"].iloc[0]
+    assert set(fundamentals) == {"market_cap", "pe_ratio", "dividend_yield", "beta", "next_earnings_date", "next_earnings_estimate"}
+    assert (fundamentals["next_earnings_date"], fundamentals["next_earnings_estimate"]) == ("2024-05-02", 1.9)
+    assert fundamentals["pe_ratio"] == pytest.approx(close / 4.0)
+    assert fundamentals["dividend_yield"] == pytest.approx(0.5 / close)
+    assert [h["title"] for h in sections["news_sentiment"]["headlines"]] == ["before"]
+    assert set(sections["volume_features_ext"]) == {"cmf", "adl"}
+
+    calls.clear()
+    assert as_of.as_of_sections("AAPL", day, ["fundamentals"])["fundamentals"] == fundamentals
+    assert calls == []
+    with pytest.raises(as_of.AsOfDataMissing):
+        as_of.as_of_sections("AAPL", pd.Timestamp("2030-01-01").date(), ["fundamentals"])
+
+
+def test_stored_news_downloads_a_window_once_under_concurrency(tmp_path, monkeypatch):
+    """Concurrent requests for one symbol's news share a single download and both see its articles."""
+    monkeypatch.setattr(as_of.settings, "PRICE_STORE_DIR", str(tmp_path))
+    calls = []
+
+    def slow_get(url, timeout=None):
+        calls.append(url)
+        time.sleep(0.05)
+        return MagicMock(json=MagicMock(return_value={"feed": [{"title": "t", "url": "a", "time_published": "20240105T090000"}]}))
+
+    monkeypatch.setattr(as_of.requests, "get", slow_get)
+    start, end = datetime(2024, 1, 1), datetime(2024, 1, 8)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: as_of.stored_news("aapl", start, end), range(4)))
+    assert len(calls) == 1
+    assert all([item["url"] for item in result] == ["a"] for result in results)
+
+
+@patch('stock_data_fetching.price_providers.fetch_price_data')
+def test_unknown_symbols_rejected_without_upstream_call(mock_fetch_price, monkeypatch):
+    """Junk, recently-unknown and unlisted tickers get a 404 before the price provider is asked."""
+    monkeypatch.setattr(symbol_filter, "negative_cache", symbol_filter.NegativeCache(ttl=60))
+    index = SymbolIndex(parse_listing("symbol,name,exchange,assetType\nAAPL,Apple Inc,NASDAQ,Stock\n"))
+    monkeypatch.setattr(symbol_filter, "current_symbol_index", lambda: index)
+
+    symbol_filter.record_unknown_symbol("aapx")
+    assert symbol_filter.rejection_reason("AAPX") == "recently reported unknown by the data provider"
+    assert symbol_filter.rejection_reason("$$$") == "not a valid ticker format"
+    assert symbol_filter.rejection_reason("MSFTT") == "not in the symbol listing"
+    assert symbol_filter.rejection_reason("SHOP.TRT") is None
+    assert symbol_filter.rejection_reason("aapl") is None
+
+    for symbol in ("AAPX", "MSFTT"):
+        response = client.post("/fetch", json={"symbol": symbol, "timeframe": "daily"})
+        assert response.status_code == 404
+    mock_fetch_price.assert_not_called()
+
+    expired = symbol_filter.NegativeCache(ttl=-1)
+    expired.add("AAPX")
+    assert "AAPX" not in expired
+
+
+def test_ingest_cleans_merges_and_resumes(tmp_path, monkeypatch):
+    """Bad rows are dropped, stored dates win over the import, and unchanged files are skipped on re-run."""
+    monkeypatch.setattr(ingest.settings, "PRICE_STORE_DIR", str(tmp_path / "store"))
+    price_store.merge_history("AAPL", pd.DataFrame({
+        "date": ["2020-01-03"], "open": [1.0], "high": [1.0], "low": [1.0], "close": [1.0], "volume": [5],
+    }))
+    source = tmp_path / "stocks"
+    source.mkdir()
+    (source / "aapl.csv").write_text(
+        "Date,Open,High,Low,Close,Adj Close,Volume\n"
+        "2020-01-02,10,11,9,10.5,10.4,100\n"
+        "2020-01-03,10,11,9,10.5,10.4,100\n"
+        "2020-01-06,10,9,11,10.5,10.4,100\n"
+        "2020-01-07,-1,11,9,10.5,10.4,100\n"
+        "2020-01-08,10,11,9,,10.4,100\n"
+        "2020-01-09,10,11,9,10,9.9,100\n"
+        "2020-01-09,10,11,9,10.2,10.1,200\n"
+    )
+
+    manifest = ingest.ingest_directory([str(source)], workers=1)
+    entry = manifest["files"][str(source / "aapl.csv")]
+    assert (entry["rows"], entry["added"], entry["dropped"]) == (3, 2, 4)
+    history = price_store.load_history("AAPL")
+    assert [d.isoformat() for d in history["date"]] == ["2020-01-02", "2020-01-03", "2020-01-09"]
+    assert history.loc[1, "close"] == 1.0
+    assert history.loc[2, "volume"] == 200
+
+    monkeypatch.setattr(ingest, "ingest_file", MagicMock(side_effect=AssertionError("re-ingested")))
+    assert ingest.ingest_directory([str(source)], workers=1)["files"] == manifest["files"]
+
+
+@pytest.mark.asyncio
+async def test_prefetcher_warms_co_accessed_symbols_when_idle():
+    """After A -> B is seen, a request for A queues B, which an idle warm-up fills and a real request hits."""
+    model = AccessModel(half_life=3600, session_seconds=300)
+    model.record("alice", "AAPL", now=0)
+    model.record("alice", "MSFT", now=10)
+    model.record("bob", "AAPL", now=20)
+    model.record("bob", "NVDA", now=1000)
+    assert model.likely_next("AAPL", now=1000) == ["MSFT"]
+    assert model.hottest(1, now=1000) == ["AAPL"]
+
+    cache = FetchCache(ttl=60)
+    built = []
+    prefetcher = Prefetcher(cache, model, build=lambda symbol, selection: built.append(symbol) or {"fundamentals": {}},
+                            per_minute=1, idle_seconds=0)
+    selection = {"fundamentals": None}
+    prefetcher.observe("carol", "AAPL", selection)
+    assert await prefetcher.warm_once()
+    assert built == ["MSFT"]
+    assert not await prefetcher.warm_once()  # per-minute budget spent
+
+    assert cache.get(selection_key("msft", selection)) == {"fundamentals": {}}
+    assert cache.get(selection_key("TSLA", selection)) is None
+    stats = prefetcher.summary()
+    assert (stats["prefetched"], stats["speculative_hits"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+@pytest.mark.asyncio
+async def test_prefetcher_charges_upstream_calls_and_skips_cold_symbols():
+    """Budgets count Alpha Vantage calls per minute and per day; the popularity fallback uses each symbol's own fields."""
+    assert upstream_calls(parse_fields(None)) == 15
+    assert upstream_calls({"technical_indicators": {"sma_5"}}) == 1
+    assert upstream_calls({"technical_indicators_ext": {"adx", "cci"}}) == 2
+
+    built = []
+    prefetcher = Prefetcher(FetchCache(ttl=60), AccessModel(half_life=3600, session_seconds=300),
+                            build=lambda symbol, selection: built.append((symbol, selection)) or {},
+                            per_minute=4, per_day=5, min_score=1.5, idle_seconds=0)
+    extended = {"extended_fundamentals": None}
+    prefetcher.observe("alice", "AAPL", {"news_sentiment": None})
+    prefetcher.observe("alice", "NVDA", {"news_sentiment": None})
+    prefetcher.observe("bob", "AAPL", extended)
+    assert prefetcher.model.hottest(min_score=1.5) == ["AAPL"]
+
+    assert await prefetcher.warm_once()
+    assert built == [("NVDA", extended)]
+    # AAPL is hot enough, but its three calls don't fit in the minute's remaining budget
+    assert not await prefetcher.warm_once()
+    assert prefetcher.summary()["calls_spent_today"] == 3 and prefetcher.summary()["queued"] == 1
+    prefetcher._spent = [(t - 61, calls) for t, calls in prefetcher._spent]
+    assert not await prefetcher.warm_once()  # the daily budget is still short
+    assert built == [("NVDA", extended)]
+
+
+def test_earnings_calendar_downloads_once_and_serves_every_symbol(tmp_path, monkeypatch):
+    """One calendar download answers lookups for all symbols; past reports and unknown symbols give None."""
+    today = datetime.utcnow().date()
+    csv = (
+        "symbol,name,reportDate,fiscalDateEnding,estimate,currency\n"
+        f"AAPL,Apple Inc,{today + timedelta(days=30)},2024-12-31,2.35,USD\n"
+        f"AAPL,Apple Inc,{today + timedelta(days=120)},2025-03-31,,USD\n"
+        f"MSFT,Microsoft,{today - timedelta(days=1)},2024-09-30,3.10,USD\n"
+    )
+    calendar = EarningsCalendar(str(tmp_path / "earnings_calendar.csv"))
+    download = MagicMock(return_value=csv)
+    monkeypatch.setattr(calendar, "_download", download)
+
+    assert calendar.next_earnings("aapl") == {
+        "name": "Apple Inc", "reportDate": (today + timedelta(days=30)).isoformat(),
+        "fiscalDateEnding": "2024-12-31", "estimate": "2.35", "currency": "USD",
+    }
+    assert calendar.next_earnings("MSFT") is None
+    assert calendar.next_earnings("NVDA") is None
+    assert download.call_count == 1
+
+    # A restart the same day reuses the stored copy
+    restarted = EarningsCalendar(str(tmp_path / "earnings_calendar.csv"))
+    monkeypatch.setattr(restarted, "_download", MagicMock(side_effect=AssertionError("downloaded again")))
+    assert restarted.next_earnings("AAPL")["estimate"] == "2.35"
+
+
+def test_bulk_quotes_batch_symbols_and_update_indicators_incrementally(tmp_path, monkeypatch):
+    """150 symbols cost two upstream calls, and incremental indicators match a full recomputation."""
+    monkeypatch.setattr(price_store.settings, "PRICE_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(bulk_quotes, "_states", {})
+    monkeypatch.setattr(price_store, "_provisional", {})
+    dates = pd.bdate_range("2024-01-01", periods=40).date
+    closes = 100 + np.sin(np.arange(40)) * 5
+    price_store.save_history("AAPL", pd.DataFrame({
+        "date": dates, "open": closes, "high": closes + 1, "low": closes - 1,
+        "close": closes, "adjusted_close": closes, "volume": 1000,
+    }))
+    quote_day = pd.Timestamp(dates[-1]) + pd.offsets.BDay(1)
+    prices = iter([104.0, 106.5])
+
+    def fake_get(url, timeout=None):
+        symbols = url.split("symbol=")[1].split("&")[0].split(",")
+        assert len(symbols) <= bulk_quotes.BULK_QUOTE_LIMIT
+        data = [{"symbol": "AAPL", "timestamp": f"{quote_day.date()} 15:30:00.000", "open": "101", "high": "107",
+                 "low": "100", "close": str(next(prices)), "volume": "5000", "previous_close": str(closes[-1])}
+                ] if "AAPL" in symbols else []
+        return MagicMock(json=MagicMock(return_value={"data": data}))
+
+    monkeypatch.setattr(bulk_quotes.requests, "get", MagicMock(side_effect=fake_get))
+    symbols = ["AAPL"] + [f"T{i}" for i in range(149)]
+    quotes, missing = bulk_quotes.refresh_quotes(symbols, api_key="demo")
+    assert bulk_quotes.requests.get.call_count == 2
+    assert missing == symbols[1:]
+    state = bulk_quotes._states["AAPL"]
+
+    quotes, _ = bulk_quotes.refresh_quotes(["AAPL"], api_key="demo")
+    assert bulk_quotes._states["AAPL"] is state
+    assert len(price_store.load_history("AAPL")) == 40
+    history = price_store.with_provisional("AAPL", price_store.load_history("AAPL"))
+    assert len(history) == 41 and history["close"].iloc[-1] == 106.5
+    window = history.tail(bulk_quotes.INDICATOR_WINDOW).reset_index(drop=True)
+    expected = add_technical_indicators(window.copy()).iloc[-1]
+    snapshot = quotes["AAPL"]
+    for name in ("sma_5", "ema_5", "macd", "macd_signal", "macd_hist"):
+        assert snapshot[name] == pytest.approx(float(expected[name]))
+    std = window["close"].tail(5).std(ddof=0)
+    assert snapshot["bb_upper"] == pytest.approx(expected["sma_5"] + 2 * std)
+    assert snapshot["previous_close"] == pytest.approx(closes[-1])
+
+
+def test_bulk_quotes_need_the_previous_session_for_indicators(tmp_path, monkeypatch):
+    """A history that stops short of the previous session is topped up first, else no indicators; alerts run on every quote."""
+    monkeypatch.setattr(price_store.settings, "PRICE_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(bulk_quotes, "_states", {})
+    monkeypatch.setattr(price_store, "_provisional", {})
+    monkeypatch.setattr(price_store, "_last_refresh", {})
+    dates = pd.bdate_range("2024-01-01", periods=40).date
+    closes = np.linspace(100, 110, 40)
+    bars = pd.DataFrame({"date": dates, "open": closes, "high": closes + 1, "low": closes - 1,
+                         "close": closes, "adjusted_close": closes, "volume": 1000})
+    for symbol in ("AAPL", "MSFT"):
+        price_store.save_history(symbol, bars.iloc[:-1])
+    quote_day = pd.Timestamp(dates[-1]) + pd.offsets.BDay(1)
+    data = [{"symbol": symbol, "timestamp": f"{quote_day.date()} 15:30:00.000", "open": "111", "high": "113",
+             "low": "110", "close": "112", "volume": "5000", "previous_close": "110"} for symbol in ("AAPL", "MSFT")]
+    monkeypatch.setattr(bulk_quotes.requests, "get", MagicMock(return_value=MagicMock(json=MagicMock(return_value={"data": data}))))
+    provider = MagicMock(fetch=MagicMock(side_effect=lambda symbol, **kwargs: bars.tail(5) if symbol == "AAPL" else pd.DataFrame()))
+    monkeypatch.setattr(price_store, "get_price_provider", lambda: provider)
+
+    quotes, missing = bulk_quotes.refresh_quotes(["AAPL", "MSFT"], api_key="demo")
+    assert provider.fetch.call_count == 2 and missing == []
+    assert bulk_quotes._states["AAPL"].base_date == dates[-1] and "sma_5" in quotes["AAPL"]
+    assert quotes["MSFT"] == {"latest_close": 112.0, "previous_close": 110.0}
+    assert price_store.get_price_history("AAPL")["close"].iloc[-1] == 112.0
+
+    engine = MagicMock()
+    monkeypatch.setattr(symbol_filter, "current_symbol_index", lambda: None)
+    monkeypatch.setattr("stock_data_fetching.main.refresh_quotes", lambda symbols: (quotes, []))
+    monkeypatch.setattr("stock_data_fetching.main.get_alert_engine", lambda: engine)
+    assert client.post("/quotes/refresh", json={"symbols": ["AAPL", "MSFT"]}).status_code == 200
+    evaluated = {call.args[0]: call.args[1] for call in engine.evaluate.call_args_list}
+    assert evaluated["MSFT"] == {"latest_close": 112.0, "previous_close": 110.0}
+    assert evaluated["AAPL"]["sma_5"] == pytest.approx(quotes["AAPL"]["sma_5"])
+
+
+def test_live_bars_stay_provisional_until_the_final_bar_is_stored(tmp_path, monkeypatch):
+    """Quote bars are served on top of the store but never saved, and dated snapshots built on them aren't memoized."""
+    monkeypatch.setattr(price_store.settings, "PRICE_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(price_store, "_provisional", {})
+    monkeypatch.setattr(price_store, "_last_refresh", {})
+    monkeypatch.setattr(as_of, "_memo", as_of.OrderedDict())
+    monkeypatch.setattr(price_store, "get_price_provider", lambda: MagicMock(fetch=MagicMock(return_value=pd.DataFrame())))
+    session = price_store._latest_session()
+    dates = pd.bdate_range(end=session, periods=40).date
+    closes = np.linspace(100, 110, 40)
+    bars = pd.DataFrame({"date": dates, "open": closes, "high": closes + 1, "low": closes - 1,
+                         "close": closes, "adjusted_close": closes, "volume": 1000})
+    price_store.save_history("AAPL", bars.iloc[:-1])
+
+    price_store.set_provisional_bar("AAPL", bars.iloc[-1].to_dict() | {"close": 50.0})
+    assert price_store.load_history("AAPL")["date"].max() == dates[-2]
+    assert price_store.get_price_history("AAPL")["close"].iloc[-1] == 50.0
+    assert as_of.as_of_sections("AAPL", session, ["technical_indicators"])["technical_indicators"]["latest_close"] == 50.0
+    assert len(as_of._memo) == 0
+
+    today = bars.iloc[[-1]].assign(date=datetime.utcnow().date(), close=60.0)
+    history = price_store.merge_session_bars("AAPL", pd.concat([bars.iloc[[-1]], today]))
+    assert price_store.load_history("AAPL")["date"].max() == session
+    assert history["close"].iloc[-1] == 60.0 and price_store.provisional_session("AAPL") == today["date"].iloc[0]
+    assert as_of.as_of_sections("AAPL", session, ["technical_indicators"])["technical_indicators"]["latest_close"] == closes[-1]
+    assert len(as_of._memo) == 1
+
+
+def test_news_batch_splits_shared_feed_and_falls_back_per_symbol(monkeypatch):
+    """Covered symbols come out of the one market feed, walked back in slices of the article limit; a thinly
+    covered symbol costs one extra call, and the feed is dropped once it would cost more than per-symbol calls."""
+    monkeypatch.setattr(news_batch, "_feed_cache", {})
+    monkeypatch.setattr(news_batch, "_results", {})
+    monkeypatch.setattr(news_batch, "_slice_seconds", {})
+    monkeypatch.setattr(news_batch.settings, "NEWS_BATCH_MIN_ARTICLES", 1)
+    monkeypatch.setattr(news_batch.settings, "NEWS_BATCH_FEED_LIMIT", 3)
+    now = datetime.utcnow()
+
+    def article(title, label, hours_ago, *tickers):
+        return {"title": title, "time_published": (now - timedelta(hours=hours_ago)).strftime("%Y%m%dT%H%M%S"),
+                "overall_sentiment_label": label,
+                "ticker_sentiment": [{"ticker": t, "relevance_score": "0.5", "ticker_sentiment_score": "0.4"} for t in tickers]}
+
+    # One three-article slice spans about 60 hours, so the 7-day window takes three calls (time_to is
+    # inclusive, so each slice repeats the previous one's oldest article)
+    market = [article("chips", "Bullish", 1, "NVDA", "AAPL"), article("cloud", "Bearish", 50, "MSFT"),
+              article("rates", "Neutral", 60), article("autos", "Neutral", 100), article("phones", "Bullish", 120, "AAPL"),
+              article("oil", "Neutral", 165)]
+    urls = []
+
+    def fake_get(url, timeout=None):
+        urls.append(url)
+        params = dict(part.split("=", 1) for part in url.split("&")[1:])
+        if "tickers" in params:
+            feed = [a for a in market + [article("cars", "Neutral", 2, "TSLA")]
+                    if params["tickers"] in [t["ticker"] for t in a["ticker_sentiment"]]]
+        else:
+            feed = [a for a in market if params["time_from"] + "00" <= a["time_published"] <= params.get("time_to", "9") + "59"]
+        return MagicMock(json=MagicMock(return_value={"feed": feed[:int(params["limit"])]}))
+
+    monkeypatch.setattr(news_batch.requests, "get", fake_get)
+    results, calls = news_batch.batch_news_sentiment(["aapl", "MSFT", "TSLA", "IBM", "AMD"], api_key="demo")
+
+    # Three feed slices instead of five per-symbol calls, plus TSLA, IBM and AMD on their own
+    feed_urls = [url for url in urls if "tickers=" not in url]
+    assert len(feed_urls) == 3 and "time_to=" not in feed_urls[0] and "time_to=" in feed_urls[2]
+    assert calls == 6 and len(urls) == 6
+    assert [h["title"] for h in results["AAPL"]["news_sentiment"]["headlines"]] == ["chips", "phones"]
+    assert [h["title"] for h in results["MSFT"]["news_sentiment"]["headlines"]] == ["cloud"]
+    assert results["TSLA"]["advanced_news_sentiment"]["avg_sentiment_7d"] == pytest.approx(0.4)
+    assert news_batch.batch_news_sentiment(["AAPL", "TSLA"], api_key="demo")[1] == 0
+    assert news_batch.cached_news("msft") == results["MSFT"]
+
+    # Two symbols can't pay for a feed that needs several slices: the walk stops after the first one
+    monkeypatch.setattr(news_batch, "_feed_cache", {})
+    monkeypatch.setattr(news_batch, "_results", {})
+    monkeypatch.setattr(news_batch, "_slice_seconds", {})
+    urls.clear()
+    results, calls = news_batch.batch_news_sentiment(["AAPL", "MSFT"], api_key="demo")
+    assert calls == 3 and len(urls) == 3 and [url for url in urls if "tickers=" in url] == urls[1:]
+    assert [h["title"] for h in results["AAPL"]["news_sentiment"]["headlines"]] == ["chips", "phones"]
+
+    # Once the slice span is known, the feed isn't tried at all
+    monkeypatch.setattr(news_batch, "_results", {})
+    urls.clear()
+    results, calls = news_batch.batch_news_sentiment(["AAPL", "MSFT"], api_key="demo")
+    assert calls == 2 and all("tickers=" in url for url in urls)
+
+
+def test_fetch_batch_shares_news_and_isolates_symbol_errors(monkeypatch):
+    """One batched news pass for uncached symbols; a failing symbol is reported without failing the batch."""
+    import stock_data_fetching.main as main_module
+    from fastapi import HTTPException
+
+    news_calls = []
+    built = []
+
+    def fake_news(symbols):
+        news_calls.append(list(symbols))
+        return {}, 1
+
+    def fake_build(symbol, selection):
+        built.append(symbol)
+        if symbol == "ZZZZ":
+            raise HTTPException(status_code=404, detail="No price data for ZZZZ")
+        return {"technical_indicators": {"latest_close": 100.0 + len(symbol)}, "news_sentiment": {"sentiment_score": float("nan")}}
+
+    monkeypatch.setattr(main_module, "batch_news_sentiment", fake_news)
+    monkeypatch.setattr(main_module, "build_live_sections", fake_build)
+    fields = ["technical_indicators", "news_sentiment"]
+    fetch_cache.put(selection_key("MSFT", parse_fields(fields)), {"technical_indicators": {"latest_close": 1.0}, "news_sentiment": {}})
+    before = dict(fetch_cache.stats)
+
+    response = client.post("/fetch/batch", json={"symbols": ["aapl", "MSFT", "ZZZZ", "bad!"], "fields": fields})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert news_calls == [["AAPL", "ZZZZ"]]
+    assert sorted(built) == ["AAPL", "ZZZZ"]
+    assert data["results"]["AAPL"]["technical_indicators"] == {"latest_close": 104.0}
+    assert data["results"]["AAPL"]["news_sentiment"] == {"sentiment_score": None}
+    assert data["results"]["MSFT"]["technical_indicators"] == {"latest_close": 1.0}
+    assert data["errors"] == {"ZZZZ": "No price data for ZZZZ", "BAD!": "not a valid ticker format"}
+    # One cache lookup per symbol: the scan for news doesn't count as a hit or miss
+    assert fetch_cache.stats["hits"] - before["hits"] == 1 and fetch_cache.stats["misses"] - before["misses"] == 2
+
+
+def test_fetch_reports_nan_sections_as_null(monkeypatch):
+    """advanced_news_sentiment without articles holds NaN; /fetch answers with nulls instead of a 500."""
+    import stock_data_fetching.main as main_module
+
+    monkeypatch.setattr(symbol_filter, "current_symbol_index", lambda: None)
+    monkeypatch.setattr(main_module, "build_live_sections", lambda symbol, selection: {
+        "advanced_news_sentiment": {"avg_sentiment_7d": float("nan"), "sentiment_momentum": float("nan")},
+    })
+    response = client.post("/fetch", json={"symbol": "NANX", "timeframe": "daily", "fields": ["advanced_news_sentiment"]})
+    assert response.status_code == 200
+    assert response.json()["advanced_news_sentiment"]["avg_sentiment_7d"] is None
+
+
+def test_history_leaves_indicator_warmup_null(monkeypatch):
+    """Bars before an indicator has enough history are null in /history, not back-filled from later bars."""
+    import stock_data_fetching.main as main_module
+
+    dates = pd.bdate_range("2024-01-01", periods=30).date
+    closes = np.linspace(100, 129, 30)
+    history = pd.DataFrame({"date": dates, "open": closes, "high": closes + 1, "low": closes - 1,
+                            "close": closes, "adjusted_close": closes, "volume": 1000})
+    monkeypatch.setattr(symbol_filter, "current_symbol_index", lambda: None)
+    monkeypatch.setattr(main_module, "get_price_history", lambda symbol: history.copy())
+
+    response = client.post("/history", json={"symbol": "AAPL", "points": None})
+    assert response.status_code == 200
+    sma = response.json()["columns"]["sma_5"]
+    assert sma[:4] == [None] * 4 and sma[4] == pytest.approx(closes[:5].mean())
+
+def test_feature_dataset_drops_indicator_warmup_without_backfill(tmp_path, monkeypatch):
+    """Warm-up rows stay empty instead of being back-filled from later sessions; chunked writes cover every row."""
+    from stock_data_fetching import dataset_builder
+
+    monkeypatch.setattr(price_store.settings, "PRICE_STORE_DIR", str(tmp_path / "store"))
+    closes = [10.0, 11.0, 12.0, 13.0, 14.0, 20.0, 21.0, 22.0]
+    price_store.merge_history("AAPL", pd.DataFrame({
+        "date": pd.bdate_range("2024-01-01", periods=len(closes)).date,
+        "open": closes, "high": closes, "low": closes, "close": closes, "volume": [100] * len(closes),
+    }))
+
+    manifest = dataset_builder.build_feature_dataset(["AAPL"], str(tmp_path / "dataset"), workers=1, chunk_rows=3)
+    dates, columns, matrices = dataset_builder.open_feature_dataset(str(tmp_path / "dataset"))
+    matrix = matrices["AAPL"]
+    sma = matrix[:, columns.index("sma_5")]
+
+    assert manifest["symbols"]["AAPL"]["rows"] == len(closes) - 4
+    assert np.isnan(matrix[:4]).all()
+    assert sma[4] == pytest.approx(np.mean(closes[:5]))
+    assert matrix[-1, columns.index("close")] == 22.0